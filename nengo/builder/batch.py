@@ -0,0 +1,237 @@
+"""Simulating several trials of a model at once.
+
+``BatchSignalDict`` stores every signal with an additional leading axis
+that indexes the trial. Operators whose computation is elementwise, or
+which can be expressed as a batched matrix product, are simulated on all
+trials at once. All other operators are simulated separately for each
+trial, on a ``SignalDict`` of views into the batched arrays, with a
+separate random number generator for each trial.
+"""
+
+import numpy as np
+
+import nengo.utils.numpy as npext
+from nengo.builder.neurons import SimNeurons
+from nengo.builder.operator import (
+    Copy, DotInc, ElementwiseInc, OuterInc, PreserveValue, Reset,
+    reshape_dot)
+from nengo.builder.signal import SignalDict
+from nengo.builder.synapses import SimSynapse
+from nengo.neurons import (AdaptiveLIF, AdaptiveLIFRate, Izhikevich, LIF,
+                           LIFRate, RectifiedLinear, Sigmoid)
+from nengo.synapses import Alpha, LinearFilter, Lowpass
+from nengo.utils.compat import is_string
+
+
+class BatchSignalDict(SignalDict):
+    """Map from Signal -> ndarray with a leading trial axis.
+
+    Read-only signals have the same value in all trials, so they are stored
+    only once and broadcast along the trial axis.
+    """
+
+    def __init__(self, n_trials, *args, **kwargs):
+        super(BatchSignalDict, self).__init__(*args, **kwargs)
+        self.n_trials = n_trials
+        self._trials = {}
+        self._trial_values = {}
+
+    def __getitem__(self, obj):
+        if obj in self:
+            return dict.__getitem__(self, obj)
+        elif obj.base in self:
+            base_array = self[obj.base]
+            flat = base_array.reshape(self.n_trials, -1)[:, obj.offset:]
+            strides = [flat.strides[0]] + [
+                base_array.itemsize * s for s in obj.elemstrides]
+            return np.lib.stride_tricks.as_strided(
+                flat, shape=(self.n_trials,) + obj.shape, strides=strides)
+        else:
+            raise KeyError("%s has not been initialized. Please call "
+                           "SignalDict.init first." % (str(obj)))
+
+    def init(self, signal):
+        """Set up a permanent mapping from signal -> batched ndarray."""
+        base = signal.base
+        shape = (self.n_trials,) + base.shape
+        if signal.readonly:
+            val = npext.array(
+                base.value, dtype=self.value_dtype(base), readonly=True)
+            val = np.lib.stride_tricks.as_strided(
+                val, shape=shape, strides=(0,) + val.strides)
+        else:
+            val = np.empty(shape, dtype=self.value_dtype(base))
+            val[...] = base.value
+        dict.__setitem__(self, base, val)
+        self._trials.clear()
+
+    def init_trials(self, signal, values):
+        """Set up ``signal`` with a different value in each trial."""
+        base = signal.base
+        val = np.empty((self.n_trials,) + base.shape,
+                       dtype=self.value_dtype(base))
+        val[...] = values
+        self._trial_values[base] = val.copy()
+        val.setflags(write=not signal.readonly)
+        dict.__setitem__(self, base, val)
+        self._trials.clear()
+
+    def reset(self, signal):
+        """Reset ndarray to the initial value of the signal in each trial"""
+        if signal in self._trial_values and not signal.readonly:
+            self[signal] = self._trial_values[signal]
+        else:
+            super(BatchSignalDict, self).reset(signal)
+
+    def init_arena(self, signals):
+        raise NotImplementedError(
+            "Arenas are not supported for batched signals")
+
+    def trial(self, i):
+        """A ``SignalDict`` of views of the signals of trial ``i``."""
+        if i not in self._trials:
+            signals = SignalDict()
+            for key, val in self.items():
+                dict.__setitem__(
+                    signals, key, val if is_string(key) else val[i])
+            self._trials[i] = signals
+        return self._trials[i]
+
+
+def batch_reshape(array, shape):
+    """Reshape ``array`` without copying, so that writes are preserved."""
+    view = array.view()
+    view.shape = shape  # raises an error if a copy would be necessary
+    return view
+
+
+def make_trial_step(ops, signals, dt, rngs):
+    """Simulate ``ops[i]`` on trial ``i`` of ``signals``, using ``rngs[i]``.
+
+    The operators must all act on the same signals; usually, they are either
+    the same operator, or copies of an operator that differ in some other
+    respect (e.g., the function computed by a ``SimPyFunc``).
+    """
+    steps = [op.make_step(signals.trial(i), dt, rng)
+             for i, (op, rng) in enumerate(zip(ops, rngs))]
+
+    def step():
+        for step_fn in steps:
+            step_fn()
+    return step
+
+
+def make_elementwise_step(op, signals, dt, rngs):
+    """Simulate an operator that is unaffected by the leading trial axis."""
+    return op.make_step(signals, dt, None)
+
+
+def make_elementwiseinc_step(op, signals, dt, rngs):
+    # validate the shapes for a single trial
+    op.make_step(signals.trial(0), dt, rngs[0])
+
+    def batch_view(sig):
+        return batch_reshape(signals[sig], (signals.n_trials,)
+                             + npext.broadcast_shape(sig.shape, 2))
+
+    A, X, Y = batch_view(op.A), batch_view(op.X), batch_view(op.Y)
+
+    def step():
+        Y[...] += A * X
+    return step
+
+
+def make_dotinc_step(op, signals, dt, rngs):
+    A = signals[op.A]
+    X = signals[op.X]
+    Y = signals[op.Y]
+    reshape_dot(A[0], X[0], Y[0], op.tag)
+
+    if op.A.ndim == 2 and op.X.ndim == 1 and op.Y.ndim == 1:
+        if A.strides[0] == 0:
+            # -- the same matrix for all trials
+            AT = A[0].T
+
+            def step():
+                Y[...] += np.dot(X, AT)
+        else:
+            def step():
+                Y[...] += np.einsum('ijk,ik->ij', A, X)
+        return step
+    elif op.A.ndim == 0 and op.X.shape == op.Y.shape:
+        A = batch_reshape(A, (signals.n_trials,) + (1,) * op.X.ndim)
+
+        def step():
+            Y[...] += A * X
+        return step
+    elif op.X.ndim == 0 and op.A.shape == op.Y.shape:
+        X = batch_reshape(X, (signals.n_trials,) + (1,) * op.A.ndim)
+
+        def step():
+            Y[...] += A * X
+        return step
+
+    return make_trial_step([op] * signals.n_trials, signals, dt, rngs)
+
+
+def make_outerinc_step(op, signals, dt, rngs):
+    if op.every != 1:
+        return make_trial_step([op] * signals.n_trials, signals, dt, rngs)
+
+    A = signals[op.A]
+    X = signals[op.X][:, :, None]
+    Y = signals[op.Y][:, None, :]
+
+    def step():
+        A[...] += X * Y
+    return step
+
+
+def make_simneurons_step(op, signals, dt, rngs):
+    if type(op.neurons) in batch_neurons:
+        return make_elementwise_step(op, signals, dt, rngs)
+    return make_trial_step([op] * signals.n_trials, signals, dt, rngs)
+
+
+def make_simsynapse_step(op, signals, dt, rngs):
+    if type(op.synapse) in batch_synapses:
+        return make_elementwise_step(op, signals, dt, rngs)
+    return make_trial_step([op] * signals.n_trials, signals, dt, rngs)
+
+
+# Neuron types and synapses whose step functions are purely elementwise,
+# and can therefore be applied to arrays with a leading trial axis
+batch_neurons = (AdaptiveLIF, AdaptiveLIFRate, Izhikevich, LIF, LIFRate,
+                 RectifiedLinear, Sigmoid)
+batch_synapses = (Alpha, LinearFilter, Lowpass)
+
+batch_steps = {
+    Copy: make_elementwise_step,
+    DotInc: make_dotinc_step,
+    ElementwiseInc: make_elementwiseinc_step,
+    OuterInc: make_outerinc_step,
+    PreserveValue: make_elementwise_step,
+    Reset: make_elementwise_step,
+    SimNeurons: make_simneurons_step,
+    SimSynapse: make_simsynapse_step,
+}
+
+
+def make_batch_step(op, signals, dt, rngs):
+    """Return a step function simulating ``op`` for all trials at once.
+
+    Parameters
+    ----------
+    op : Operator
+        The operator to simulate.
+    signals : BatchSignalDict
+        The batched signals.
+    dt : float
+        The simulation timestep.
+    rngs : list of RandomState
+        One random number generator for each trial.
+    """
+    make_step = batch_steps.get(type(op), None)
+    if make_step is None:
+        return make_trial_step([op] * signals.n_trials, signals, dt, rngs)
+    return make_step(op, signals, dt, rngs)
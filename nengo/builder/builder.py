@@ -3,22 +3,45 @@ import warnings
 
 import numpy as np
 
+from nengo.base import NengoObject
+from nengo.builder.serialize import read_model, write_model
 from nengo.builder.signal import SignalDict
 from nengo.cache import NoDecoderCache
+from nengo.connection import LearningRule
 
 
 class Model(object):
-    """Output of the Builder, used by the Simulator."""
+    """Output of the Builder, used by the Simulator.
 
-    def __init__(self, dt=0.001, label=None, decoder_cache=NoDecoderCache()):
+    The ``dtype`` (float64 by default, or float32) is the dtype of the
+    floating-point signals of the simulation. The builder computes the
+    initial values of signals (e.g., decoders) in float64, and they are
+    cast to ``dtype`` when the simulator allocates the signals.
+
+    If ``build_workers`` is greater than 1, the decoders of the connections
+    in the model are solved for on that many threads before the
+    connections are built (see ``nengo.builder.network.build_network``).
+    The built model is the same as with one worker.
+    """
+
+    def __init__(self, dt=0.001, label=None, decoder_cache=NoDecoderCache(),
+                 dtype=np.float64, build_workers=1):
         self.dt = dt
         self.label = label
         self.decoder_cache = decoder_cache
+        self.build_workers = build_workers
+        self.dtype = np.dtype(dtype)
+        if not np.issubdtype(self.dtype, np.floating):
+            raise ValueError("dtype must be a floating-point type (got '%s')"
+                             % self.dtype)
 
         # We want to keep track of the toplevel network
         self.toplevel = None
         # Builders can set a config object to affect sub-builders
         self.config = None
+        # Networks whose connections are built once all networks are
+        # (see ``build_network``), or None outside of a network build
+        self.pending_networks = None
 
         # Resources used by the build process.
         self.operators = []
@@ -26,6 +49,8 @@ class Model(object):
         self.seeds = {}
         self.probes = []
         self.sig = collections.defaultdict(dict)
+        # Maps each operator to the object whose build function added it
+        self.origins = {}
 
     def __str__(self):
         return "Model: %s" % self.label
@@ -36,7 +61,8 @@ class Model(object):
     def add_op(self, op):
         self.operators.append(op)
         # Fail fast by trying make_step with a temporary sigdict
-        signals = SignalDict(__time__=np.asarray(0.0, dtype=np.float64))
+        signals = SignalDict(__time__=np.asarray(0.0, dtype=np.float64),
+                             dtype=self.dtype)
         op.init_signals(signals)
         op.make_step(signals, self.dt, np.random)
 
@@ -44,6 +70,40 @@ class Model(object):
         """Returns true iff obj has been processed by build."""
         return obj in self.params
 
+    def save(self, filename):
+        """Save the built model to a file.
+
+        The model can be loaded with ``Model.load`` and simulated with
+        ``Simulator(None, model=model)``, without building it again.
+        See ``nengo.builder.serialize`` for details.
+        """
+        with open(filename, 'wb') as f:
+            write_model(f, self)
+
+    @classmethod
+    def load(cls, filename, network, decoder_cache=NoDecoderCache()):
+        """Load a model saved with ``save``.
+
+        Parameters
+        ----------
+        filename : str
+            The file the model was saved to.
+        network : Network
+            The network the model was built from. This has to be created
+            in the same way as the original network, and is checked against
+            a fingerprint of it. Since the objects of the loaded model are
+            the objects of this network, it can be used to access the
+            probed data of simulations (e.g., ``sim.data[probe]``).
+        decoder_cache : DecoderCache, optional
+            The decoder cache to use when building more objects into the
+            loaded model.
+        """
+        state = read_model(filename, network)
+        model = cls(dt=state['dt'], label=state['label'],
+                    decoder_cache=decoder_cache)
+        model.__dict__.update(state)
+        return model
+
 
 class Builder(object):
     builders = {}
@@ -71,4 +131,10 @@ class Builder(object):
         else:
             raise TypeError("Cannot build object of type '%s'." %
                             obj.__class__.__name__)
+        n_ops = len(model.operators)
         cls.builders[obj_cls](model, obj, *args, **kwargs)
+        if isinstance(obj, (NengoObject, LearningRule)):
+            # Neuron types and synapses are built for these objects, and
+            # objects built inside this one have already set their origin
+            for op in model.operators[n_ops:]:
+                model.origins.setdefault(op, obj)
@@ -1,4 +1,5 @@
 import collections
+import functools
 
 import numpy as np
 
@@ -6,32 +7,50 @@ import nengo.utils.numpy as npext
 from nengo.builder.builder import Builder
 from nengo.builder.ensemble import gen_eval_points
 from nengo.builder.node import build_pyfunc
-from nengo.builder.operator import DotInc, ElementwiseInc, PreserveValue, Reset
+from nengo.builder.operator import (
+    DotInc, ElementwiseInc, IndexedInc, PreserveValue, Reset, SparseDotInc)
+from nengo.builder.optimizer import neuron_type_key
 from nengo.builder.signal import Signal
 from nengo.builder.synapses import filtered_signal
+from nengo.cache import Fingerprint
 from nengo.connection import Connection
 from nengo.ensemble import Ensemble, Neurons
 from nengo.neurons import Direct
 from nengo.node import Node
-from nengo.utils.builder import full_transform
+from nengo.solvers import LstsqL2, LstsqL2nz, cholesky
+from nengo.utils.builder import elementwise_transform, full_transform
+from nengo.utils.compat import itervalues
 
 
+# The ``transform`` of a built connection is the value of its ``transform``
+# signal. For connections applied with an ``IndexedInc`` (see
+# ``indexed_transform``), this holds only the elementwise scales, not the
+# full, mostly zero matrix; ``nengo.utils.builder.full_transform`` gives
+# the full transform of any connection.
 BuiltConnection = collections.namedtuple(
     'BuiltConnection', ['decoders', 'eval_points', 'transform', 'solver_info'])
 
 
 def build_linear_system(model, conn, rng):
+    eval_points = build_eval_points(model, conn, rng)
+    activities = build_activities(model, conn, eval_points)
+    return eval_points, activities, build_targets(conn, eval_points)
+
+
+def build_eval_points(model, conn, rng):
+    """The evaluation points at which the decoders of ``conn`` are solved."""
+    if conn.eval_points is None:
+        return npext.array(model.params[conn.pre_obj].eval_points, min_dims=2)
+    return gen_eval_points(
+        conn.pre_obj, conn.eval_points, rng, conn.scale_eval_points)
+
+
+def build_activities(model, conn, eval_points):
+    """The rates of the neurons of ``conn.pre_obj`` at ``eval_points``."""
     encoders = model.params[conn.pre_obj].encoders
     gain = model.params[conn.pre_obj].gain
     bias = model.params[conn.pre_obj].bias
 
-    if conn.eval_points is None:
-        eval_points = npext.array(
-            model.params[conn.pre_obj].eval_points, min_dims=2)
-    else:
-        eval_points = gen_eval_points(
-            conn.pre_obj, conn.eval_points, rng, conn.scale_eval_points)
-
     x = np.dot(eval_points, encoders.T / conn.pre_obj.radius)
     activities = conn.pre_obj.neuron_type.rates(x, gain, bias)
     if np.count_nonzero(activities) == 0:
@@ -39,19 +58,326 @@ def build_linear_system(model, conn, rng):
             "Building %s: 'activites' matrix is all zero for %s. "
             "This is because no evaluation points fall in the firing "
             "ranges of any neurons." % (conn, conn.pre_obj))
+    return activities
+
 
+def build_targets(conn, eval_points):
+    """The values to be decoded by ``conn`` at ``eval_points``."""
     if conn.function is None:
-        targets = eval_points[:, conn.pre_slice]
+        return eval_points[:, conn.pre_slice]
+
+    targets = np.zeros((len(eval_points), conn.size_mid))
+    for i, ep in enumerate(eval_points[:, conn.pre_slice]):
+        targets[i] = conn.function(ep)
+    return targets
+
+
+def matrix_signal(matrix, name):
+    """A signal holding a dense matrix, or the stored elements of a CSR one.
+    """
+    if npext.is_spmatrix(matrix):
+        return Signal(matrix.data, name=name)
+    return Signal(matrix, name=name)
+
+
+def matrix_dot_inc(A, matrix, X, Y, tag=None):
+    """An operator incrementing Y by the product of a matrix and X.
+
+    ``A`` is the signal returned by ``matrix_signal(matrix)``.
+    """
+    if npext.is_spmatrix(matrix):
+        return SparseDotInc(A, X, Y, matrix.indices, matrix.indptr, tag=tag)
+    return DotInc(A, X, Y, tag=tag)
+
+
+def indexed_transform(conn):
+    """The transform of ``conn`` if it can be applied by indexing.
+
+    Returns the scale(s) by which the elements of the connection's output
+    are multiplied before being added to the post slice, or None if a
+    full transform is needed. The full transform is not needed for
+    elementwise transforms, unless they are applied without slicing (where
+    the full transform is the same), or they are changed by a learning rule
+    or combined with the weights computed by a weight solver.
+    """
+    if (conn.solver.weights or
+            conn.learning_rule_type and isinstance(conn.pre_obj, Neurons)):
+        return None
+    scale = elementwise_transform(conn)
+    if scale is None:
+        return None
+
+    post_slice = conn.post_slice
+    if isinstance(post_slice, slice):
+        if scale.ndim == 0 and post_slice == slice(None):
+            return None
     else:
-        targets = np.zeros((len(eval_points), conn.size_mid))
-        for i, ep in enumerate(eval_points[:, conn.pre_slice]):
-            targets[i] = conn.function(ep)
+        post_index = np.arange(conn.post_obj.size_in)[post_slice]
+        if np.unique(post_index).size != post_index.size:
+            return None  # -- repeated elements are summed by full transform
+    return scale
+
+
+def build_transform(model, conn, transform, signal, indexed=False):
+    """Add the operator applying ``transform`` to the output of ``conn``.
+
+    ``signal`` is the (filtered) signal of the connection. For connections
+    to neurons, the transform is scaled by the gains of the neurons. If
+    ``indexed``, ``transform`` holds the scales returned by
+    ``indexed_transform``, which are applied with an ``IndexedInc``.
+
+    Returns the transform, as stored in the ``transform`` signal.
+    """
+    if isinstance(conn.post_obj, Neurons):
+        if not model.has_built(conn.post_obj.ensemble):
+            # Since it hasn't been built, it wasn't added to the Network,
+            # which is most likely because the Neurons weren't associated
+            # with an Ensemble.
+            raise RuntimeError("Connection '%s' refers to Neurons '%s' "
+                               "that are not a part of any Ensemble." % (
+                                   conn, conn.post_obj))
 
-    return eval_points, activities, targets
+        if conn.post_slice != slice(None):
+            raise NotImplementedError(
+                "Post-slices on connections to neurons are not implemented")
+
+        gain = model.params[conn.post_obj.ensemble].gain[conn.post_slice]
+        if npext.is_spmatrix(transform):
+            transform.data *= gain[npext.csr_rows(transform.indptr)]
+        elif transform.ndim < 2:
+            transform = transform * gain
+        else:
+            transform *= gain[:, np.newaxis]
+
+    model.sig[conn]['transform'] = matrix_signal(
+        transform, name="%s.transform" % conn)
+    if indexed:
+        model.add_op(IndexedInc(model.sig[conn]['transform'],
+                                signal,
+                                model.sig[conn]['out'],
+                                y_index=conn.post_slice,
+                                tag=str(conn)))
+    elif transform.ndim < 2:
+        model.add_op(ElementwiseInc(model.sig[conn]['transform'],
+                                    signal,
+                                    model.sig[conn]['out'],
+                                    tag=str(conn)))
+    else:
+        model.add_op(matrix_dot_inc(model.sig[conn]['transform'],
+                                    transform,
+                                    signal,
+                                    model.sig[conn]['out'],
+                                    tag=str(conn)))
+    return transform
+
+
+def slice_function(conn, x):
+    """Compute the function of ``conn`` on the sliced input ``x``.
+
+    Used by connections from nodes and direct mode ensembles. Unlike a
+    lambda, a partial application of this function can be pickled.
+    """
+    x = x[conn.pre_slice]
+    return x if conn.function is None else conn.function(x)
+
+
+def is_decoded(conn):
+    """Whether decoders are solved for when building ``conn``."""
+    return (isinstance(conn.pre_obj, Ensemble) and
+            not isinstance(conn.pre_obj.neuron_type, Direct))
+
+
+def solve_decoders(model, conn, rng):
+    """Solve for the decoders of the decoded connection ``conn``.
+
+    With a weight solver, the full transform of the connection is included
+    in the returned weights.
+
+    Returns
+    -------
+    eval_points : ndarray
+        The evaluation points used to solve for the decoders.
+    decoders : ndarray or scipy.sparse matrix
+        The decoders (or weights) returned by the solver.
+    solver_info : dict
+        Additional information returned by the solver.
+    """
+    eval_points = build_eval_points(model, conn, rng)
+    targets = build_targets(conn, eval_points)
+
+    E = None
+    if conn.solver.weights:
+        # account for transform
+        transform = full_transform(conn, slice_pre=False)
+        targets = (transform.dot(targets.T).T
+                   if npext.is_spmatrix(transform) else
+                   np.dot(targets, transform.T))
+        E = model.params[conn.post_obj].scaled_encoders.T
+
+    decoders, solver_info = cached_solve(
+        model, conn, eval_points, targets, rng, E=E)
+    return eval_points, decoders, solver_info
+
+
+def cached_solve(model, conn, eval_points, targets, rng, E=None):
+    """Solve for decoders with the decoder cache, if configured.
+
+    The cache key is computed from the parameters of the neurons of
+    ``conn.pre_obj``, the evaluation points and the targets, which
+    determine the activities of the neurons. The activities are only
+    computed if the decoders are not found in the cache. The targets are
+    still computed, since they are needed to fingerprint the function of
+    the connection, and are cheap compared to the activities.
+
+    The neuron type is identified by its parameters and by the fingerprint
+    of the instance, which covers any other attributes that its rates may
+    depend on. If it cannot be fingerprinted, the activities are computed
+    and hashed instead, as in ``DecoderCache.wrap_solver``.
+    """
+    ens = conn.pre_obj
+    built = model.params[ens]
+    arrays = [built.encoders, built.gain, built.bias, eval_points, targets]
+    try:
+        key = model.decoder_cache.get_build_key(
+            conn.solver, rng, arrays=arrays if E is None else arrays + [E],
+            objects=[neuron_type_key(ens.neuron_type), ens.neuron_type,
+                     ens.radius])
+    except ValueError:
+        activities = build_activities(model, conn, eval_points)
+        return model.decoder_cache.wrap_solver(conn.solver)(
+            activities, targets, rng=rng, E=E)
+
+    def solve():
+        activities = build_activities(model, conn, eval_points)
+        return conn.solver(activities, targets, rng=rng, E=E)
+    return model.decoder_cache.load_or_solve(
+        key, solve, sparse=getattr(conn.solver, 'sparse', False))
+
+
+def shared_solve_key(conn):
+    """A key equal for connections whose decoders can be solved together.
+
+    The decoders of connections from the same ensemble, with the default
+    evaluation points, and with the same L2-regularized solver using the
+    Cholesky decomposition, solve linear systems with the same activities
+    and regularization, which differ only in the targets. Returns None for
+    other connections.
+    """
+    solver = conn.solver
+    if (conn.eval_points is not None or solver.weights or
+            type(solver) not in (LstsqL2, LstsqL2nz) or
+            solver.solver is not cholesky):
+        return None
+    try:
+        return (conn.pre_obj, str(Fingerprint(solver)))
+    except ValueError:
+        return None
+
+
+def solve_shared_decoders(model, conns):
+    """Solve for the decoders of connections with the same activities.
+
+    The connections must have the same ``shared_solve_key``. The activities
+    are computed once (if needed, see ``cached_solve``), and the targets
+    of all connections are passed to the solver together, so the Gram
+    matrix of the activities is formed and factored once. The solver (and
+    the decoder cache) sees one system with the targets of all connections
+    as columns.
+
+    Returns
+    -------
+    list of tuple
+        The result of ``solve_decoders`` for each connection.
+    """
+    # -- neither the eval points nor the solver use the random numbers
+    rng = np.random.RandomState(model.seeds[conns[0]])
+    eval_points = build_eval_points(model, conns[0], rng)
+    targets = [build_targets(conn, eval_points) for conn in conns]
+    decoders, solver_info = cached_solve(
+        model, conns[0], eval_points, np.hstack(targets), rng)
+
+    results = []
+    i = 0
+    for target in targets:
+        d = target.shape[1]
+        info = dict(solver_info)
+        info['rmses'] = solver_info['rmses'][i:i+d]
+        results.append((eval_points, np.array(decoders[:, i:i+d]), info))
+        i += d
+    return results
+
+
+def lazy_call(fn, *args):
+    """A function returning ``fn(*args)``, which is called only once."""
+    results = []
+
+    def get():
+        if len(results) == 0:
+            results.append(fn(*args))
+        return results[0]
+    return get
+
+
+def select_result(get, i):
+    return get()[i]
+
+
+def plan_decoder_solves(model, conns, pool=None):
+    """Plan how the decoders of ``conns`` are solved for.
+
+    Connections with the same ``shared_solve_key`` are solved for together
+    (see ``solve_shared_decoders``). If a thread pool is given, solving
+    starts right away on the pool. Each connection uses its own random
+    number generator, seeded in the same way as in ``build_connection``,
+    so the decoders (and the keys used by the decoder cache) are the same
+    as when solving one connection after the other. Most of the time is
+    spent in LAPACK routines that release the GIL, so threads can use
+    several cores.
+
+    Connections that cannot be solved yet (e.g., because their ``pre``
+    has not been built) are left to ``build_connection``, which raises
+    the appropriate error.
+
+    Returns
+    -------
+    dict
+        Maps connections to functions that are passed to
+        ``build_connection`` and return the result of ``solve_decoders``
+        for that connection.
+    """
+    groups = collections.OrderedDict()
+    for conn in conns:
+        if (not is_decoded(conn) or model.has_built(conn) or
+                not model.has_built(conn.pre_obj) or
+                conn.solver.weights and not model.has_built(conn.post_obj)):
+            continue
+        key = shared_solve_key(conn)
+        groups.setdefault(conn if key is None else key, []).append(conn)
+
+    solutions = {}
+    for group in itervalues(groups):
+        if len(group) > 1:
+            get = (pool.apply_async(solve_shared_decoders, (model, group)).get
+                   if pool is not None else
+                   lazy_call(solve_shared_decoders, model, group))
+            for i, conn in enumerate(group):
+                solutions[conn] = functools.partial(select_result, get, i)
+        elif pool is not None:
+            conn = group[0]
+            rng = np.random.RandomState(model.seeds[conn])
+            solutions[conn] = pool.apply_async(
+                solve_decoders, (model, conn, rng)).get
+    return solutions
 
 
 @Builder.register(Connection)  # noqa: C901
-def build_connection(model, conn):
+def build_connection(model, conn, solution=None):
+    """Builds a connection.
+
+    ``solution`` is a function returned by ``plan_decoder_solves`` for this
+    connection, if its decoders are solved for together with those of
+    other connections, or in parallel.
+    """
     # Create random number generator
     rng = np.random.RandomState(model.seeds[conn])
 
@@ -77,7 +403,10 @@ def build_connection(model, conn):
     decoders = None
     eval_points = None
     solver_info = None
-    transform = full_transform(conn, slice_pre=False)
+    transform = indexed_transform(conn)
+    indexed = transform is not None
+    if not indexed:
+        transform = full_transform(conn, slice_pre=False)
 
     # Figure out the signal going across this connection
     if (isinstance(conn.pre_obj, Node) or
@@ -87,10 +416,18 @@ def build_connection(model, conn):
         if (conn.function is None and isinstance(conn.pre_slice, slice) and
                 (conn.pre_slice.step is None or conn.pre_slice.step == 1)):
             signal = model.sig[conn]['in'][conn.pre_slice]
+        elif conn.function is None:
+            # Select the elements by indexing, not with a Python function
+            signal = Signal(np.zeros(conn.size_mid), name=str(conn))
+            model.add_op(Reset(signal))
+            model.add_op(IndexedInc(model.sig['common'][1],
+                                    model.sig[conn]['in'],
+                                    signal,
+                                    x_index=conn.pre_slice,
+                                    tag="%s slice" % conn))
         else:
             sig_in, signal = build_pyfunc(
-                fn=(lambda x: x[conn.pre_slice]) if conn.function is None else
-                   (lambda x: conn.function(x[conn.pre_slice])),
+                fn=functools.partial(slice_function, conn),
                 t_in=False,
                 n_in=model.sig[conn]['in'].size,
                 n_out=conn.size_mid,
@@ -102,36 +439,38 @@ def build_connection(model, conn):
                                 tag="%s input" % conn))
     elif isinstance(conn.pre_obj, Ensemble):
         # Normal decoded connection
-        eval_points, activities, targets = build_linear_system(
-            model, conn, rng)
+        if solution is None:
+            eval_points, decoders, solver_info = solve_decoders(
+                model, conn, rng)
+        else:
+            eval_points, decoders, solver_info = solution()
 
-        # Use cached solver, if configured
-        solver = model.decoder_cache.wrap_solver(conn.solver)
         if conn.solver.weights:
-            # account for transform
-            targets = np.dot(targets, transform.T)
+            # the transform is included in the weights
             transform = np.array(1., dtype=np.float64)
-
-            decoders, solver_info = solver(
-                activities, targets, rng=rng,
-                E=model.params[conn.post_obj].scaled_encoders.T)
             model.sig[conn]['out'] = model.sig[conn.post_obj.neurons]['in']
             signal_size = model.sig[conn]['out'].size
         else:
-            decoders, solver_info = solver(activities, targets, rng=rng)
             signal_size = conn.size_mid
 
         # Add operator for decoders
-        decoders = decoders.T
-
-        model.sig[conn]['decoders'] = Signal(
+        decoders = (decoders.T.tocsr() if npext.is_spmatrix(decoders)
+                    else decoders.T)
+        if (conn.learning_rule_type and not npext.is_spmatrix(decoders)
+                and not decoders.flags.writeable):
+            # -- decoders loaded from the decoder cache are read-only (and
+            #    may be memory-mapped), so learn on a copy of them
+            decoders = np.array(decoders)
+
+        model.sig[conn]['decoders'] = matrix_signal(
             decoders, name="%s.decoders" % conn)
         signal = Signal(np.zeros(signal_size), name=str(conn))
         model.add_op(Reset(signal))
-        model.add_op(DotInc(model.sig[conn]['decoders'],
-                            model.sig[conn]['in'],
-                            signal,
-                            tag="%s decoding" % conn))
+        model.add_op(matrix_dot_inc(model.sig[conn]['decoders'],
+                                    decoders,
+                                    model.sig[conn]['in'],
+                                    signal,
+                                    tag="%s decoding" % conn))
     else:
         # Direct connection
         signal = model.sig[conn]['in']
@@ -148,37 +487,7 @@ def build_connection(model, conn):
         model.add_op(Reset(model.sig[conn]['out']))
 
     # Add operator for transform
-    if isinstance(conn.post_obj, Neurons):
-        if not model.has_built(conn.post_obj.ensemble):
-            # Since it hasn't been built, it wasn't added to the Network,
-            # which is most likely because the Neurons weren't associated
-            # with an Ensemble.
-            raise RuntimeError("Connection '%s' refers to Neurons '%s' "
-                               "that are not a part of any Ensemble." % (
-                                   conn, conn.post_obj))
-
-        if conn.post_slice != slice(None):
-            raise NotImplementedError(
-                "Post-slices on connections to neurons are not implemented")
-
-        gain = model.params[conn.post_obj.ensemble].gain[conn.post_slice]
-        if transform.ndim < 2:
-            transform = transform * gain
-        else:
-            transform *= gain[:, np.newaxis]
-
-    model.sig[conn]['transform'] = Signal(transform,
-                                          name="%s.transform" % conn)
-    if transform.ndim < 2:
-        model.add_op(ElementwiseInc(model.sig[conn]['transform'],
-                                    signal,
-                                    model.sig[conn]['out'],
-                                    tag=str(conn)))
-    else:
-        model.add_op(DotInc(model.sig[conn]['transform'],
-                            signal,
-                            model.sig[conn]['out'],
-                            tag=str(conn)))
+    transform = build_transform(model, conn, transform, signal, indexed)
 
     if conn.learning_rule_type:
         # Forcing update of signal that is modified by learning rules.
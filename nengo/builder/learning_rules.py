@@ -1,7 +1,10 @@
 import numpy as np
 
+import nengo.utils.numpy as npext
 from nengo.builder.builder import Builder
-from nengo.builder.operator import DotInc, ElementwiseInc, Operator, Reset
+from nengo.builder.operator import (
+    DotInc, Operator, OuterInc, Reset, SparseOuterInc, decimate_outer_inc,
+    outer_inc)
 from nengo.builder.signal import Signal
 from nengo.builder.synapses import filtered_signal
 from nengo.connection import LearningRule
@@ -10,68 +13,131 @@ from nengo.learning_rules import BCM, Oja, PES
 
 
 class SimBCM(Operator):
-    """Change the transform according to the BCM rule."""
-    def __init__(self, pre_filtered, post_filtered, theta, delta,
-                 learning_rate):
+    """Change the transform according to the BCM rule.
+
+    The transform is incremented in place with a rank-1 update (see
+    ``outer_inc``), without creating the matrix of weight changes. It is
+    updated every ``every`` steps (see ``decimate_outer_inc``).
+    """
+    def __init__(self, pre_filtered, post_filtered, theta, transform,
+                 learning_rate, every=1):
         self.post_filtered = post_filtered
         self.pre_filtered = pre_filtered
         self.theta = theta
-        self.delta = delta
+        self.transform = transform
         self.learning_rate = learning_rate
+        self.every = every
 
         self.sets = []
-        self.incs = []
+        self.incs = [transform]
         self.reads = [pre_filtered, post_filtered, theta]
-        self.updates = [delta]
+        self.updates = []
 
     def make_step(self, signals, dt, rng):
         pre_filtered = signals[self.pre_filtered]
         post_filtered = signals[self.post_filtered]
         theta = signals[self.theta]
-        delta = signals[self.delta]
         alpha = self.learning_rate * dt
+        post_term = np.empty_like(post_filtered)
+        inc = decimate_outer_inc(outer_inc(signals[self.transform]),
+                                 self.every, post_term, pre_filtered)
 
         def step():
-            delta[...] = np.outer(
-                alpha * post_filtered * (post_filtered - theta), pre_filtered)
+            np.subtract(post_filtered, theta, out=post_term)
+            np.multiply(post_term, post_filtered, out=post_term)
+            inc(alpha, post_term, pre_filtered)
         return step
 
 
 class SimOja(Operator):
-    """Change the transform according to the OJA rule."""
-    def __init__(self, pre_filtered, post_filtered, transform, delta,
-                 learning_rate, beta):
+    """Change the transform according to the OJA rule.
+
+    The forgetting term scales the rows of the transform in place, and the
+    Hebbian term is a rank-1 update (see ``outer_inc``), so the matrix of
+    weight changes is never created. The transform is read as part of
+    incrementing it, so it is not listed in ``reads``. It is updated every
+    ``every`` steps (see ``decimate_outer_inc``), with the forgetting terms
+    of these steps combined into one.
+    """
+    def __init__(self, pre_filtered, post_filtered, transform,
+                 learning_rate, beta, every=1):
         self.post_filtered = post_filtered
         self.pre_filtered = pre_filtered
         self.transform = transform
-        self.delta = delta
         self.learning_rate = learning_rate
         self.beta = beta
+        self.every = every
 
         self.sets = []
-        self.incs = []
-        self.reads = [pre_filtered, post_filtered, transform]
-        self.updates = [delta]
+        self.incs = [transform]
+        self.reads = [pre_filtered, post_filtered]
+        self.updates = []
 
     def make_step(self, signals, dt, rng):
         transform = signals[self.transform]
         pre_filtered = signals[self.pre_filtered]
         post_filtered = signals[self.post_filtered]
-        delta = signals[self.delta]
         alpha = self.learning_rate * dt
         beta = self.beta
+        every = self.every
+        inc = decimate_outer_inc(
+            outer_inc(transform), every, post_filtered, pre_filtered)
+        post_squared = np.zeros_like(post_filtered)
+        scale = np.empty_like(post_filtered)
+        scale_col = scale[:, None]
+        count = np.zeros(1, dtype=np.int64)
 
         def step():
             # perform forgetting
-            post_squared = alpha * post_filtered * post_filtered
-            delta[...] = -beta * transform * post_squared[:, None]
+            np.multiply(post_filtered, post_filtered, out=scale)
+            np.add(post_squared, scale, out=post_squared)
+            count[0] += 1
+            if count[0] == every:
+                np.multiply(-alpha * beta, post_squared, out=scale)
+                np.add(1, scale, out=scale)
+                np.multiply(transform, scale_col, out=transform)
+                post_squared.fill(0)
+                count[0] = 0
 
             # perform update
-            delta[...] += np.outer(alpha * post_filtered, pre_filtered)
-
+            inc(alpha, post_filtered, pre_filtered)
         return step
 
 
+def learned_matrix(model, conn, key='transform'):
+    """The built matrix held by the signal ``model.sig[conn][key]``.
+
+    With a weight solver, the transform signal holds the weight matrix,
+    which is stored as the decoders of the connection.
+    """
+    built = model.params[conn]
+    return (built.decoders if key == 'decoders' or conn.solver.weights
+            else built.transform)
+
+
+def dense_learned_matrix(model, rule):
+    conn = rule.connection
+    if npext.is_spmatrix(learned_matrix(model, conn)):
+        raise NotImplementedError(
+            "%s cannot be applied to connections with sparse weights (%s)"
+            % (type(rule.learning_rule_type).__name__, conn))
+    return model.sig[conn]['transform']
+
+
+def add_outer_inc(model, matrix, signal, X, Y, every=1, tag=None):
+    """Add an operator incrementing a matrix signal by outer(X, Y).
+
+    Dense matrices are incremented in place by a rank-1 update. For sparse
+    matrices, only the stored elements are incremented. The matrix is
+    updated every ``every`` steps.
+    """
+    if npext.is_spmatrix(matrix):
+        model.add_op(SparseOuterInc(signal, X, Y, matrix.indices,
+                                    matrix.indptr, every=every, tag=tag))
+    else:
+        model.add_op(OuterInc(signal, X, Y, every=every, tag=tag))
+
+
 @Builder.register(LearningRule)
 def build_learning_rule(model, rule):
     rule_type = rule.learning_rule_type
@@ -85,19 +151,16 @@ def build_bcm(model, bcm, rule):
            else conn.pre_obj.ensemble)
     post = (conn.post_obj if isinstance(conn.post_obj, Ensemble)
             else conn.post_obj.ensemble)
-    transform = model.sig[conn]['transform']
+    transform = dense_learned_matrix(model, rule)
     pre_activities = model.sig[pre.neurons]['out']
     post_activities = model.sig[post.neurons]['out']
     pre_filtered = filtered_signal(model, bcm, pre_activities, bcm.pre_tau)
     post_filtered = filtered_signal(model, bcm, post_activities, bcm.post_tau)
     theta = filtered_signal(model, bcm, post_filtered, bcm.theta_tau)
-    delta = Signal(np.zeros((post.n_neurons, pre.n_neurons)),
-                   name='BCM: Delta')
 
-    model.add_op(SimBCM(pre_filtered, post_filtered, theta, delta,
-                        learning_rate=bcm.learning_rate))
-    model.add_op(ElementwiseInc(
-        model.sig['common'][1], delta, transform, tag="BCM: Inc Transform"))
+    model.add_op(SimBCM(pre_filtered, post_filtered, theta, transform,
+                        learning_rate=bcm.learning_rate,
+                        every=bcm.update_every))
 
     # expose these for probes
     model.sig[rule]['theta'] = theta
@@ -114,18 +177,15 @@ def build_oja(model, oja, rule):
            else conn.pre_obj.ensemble)
     post = (conn.post_obj if isinstance(conn.post_obj, Ensemble)
             else conn.post_obj.ensemble)
-    transform = model.sig[conn]['transform']
+    transform = dense_learned_matrix(model, rule)
     pre_activities = model.sig[pre.neurons]['out']
     post_activities = model.sig[post.neurons]['out']
     pre_filtered = filtered_signal(model, oja, pre_activities, oja.pre_tau)
     post_filtered = filtered_signal(model, oja, post_activities, oja.post_tau)
-    delta = Signal(np.zeros((post.n_neurons, pre.n_neurons)),
-                   name='Oja: Delta')
 
-    model.add_op(SimOja(pre_filtered, post_filtered, transform, delta,
-                        learning_rate=oja.learning_rate, beta=oja.beta))
-    model.add_op(ElementwiseInc(
-        model.sig['common'][1], delta, transform, tag="Oja: Inc Transform"))
+    model.add_op(SimOja(pre_filtered, post_filtered, transform,
+                        learning_rate=oja.learning_rate, beta=oja.beta,
+                        every=oja.update_every))
 
     # expose these for probes
     model.sig[rule]['pre_filtered'] = pre_filtered
@@ -143,8 +203,6 @@ def build_pes(model, pes, rule):
 
     scaled_error = Signal(np.zeros(error.shape),
                           name="PES:error * learning_rate")
-    scaled_error_view = scaled_error.reshape((error.size, 1))
-    activities_view = activities.reshape((1, activities.size))
     lr_sig = Signal(pes.learning_rate * model.dt, name="PES:learning_rate")
 
     model.add_op(Reset(scaled_error))
@@ -157,28 +215,27 @@ def build_pes(model, pes, rule):
                 else conn.post_obj)
         transform = model.sig[conn]['transform']
         encoders = model.sig[post]['encoders']
-        encoded_error = Signal(np.zeros(transform.shape[0]),
+        encoded_error = Signal(np.zeros(encoders.shape[0]),
                                name="PES: encoded error")
 
         model.add_op(Reset(encoded_error))
         model.add_op(DotInc(
             encoders, scaled_error, encoded_error, tag="PES:Encode error"))
 
-        encoded_error_view = encoded_error.reshape((encoded_error.size, 1))
-        model.add_op(ElementwiseInc(
-            encoded_error_view, activities_view, transform,
-            tag="PES:Inc Transform"))
+        add_outer_inc(model, learned_matrix(model, conn), transform,
+                      encoded_error, activities, every=pes.update_every,
+                      tag="PES:Inc Transform")
     elif isinstance(conn.pre_obj, Neurons):
         transform = model.sig[conn]['transform']
-        model.add_op(ElementwiseInc(
-            scaled_error_view, activities_view, transform,
-            tag="PES:Inc Transform"))
+        add_outer_inc(model, learned_matrix(model, conn), transform,
+                      scaled_error, activities, every=pes.update_every,
+                      tag="PES:Inc Transform")
     else:
         assert isinstance(conn.pre_obj, Ensemble)
         decoders = model.sig[conn]['decoders']
-        model.add_op(ElementwiseInc(
-            scaled_error_view, activities_view, decoders,
-            tag="PES:Inc Decoder"))
+        add_outer_inc(model, learned_matrix(model, conn, 'decoders'),
+                      decoders, scaled_error, activities,
+                      every=pes.update_every, tag="PES:Inc Decoder")
 
     # expose these for probes
     model.sig[rule]['scaled_error'] = scaled_error
@@ -1,9 +1,11 @@
 import logging
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 
 import nengo.utils.numpy as npext
 from nengo.builder.builder import Builder
+from nengo.builder.connection import plan_decoder_solves
 from nengo.builder.signal import Signal
 from nengo.network import Network
 from nengo.utils.compat import is_iterable, itervalues
@@ -25,6 +27,11 @@ def build_network(model, network):
     3) Connections
     4) Learning Rules
     5) Probes
+
+    Steps 3 to 5 of all networks are deferred until steps 1 and 2 have been
+    done for the whole model, so that the decoders of all connections in
+    the model can be solved for together (see ``build_connections``). They
+    are then done for each network in turn, with subnetworks first.
     """
     def get_seed(obj, rng):
         # Generate a seed no matter what, so that setting a seed or not on
@@ -41,42 +48,82 @@ def build_network(model, network):
             npext.array(1.0, readonly=True), name='Common: One')
         model.seeds[network] = get_seed(network, np.random)
 
-    # Set config
-    old_config = model.config
-    model.config = network.config
-
-    # assign seeds to children
-    rng = np.random.RandomState(model.seeds[network])
-    sorted_types = sorted(network.objects, key=lambda t: t.__name__)
-    for obj_type in sorted_types:
-        for obj in network.objects[obj_type]:
-            model.seeds[obj] = get_seed(obj, rng)
-
-    logger.debug("Network step 1: Building ensembles and nodes")
-    for obj in network.ensembles + network.nodes:
-        model.build(obj)
-
-    logger.debug("Network step 2: Building subnetworks")
-    for subnetwork in network.networks:
-        model.build(subnetwork)
-
-    logger.debug("Network step 3: Building connections")
-    for conn in network.connections:
-        model.build(conn)
-
-    logger.debug("Network step 4: Building learning rules")
-    for conn in network.connections:
-        rule = conn.learning_rule
-        if is_iterable(rule):
-            for r in (itervalues(rule) if isinstance(rule, dict) else rule):
-                model.build(r)
-        elif rule is not None:
-            model.build(rule)
-
-    logger.debug("Network step 5: Building probes")
-    for probe in network.probes:
-        model.build(probe)
-
-    # Unset config
-    model.config = old_config
-    model.params[network] = None
+    outermost = model.pending_networks is None
+    if outermost:
+        model.pending_networks = []
+
+    try:
+        # Set config
+        old_config = model.config
+        model.config = network.config
+
+        # assign seeds to children
+        rng = np.random.RandomState(model.seeds[network])
+        sorted_types = sorted(network.objects, key=lambda t: t.__name__)
+        for obj_type in sorted_types:
+            for obj in network.objects[obj_type]:
+                model.seeds[obj] = get_seed(obj, rng)
+
+        logger.debug("Network step 1: Building ensembles and nodes")
+        for obj in network.ensembles + network.nodes:
+            model.build(obj)
+
+        logger.debug("Network step 2: Building subnetworks")
+        for subnetwork in network.networks:
+            model.build(subnetwork)
+
+        # Unset config
+        model.config = old_config
+        model.pending_networks.append(network)
+
+        if outermost:
+            build_connections(model, model.pending_networks)
+    finally:
+        if outermost:
+            model.pending_networks = None
+
+
+def build_connections(model, networks):
+    """Builds the connections, learning rules and probes of ``networks``.
+
+    The decoders of the connections of all networks are planned together
+    (see ``plan_decoder_solves``), so that connections sharing their
+    activities are solved for together, and, if ``model.build_workers > 1``,
+    the decoders are solved for on a thread pool that is kept busy across
+    all networks (e.g., the many small subnetworks of an EnsembleArray).
+    """
+    conns = [conn for network in networks for conn in network.connections]
+    pool = (ThreadPool(min(model.build_workers, len(conns)))
+            if model.build_workers > 1 and len(conns) > 1 else None)
+    try:
+        solutions = plan_decoder_solves(model, conns, pool)
+        for network in networks:
+            old_config = model.config
+            model.config = network.config
+
+            logger.debug("Network step 3: Building connections")
+            for conn in network.connections:
+                if conn in solutions:
+                    model.build(conn, solutions[conn])
+                else:
+                    model.build(conn)
+
+            logger.debug("Network step 4: Building learning rules")
+            for conn in network.connections:
+                rule = conn.learning_rule
+                if is_iterable(rule):
+                    for r in (itervalues(rule) if isinstance(rule, dict)
+                              else rule):
+                        model.build(r)
+                elif rule is not None:
+                    model.build(rule)
+
+            logger.debug("Network step 5: Building probes")
+            for probe in network.probes:
+                model.build(probe)
+
+            model.config = old_config
+            model.params[network] = None
+    finally:
+        if pool is not None:
+            pool.terminate()
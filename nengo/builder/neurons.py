@@ -25,10 +25,95 @@ class SimNeurons(Operator):
         J = signals[self.J]
         output = signals[self.output]
         states = [signals[state] for state in self.states]
-
-        def step():
-            self.neurons.step_math(dt, J, output, *states)
-        return step
+        return make_neurons_step(self.neurons, dt, J, output, states)
+
+
+def make_neurons_step(neurons, dt, J, output, states):
+    """Returns a step function simulating ``neurons`` on the given arrays.
+
+    If there is a kernel for the neuron type in ``neuron_kernels``, it is
+    used instead of calling ``neurons.step_math`` on every step.
+    """
+    if type(neurons) in neuron_kernels:
+        return neuron_kernels[type(neurons)](neurons, dt, J, output, *states)
+
+    def step():
+        neurons.step_math(dt, J, output, *states)
+    return step
+
+
+def make_lif_step(lif, dt, J, spiked, voltage, refractory_time):
+    """Returns a step function equivalent to ``LIF.step_math``.
+
+    The constants are computed once, and all intermediate results are
+    written to workspace arrays allocated here, so that the step function
+    does not allocate any memory. The operations are carried out in the
+    same order as in ``LIF.step_math``, so the results are identical.
+    """
+    decay = float(-np.expm1(-dt / lif.tau_rc))
+    min_voltage = lif.min_voltage
+    tau_ref = lif.tau_ref
+    dV = np.empty_like(voltage)
+    work = np.empty_like(voltage)
+    spiking = np.empty(voltage.shape, dtype=bool)
+
+    def step():
+        # update voltage using accurate exponential integration scheme
+        np.subtract(J, voltage, out=dV)
+        np.multiply(dV, decay, out=dV)
+        np.add(voltage, dV, out=voltage)
+        np.maximum(voltage, min_voltage, out=voltage)
+
+        # update refractory period assuming no spikes for now
+        np.subtract(refractory_time, dt, out=refractory_time)
+
+        # set voltages of neurons still in their refractory period to 0
+        # and reduce voltage of neurons partway out of their ref. period
+        np.divide(refractory_time, dt, out=work)
+        np.subtract(1, work, out=work)
+        np.clip(work, 0, 1, out=work)
+        np.multiply(voltage, work, out=voltage)
+
+        # determine which neurons spike (if v > 1 set spiked = 1/dt, else 0)
+        np.greater(voltage, 1, out=spiking)
+        np.divide(spiking, dt, out=spiked)
+
+        # linearly approximate time since neuron crossed spike threshold
+        np.subtract(voltage, 1, out=work, where=spiking)
+        np.divide(work, dV, out=work, where=spiking)
+        np.subtract(1, work, out=work, where=spiking)
+        np.multiply(dt, work, out=work, where=spiking)
+
+        # set spiking neurons' voltages to zero, and ref. time to tau_ref
+        np.copyto(voltage, 0, where=spiking)
+        np.add(tau_ref, work, out=refractory_time, where=spiking)
+    return step
+
+
+def make_alif_step(alif, dt, J, output, voltage, ref, adaptation):
+    """Returns a step function equivalent to ``AdaptiveLIF.step_math``."""
+    J_n = np.empty_like(J)
+    lif_step = make_lif_step(alif, dt, J_n, output, voltage, ref)
+    rate = dt / alif.tau_n
+    inc_n = alif.inc_n
+    work = np.empty_like(adaptation)
+
+    def step():
+        np.subtract(J, adaptation, out=J_n)
+        lif_step()
+        np.multiply(inc_n, output, out=work)
+        np.subtract(work, adaptation, out=work)
+        np.multiply(rate, work, out=work)
+        np.add(adaptation, work, out=adaptation)
+    return step
+
+
+# Allocation-free step functions for neuron types (exact types only, since
+# subclasses may change ``step_math``)
+neuron_kernels = {
+    AdaptiveLIF: make_alif_step,
+    LIF: make_lif_step,
+}
 
 
 @Builder.register(RectifiedLinear)
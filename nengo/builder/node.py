@@ -40,7 +40,8 @@ class SimPyFunc(Operator):
             if output is not None:
                 if y is None:
                     raise ValueError(
-                        "Function '%s' returned invalid value" % fn.__name__)
+                        "Function '%s' returned invalid value"
+                        % getattr(fn, '__name__', fn))
                 output[...] = y
 
         return step
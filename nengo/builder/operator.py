@@ -241,6 +241,76 @@ class ElementwiseInc(Operator):
         return step
 
 
+class IndexedInc(Operator):
+    """Increment signal Y[y_index] by A * X[x_index] (with broadcasting)
+
+    The indices can be slices or arrays of integers. This replaces a
+    ``DotInc`` with a matrix that only selects (and scales) some elements of
+    X and adds them to some elements of Y, without creating the matrix.
+    Integer indices into Y must not repeat, since each element of Y would
+    only be incremented once.
+    """
+
+    def __init__(self, A, X, Y, x_index=slice(None), y_index=slice(None),
+                 tag=None):
+        if X.ndim != 1 or Y.ndim != 1:
+            raise ValueError("X and Y must be vectors")
+        if not isinstance(x_index, slice):
+            x_index = npext.array(np.arange(X.size)[x_index], readonly=True)
+        if not isinstance(y_index, slice):
+            y_index = npext.array(np.arange(Y.size)[y_index], readonly=True)
+            if np.unique(y_index).size != y_index.size:
+                raise ValueError("Indices into Y must not repeat")
+
+        self.A = A
+        self.X = X
+        self.Y = Y
+        self.x_index = x_index
+        self.y_index = y_index
+        self.tag = tag
+
+        self.sets = []
+        self.incs = [Y]
+        self.reads = [A, X]
+        self.updates = []
+
+    def __str__(self):
+        return 'IndexedInc(%s, %s -> %s "%s")' % (
+            self.A, self.X, self.Y, self.tag)
+
+    def make_step(self, signals, dt, rng):  # noqa: C901
+        A = signals[self.A]
+        X = signals[self.X]
+        Y = signals[self.Y]
+        x_index, y_index = self.x_index, self.y_index
+
+        # -- slices give views, which do not have to be indexed each step
+        if isinstance(x_index, slice):
+            X = X[x_index]
+        if isinstance(y_index, slice):
+            Y = Y[y_index]
+        x_size = X.size if isinstance(x_index, slice) else x_index.size
+        y_size = Y.size if isinstance(y_index, slice) else y_index.size
+        if not (A.size in (1, y_size) and x_size in (1, y_size)):
+            raise ValueError("Incompatible shapes in IndexedInc: Trying to "
+                             "do (%d,) += %s * (%d,)"
+                             % (y_size, A.shape, x_size))
+
+        if isinstance(x_index, slice) and isinstance(y_index, slice):
+            def step():
+                Y[...] += A * X
+        elif isinstance(y_index, slice):
+            def step():
+                Y[...] += A * X[x_index]
+        elif isinstance(x_index, slice):
+            def step():
+                Y[y_index] += A * X
+        else:
+            def step():
+                Y[y_index] += A * X[x_index]
+        return step
+
+
 def reshape_dot(A, X, Y, tag=None):
     """Checks if the dot product needs to be reshaped.
 
@@ -311,6 +381,211 @@ class DotInc(Operator):
         return step
 
 
+class SparseDotInc(Operator):
+    """Increment signal Y by dot(A, X), where A is a sparse matrix
+
+    The matrix is stored in compressed sparse row (CSR) format. The signal
+    A holds the values of its stored elements; ``indices`` and ``indptr``
+    are the column indices and row pointers of the CSR format, which do not
+    change during the simulation.
+    """
+
+    def __init__(self, A, X, Y, indices, indptr, tag=None):
+        if X.ndim != 1:
+            raise ValueError("X must be a vector")
+        if Y.ndim != 1:
+            raise ValueError("Y must be a vector")
+        if A.shape != (indptr[-1],) or len(indices) != indptr[-1]:
+            raise ValueError("A must hold the %d stored elements of the "
+                             "matrix" % indptr[-1])
+        if len(indptr) != Y.size + 1:
+            raise ValueError("Number of rows (%d) does not match Y (%d)"
+                             % (len(indptr) - 1, Y.size))
+
+        self.A = A
+        self.X = X
+        self.Y = Y
+        self.indices = npext.array(indices, readonly=True)
+        self.indptr = npext.array(indptr, readonly=True)
+        self.tag = tag
+
+        self.sets = []
+        self.incs = [Y]
+        self.reads = [A, X]
+        self.updates = []
+
+    def __str__(self):
+        return 'SparseDotInc(%s, %s -> %s "%s")' % (
+            self.A, self.X, self.Y, self.tag)
+
+    def make_step(self, signals, dt, rng):
+        import scipy.sparse
+        X = signals[self.X]
+        Y = signals[self.Y]
+
+        # -- the matrix refers to the array of A, so changes to A
+        #    (e.g., by learning rules) are seen by the matrix. SciPy may
+        #    copy the values (e.g., read-only views into an arena), so the
+        #    array is assigned after creating the matrix.
+        A = scipy.sparse.csr_matrix(
+            (signals[self.A], self.indices, self.indptr),
+            shape=(Y.size, X.size))
+        A.data = signals[self.A]
+
+        def step():
+            Y[...] += A.dot(X)
+        return step
+
+
+def outer_inc(A):
+    """Returns a function ``inc(alpha, X, Y)`` adding ``alpha * outer(X, Y)``
+    to the matrix ``A`` in place.
+
+    If SciPy is installed and ``A`` is C-contiguous, this is a single BLAS
+    ``ger`` (rank-1 update) on the transpose of ``A``, which is Fortran-
+    contiguous, so no temporary matrices are created.
+    """
+    try:
+        import scipy.linalg.blas
+        ger = scipy.linalg.blas.get_blas_funcs('ger', (A,))
+    except ImportError:
+        ger = None
+
+    if (ger is not None and A.ndim == 2 and A.flags.c_contiguous
+            and A.flags.writeable and ger.dtype == A.dtype):
+        AT = A.T
+
+        def inc(alpha, X, Y):
+            ger(alpha, Y, X, a=AT, overwrite_a=True)
+    else:
+        def inc(alpha, X, Y):
+            A[...] += alpha * np.outer(X, Y)
+    return inc
+
+
+def decimate_outer_inc(inc, every, X, Y):
+    """Wraps ``inc`` (see ``outer_inc``) to update the matrix every few calls.
+
+    The vectors passed to each call are summed, and every ``every``-th call
+    adds ``alpha / every * outer(sum(X), sum(Y))`` to the matrix. This is
+    equal to the sum of the separate updates if ``X`` or ``Y`` does not
+    change between updates, and approximates it if they change slowly,
+    at a fraction of the cost. ``X`` and ``Y`` give the shape and dtype of
+    the vectors. If ``every`` is 1, ``inc`` is returned unchanged.
+    """
+    if every == 1:
+        return inc
+
+    X_sum = np.zeros_like(X)
+    Y_sum = np.zeros_like(Y)
+    count = np.zeros(1, dtype=np.int64)  # an array, so snapshots include it
+
+    def decimated_inc(alpha, X, Y):
+        np.add(X_sum, X, out=X_sum)
+        np.add(Y_sum, Y, out=Y_sum)
+        count[0] += 1
+        if count[0] == every:
+            inc(alpha / every, X_sum, Y_sum)
+            X_sum.fill(0)
+            Y_sum.fill(0)
+            count[0] = 0
+    return decimated_inc
+
+
+class OuterInc(Operator):
+    """Increment the matrix A by outer(X, Y)
+
+    The update is done in place, without creating the outer product (see
+    ``outer_inc``). If ``every`` is greater than 1, the matrix is only
+    updated every ``every`` steps (see ``decimate_outer_inc``).
+    """
+
+    def __init__(self, A, X, Y, every=1, tag=None):
+        if X.ndim != 1 or Y.ndim != 1:
+            raise ValueError("X and Y must be vectors")
+        if A.shape != (X.size, Y.size):
+            raise ValueError("A must have shape %s (got %s)"
+                             % ((X.size, Y.size), A.shape))
+
+        self.A = A
+        self.X = X
+        self.Y = Y
+        self.every = every
+        self.tag = tag
+
+        self.sets = []
+        self.incs = [A]
+        self.reads = [X, Y]
+        self.updates = []
+
+    def __str__(self):
+        return 'OuterInc(%s, %s -> %s "%s")' % (
+            self.X, self.Y, self.A, self.tag)
+
+    def make_step(self, signals, dt, rng):
+        X = signals[self.X]
+        Y = signals[self.Y]
+        inc = decimate_outer_inc(
+            outer_inc(signals[self.A]), self.every, X, Y)
+
+        def step():
+            inc(1., X, Y)
+        return step
+
+
+class SparseOuterInc(Operator):
+    """Increment the stored elements of a sparse matrix by outer(X, Y)
+
+    The signal A holds the values of the stored elements of a matrix in
+    CSR format (see ``SparseDotInc``). Elements that are not stored are
+    not changed, so the sparsity of the matrix is kept. If ``every`` is
+    greater than 1, the matrix is only updated every ``every`` steps (see
+    ``decimate_outer_inc``).
+    """
+
+    def __init__(self, A, X, Y, indices, indptr, every=1, tag=None):
+        if X.ndim != 1 or Y.ndim != 1:
+            raise ValueError("X and Y must be vectors")
+        if A.shape != (indptr[-1],) or len(indices) != indptr[-1]:
+            raise ValueError("A must hold the %d stored elements of the "
+                             "matrix" % indptr[-1])
+        if len(indptr) != X.size + 1:
+            raise ValueError("Number of rows (%d) does not match X (%d)"
+                             % (len(indptr) - 1, X.size))
+
+        self.A = A
+        self.X = X
+        self.Y = Y
+        self.indices = npext.array(indices, readonly=True)
+        self.indptr = npext.array(indptr, readonly=True)
+        self.every = every
+        self.tag = tag
+
+        self.sets = []
+        self.incs = [A]
+        self.reads = [X, Y]
+        self.updates = []
+
+    def __str__(self):
+        return 'SparseOuterInc(%s, %s -> %s "%s")' % (
+            self.X, self.Y, self.A, self.tag)
+
+    def make_step(self, signals, dt, rng):
+        A = signals[self.A]
+        X = signals[self.X]
+        Y = signals[self.Y]
+        rows = npext.array(npext.csr_rows(self.indptr), readonly=True)
+        cols = self.indices
+
+        def sparse_inc(alpha, X, Y):
+            A[...] += alpha * X[rows] * Y[cols]
+        inc = decimate_outer_inc(sparse_inc, self.every, X, Y)
+
+        def step():
+            inc(1., X, Y)
+        return step
+
+
 class SimNoise(Operator):
     def __init__(self, output, process):
         self.output = output
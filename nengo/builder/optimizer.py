@@ -0,0 +1,335 @@
+"""Operator fusion for the reference simulator.
+
+Many Nengo models consist of a large number of small operators of the same
+type (e.g., one ``SimNeurons`` per ensemble, one ``Reset`` per signal).
+Executing each of these as a separate Python function call introduces a
+large interpreter overhead on every timestep. The functions in this module
+group compatible operators into merged operators, which run as a single
+step function. If the signals of the merged operators are adjacent in
+memory, the merged operator works on one concatenated view of the signals;
+otherwise, it falls back to calling the original operators one after another.
+
+Operators are only merged if they are at the same level of the dependency
+graph. Since all edges in the dependency graph go from a lower level to
+a higher level, the merged graph is guaranteed to be acyclic, and all
+orderings imposed by ``operator_depencency_graph`` are preserved.
+"""
+
+import collections
+
+import numpy as np
+
+import nengo.utils.numpy as npext
+from nengo.builder.neurons import SimNeurons, make_neurons_step
+from nengo.builder.operator import (
+    Copy, DotInc, ElementwiseInc, Operator, Reset)
+from nengo.builder.synapses import SimSynapse
+from nengo.params import is_param
+from nengo.synapses import LinearFilter
+from nengo.utils.graphs import reverse_edges, toposort
+
+
+def neuron_type_key(neurons):
+    """A hashable key that is equal for neuron types with equal parameters."""
+    cls = type(neurons)
+    params = sorted((attr, getattr(neurons, attr)) for attr in dir(cls)
+                    if is_param(getattr(cls, attr)))
+    return (cls,) + tuple(params)
+
+
+def synapse_key(synapse):
+    """A hashable key that is equal for synapses filtering identically.
+
+    Linear filters of the same type with the same transfer function have
+    the same discrete-time coefficients for any ``dt``. Other synapses
+    are only equal to themselves.
+    """
+    if isinstance(synapse, LinearFilter):
+        return (type(synapse), tuple(np.ravel(synapse.num)),
+                tuple(np.ravel(synapse.den)))
+    return synapse
+
+
+class MergedOperator(Operator):
+    """Base class for operators made up of several operators of one type.
+
+    Subclasses implement ``make_merged_step``, which returns a step function
+    operating on all merged operators at once, or ``None`` if the signals
+    are not laid out in a way that allows this. In the latter case, the
+    step functions of the original operators are called one after another.
+    """
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.tag = "merged %d" % len(ops)
+
+        self.sets = [s for op in ops for s in op.sets]
+        self.incs = [s for op in ops for s in op.incs]
+        self.reads = [s for op in ops for s in op.reads]
+        self.updates = [s for op in ops for s in op.updates]
+
+    def __str__(self):
+        return '%s(%s x %d)' % (
+            self.__class__.__name__, type(self.ops[0]).__name__,
+            len(self.ops))
+
+    def init_signals(self, signals):
+        for op in self.ops:
+            op.init_signals(signals)
+
+    def make_merged_step(self, signals, dt, rng):
+        return None
+
+    def make_step(self, signals, dt, rng):
+        step = self.make_merged_step(signals, dt, rng)
+        if step is not None:
+            return step
+
+        steps = [op.make_step(signals, dt, rng) for op in self.ops]
+
+        def step():
+            for step_fn in steps:
+                step_fn()
+        return step
+
+    def span(self, signals, attr):
+        """View spanning signal ``attr`` of all ops, or ``None``."""
+        return npext.contiguous_span(
+            [signals[getattr(op, attr)] for op in self.ops])
+
+
+class MergedReset(MergedOperator):
+    """Several ``Reset`` operators assigning the same value."""
+
+    def make_merged_step(self, signals, dt, rng):
+        target = self.span(signals, 'dst')
+        if target is None:
+            return None
+        value = self.ops[0].value
+
+        def step():
+            target[...] = value
+        return step
+
+
+class MergedCopy(MergedOperator):
+    """Several ``Copy`` operators."""
+
+    def make_merged_step(self, signals, dt, rng):
+        dst = self.span(signals, 'dst')
+        src = self.span(signals, 'src')
+        if dst is None or src is None:
+            return None
+
+        def step():
+            dst[...] = src
+        return step
+
+
+class MergedElementwiseInc(MergedOperator):
+    """Several ``ElementwiseInc`` operators with identical shapes."""
+
+    def make_merged_step(self, signals, dt, rng):
+        A = self.span(signals, 'A')
+        X = self.span(signals, 'X')
+        Y = self.span(signals, 'Y')
+        if A is None or X is None or Y is None:
+            return None
+
+        # validate the shapes of the original operators
+        self.ops[0].make_step(signals, dt, rng)
+
+        op, n = self.ops[0], len(self.ops)
+        A = A.reshape((n,) + npext.broadcast_shape(op.A.shape, 2))
+        X = X.reshape((n,) + npext.broadcast_shape(op.X.shape, 2))
+        Y = Y.reshape((n,) + npext.broadcast_shape(op.Y.shape, 2))
+
+        def step():
+            Y[...] += A * X
+        return step
+
+
+class MergedDotInc(MergedOperator):
+    """Several matrix-vector ``DotInc`` operators with identical shapes."""
+
+    def make_merged_step(self, signals, dt, rng):
+        op, n = self.ops[0], len(self.ops)
+        if op.A.ndim != 2 or op.X.ndim != 1 or op.Y.ndim != 1:
+            return None
+
+        A = self.span(signals, 'A')
+        X = self.span(signals, 'X')
+        Y = self.span(signals, 'Y')
+        if A is None or X is None or Y is None:
+            return None
+
+        # validate the shapes of the original operators
+        op.make_step(signals, dt, rng)
+
+        # -- a single batched product (e.g., einsum) may sum in a different
+        #    order than np.dot, so each product is still done with np.dot
+        #    to give results identical to the original operators
+        dots = list(zip(A.reshape((n,) + op.A.shape),
+                        X.reshape((n,) + op.X.shape),
+                        Y.reshape((n,) + op.Y.shape)))
+
+        def step():
+            for a, x, y in dots:
+                y += np.dot(a, x)
+        return step
+
+
+class MergedSimNeurons(MergedOperator):
+    """Several ``SimNeurons`` operators with identical neuron types."""
+
+    def make_merged_step(self, signals, dt, rng):
+        J = self.span(signals, 'J')
+        output = self.span(signals, 'output')
+        if J is None or output is None:
+            return None
+
+        states = []
+        for i in range(len(self.ops[0].states)):
+            state = npext.contiguous_span(
+                [signals[op.states[i]] for op in self.ops])
+            if state is None:
+                return None
+            states.append(state)
+        return make_neurons_step(self.ops[0].neurons, dt, J, output, states)
+
+
+class MergedSimSynapse(MergedOperator):
+    """Several ``SimSynapse`` operators with identical linear filters."""
+
+    def make_merged_step(self, signals, dt, rng):
+        output = self.span(signals, 'output')
+        if output is None:
+            return None
+        step_f = self.ops[0].synapse.make_step(dt, output)
+
+        input = self.span(signals, 'input')
+        if input is not None:
+            def step():
+                step_f(input)
+            return step
+
+        # -- the inputs are not adjacent (e.g., several connections from
+        #    the same node), so gather them into a buffer on each step
+        inputs = [signals[op.input] for op in self.ops]
+        if any(x.ndim != 1 for x in inputs):
+            return None
+        buf = np.empty_like(output)
+
+        def step():
+            np.concatenate(inputs, out=buf)
+            step_f(buf)
+        return step
+
+
+# Operator types that can be merged, with a function returning a key that
+# is equal for all operators of that type that can be merged together.
+# Types are listed in order of priority when laying out signals in memory.
+mergeable = collections.OrderedDict([
+    (SimNeurons, (MergedSimNeurons,
+                  lambda op: (neuron_type_key(op.neurons), len(op.states)))),
+    (DotInc, (MergedDotInc,
+              lambda op: (op.as_update, op.A.shape, op.X.shape, op.Y.shape))),
+    (ElementwiseInc, (MergedElementwiseInc,
+                      lambda op: (op.A.shape, op.X.shape, op.Y.shape))),
+    (SimSynapse, (MergedSimSynapse, lambda op: synapse_key(op.synapse))),
+    (Copy, (MergedCopy, lambda op: op.as_update)),
+    (Reset, (MergedReset, lambda op: op.value)),
+])
+
+
+def dependency_levels(dg):
+    """Returns the length of the longest path to each node of ``dg``."""
+    predecessors = reverse_edges(dg)
+    levels = {}
+    for node in toposort(dg):
+        levels[node] = max([levels[pre] + 1
+                            for pre in predecessors.get(node, ())] + [0])
+    return levels
+
+
+def fuse_operators(operators, dg):
+    """Merge compatible operators into ``MergedOperator`` instances.
+
+    Parameters
+    ----------
+    operators : list of Operator
+        The operators to fuse.
+    dg : dict
+        The dependency graph of ``operators``, as returned by
+        ``operator_depencency_graph``.
+
+    Returns
+    -------
+    list of Operator
+        The new list of operators, in which operators of the same type that
+        are at the same level of ``dg`` have been merged together. Operators
+        that could not be merged are returned unchanged.
+    """
+    levels = dependency_levels(dg)
+
+    groups = collections.OrderedDict()
+    fused = []
+    for op in operators:
+        if type(op) not in mergeable:
+            fused.append(op)
+            continue
+        key = (levels[op], type(op), mergeable[type(op)][1](op))
+        if key not in groups:
+            groups[key] = []
+            fused.append(key)
+        groups[key].append(op)
+
+    for i, item in enumerate(fused):
+        if isinstance(item, Operator):
+            continue
+        ops = groups[item]
+        merged_cls = mergeable[item[1]][0]
+        fused[i] = ops[0] if len(ops) == 1 else merged_cls(ops)
+    return fused
+
+
+def signal_layout(operators, merged_types=None):
+    """Order the signals of ``operators`` for ``SignalDict.init_arena``.
+
+    The signals of merged operators come first, ordered so that the signals
+    at the same position in each of the merged operators are adjacent
+    (e.g., the input currents of all merged ``SimNeurons``). Merged
+    operators are visited in the order of priority given by ``mergeable``,
+    since a signal can only be placed once. The signals of all remaining
+    operators follow in the order the operators were given.
+
+    Parameters
+    ----------
+    operators : list of Operator
+        The operators to be simulated, as returned by ``fuse_operators``.
+    merged_types : tuple of type, optional
+        If given, only the signals of merged operators made up of these
+        operator types (e.g., ``(SimNeurons,)``) are returned, so that
+        only these signals are placed in the arena.
+
+    Returns
+    -------
+    list of Signal
+        The signals of ``operators``, possibly with repeats.
+    """
+    priority = list(mergeable)
+    merged = sorted((op for op in operators
+                     if isinstance(op, MergedOperator) and (
+                         merged_types is None
+                         or isinstance(op.ops[0], merged_types))),
+                    key=lambda op: priority.index(type(op.ops[0])))
+
+    signals = []
+    for op in merged:
+        for attr in ('sets', 'incs', 'reads', 'updates'):
+            for sigs in zip(*[getattr(member, attr) for member in op.ops]):
+                signals.extend(sigs)
+    if merged_types is None:
+        for op in operators:
+            signals.extend(op.all_signals)
+    return signals
@@ -0,0 +1,159 @@
+"""Generating one function that simulates many timesteps.
+
+Calling the step function of every operator, setting the time, and
+recording the probes on every timestep has a Python overhead that
+dominates the simulation time of models with many small operators. The
+functions in this module generate the source code of a single function
+that runs a whole block of timesteps. The computations of simple operators
+(e.g., ``Reset``, ``Copy`` and ``DotInc``) are written out in the function,
+with all arrays they use bound to local variables. Other operators are
+run by calling their step functions.
+
+The generated code is written to be fast, rather than to mirror the step
+functions: e.g., signals are incremented with ``Y += ...``, which updates
+the array in place, instead of the slower ``Y[...] += ...``.
+"""
+
+import numpy as np
+
+from nengo.builder.neurons import SimNeurons, neuron_kernels
+from nengo.builder.operator import (
+    Copy, DotInc, ElementwiseInc, IndexedInc, PreserveValue, Reset,
+    reshape_dot)
+from nengo.utils.compat import range
+
+
+def inline_reset(op, signals, dt, bind):
+    return ["%s(%s)" % (bind(signals[op.dst].fill), bind(op.value))]
+
+
+def inline_copy(op, signals, dt, bind):
+    return ["%s[...] = %s" % (bind(signals[op.dst]), bind(signals[op.src]))]
+
+
+def inline_elementwiseinc(op, signals, dt, bind):
+    return ["%s += %s * %s" % (
+        bind(signals[op.Y]), bind(signals[op.A]), bind(signals[op.X]))]
+
+
+def inline_indexedinc(op, signals, dt, bind):
+    X, Y = signals[op.X], signals[op.Y]
+    x = (bind(X[op.x_index]) if isinstance(op.x_index, slice) else
+         "%s[%s]" % (bind(X), bind(op.x_index)))
+    y = (bind(Y[op.y_index]) if isinstance(op.y_index, slice) else
+         "%s[%s]" % (bind(Y), bind(op.y_index)))
+    return ["%s += %s * %s" % (y, bind(signals[op.A]), x)]
+
+
+def inline_dotinc(op, signals, dt, bind):
+    A, X, Y = signals[op.A], signals[op.X], signals[op.Y]
+    if reshape_dot(A, X, Y, op.tag):
+        return ["%s += %s(%s(%s, %s)).reshape(%s)" % (
+            bind(Y), bind(np.asarray), bind(np.dot), bind(A), bind(X),
+            bind(Y.shape))]
+    return ["%s += %s(%s, %s)" % (
+        bind(Y), bind(np.dot), bind(A), bind(X))]
+
+
+def inline_simneurons(op, signals, dt, bind):
+    if type(op.neurons) in neuron_kernels:
+        return None  # -- the step function has its own workspace
+    args = [bind(dt), bind(signals[op.J]), bind(signals[op.output])]
+    args.extend(bind(signals[state]) for state in op.states)
+    return ["%s(%s)" % (bind(op.neurons.step_math), ", ".join(args))]
+
+
+def inline_preservevalue(op, signals, dt, bind):
+    return []
+
+
+# Functions returning the lines of source code that carry out the step of
+# an operator, for operators without state outside of their signals (or
+# None, if the step function of the operator should be called instead)
+inline_steps = {
+    Copy: inline_copy,
+    DotInc: inline_dotinc,
+    ElementwiseInc: inline_elementwiseinc,
+    IndexedInc: inline_indexedinc,
+    PreserveValue: inline_preservevalue,
+    Reset: inline_reset,
+    SimNeurons: inline_simneurons,
+}
+
+
+def compile_plan(operators, steps, signals, dt, probe_periods,
+                 scheduler=None, inline=True):
+    """Generate a function simulating a block of timesteps.
+
+    The returned function ``plan(sim, n_steps)`` runs ``n_steps`` steps
+    of the simulator ``sim``, starting from ``sim.n_steps``. Each step does
+    the same as ``Simulator.step``, except that NumPy's error handling is
+    not changed (the caller should call ``np.seterr`` once for all steps).
+    The source code of the function is available as ``plan.source``.
+
+    Parameters
+    ----------
+    operators : list of Operator
+        The operators, in the order in which they are run.
+    steps : list of callable
+        The step function of each operator.
+    signals : SignalDict
+        The signals of the simulator.
+    dt : float
+        The simulation timestep.
+    probe_periods : list of float or None
+        The sampling period of each probe, in steps (None to sample every
+        step). The probe buffers and signals are taken from ``sim._probes``
+        each time the plan is called, so they can change between calls.
+    scheduler : callable, optional
+        If given, this is called to run all operators in each step,
+        instead of running them one after another.
+    inline : bool, optional
+        Whether to write out the computations of simple operators in the
+        function (the default). If False, the step functions of all
+        operators are called (e.g., when they are wrapped by a profiler).
+    """
+    env = {}
+    names = {}
+
+    def bind(obj):
+        """Returns the name of a local variable holding ``obj``."""
+        key = id(obj)
+        if key not in names:
+            names[key] = '_%d' % len(names)
+            env[names[key]] = obj
+        return names[key]
+
+    body = ["%s[...] = n * %s" % (bind(signals['__time__']), bind(dt))]
+    if scheduler is not None:
+        body.append("%s()" % bind(scheduler))
+    else:
+        for op, step_fn in zip(operators, steps):
+            lines = (inline_steps[type(op)](op, signals, dt, bind)
+                     if inline and type(op) in inline_steps else None)
+            body.extend(["%s()" % bind(step_fn)] if lines is None else lines)
+    for i, period in enumerate(probe_periods):
+        line = "probe%d(signal%d)" % (i, i)
+        body.append(line if period is None else "if n %% %s < 1: %s" % (
+            bind(period), line))
+
+    lines = ["def plan(sim, n_steps):"]
+    lines.extend("    %s = env['%s']" % (name, name)
+                 for name in sorted(env))
+    lines.extend("    probe%d = sim._probes[%d][0].append\n"
+                 "    signal%d = sim._probes[%d][1]" % (i, i, i, i)
+                 for i in range(len(probe_periods)))
+    lines.extend(["    n = sim.n_steps",
+                  "    try:",
+                  "        for _ in range(n_steps):",
+                  "            n += 1"])
+    lines.extend("            %s" % line for line in body)
+    lines.extend(["    finally:",
+                  "        sim.n_steps = n"])
+    source = "\n".join(lines) + "\n"
+
+    namespace = {'env': env, 'range': range}
+    exec(compile(source, '<nengo plan>', 'exec'), namespace)
+    plan = namespace['plan']
+    plan.source = source
+    return plan
@@ -0,0 +1,147 @@
+"""Running the operators of a model in parallel on a thread pool.
+
+Operators at the same level of the dependency graph do not depend on each
+other, so they can be run in any order, or at the same time. Most of the
+time of large operators is spent in NumPy routines that release the GIL
+(e.g., BLAS calls in ``DotInc``, or ufuncs in ``SimNeurons``), so running
+them in separate threads can make use of several processor cores. Small
+operators are dominated by Python overhead that holds the GIL, and gain
+nothing from being run in a thread; they are run on the main thread.
+"""
+
+import collections
+import functools
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from nengo.builder.learning_rules import SimBCM, SimOja
+from nengo.builder.neurons import SimNeurons
+from nengo.builder.operator import (
+    Copy, DotInc, ElementwiseInc, OuterInc, Reset)
+from nengo.builder.optimizer import MergedOperator, dependency_levels
+from nengo.builder.synapses import SimSynapse
+
+# Operators that spend their time in NumPy and do not draw from the
+# simulator's random number generator (which would make the order of
+# random numbers depend on thread timing). Only these are run in threads.
+threadable = (Copy, DotInc, ElementwiseInc, MergedOperator, OuterInc,
+              Reset, SimBCM, SimNeurons, SimOja, SimSynapse)
+
+
+def op_size(op):
+    """The number of signal elements accessed by ``op``, as a cost measure."""
+    return sum(sig.size for sig in op.all_signals)
+
+
+def run_steps(steps):
+    for step in steps:
+        step()
+
+
+def write_groups(ops):
+    """Group together operators that write to the same base signals.
+
+    Increments to a signal are not atomic, so operators incrementing the
+    same signal must not run at the same time.
+    """
+    groups = []
+    owner = {}  # -- map from base signal to index of its group
+    for op in ops:
+        bases = set(sig.base for sig in op.sets + op.incs + op.updates)
+        indices = sorted(set(owner[base] for base in bases if base in owner))
+        if len(indices) == 0:
+            indices = [len(groups)]
+            groups.append([])
+        i = indices[0]
+        for j in indices[1:]:
+            groups[i].extend(groups[j])
+            groups[j] = []
+            for base in [b for b, k in owner.items() if k == j]:
+                owner[base] = i
+        groups[i].append(op)
+        for base in bases:
+            owner[base] = i
+    return [group for group in groups if len(group) > 0]
+
+
+class LevelScheduler(object):
+    """Runs operator step functions level by level, using a thread pool.
+
+    In each level of the dependency graph, the operators are split into
+    groups that write to different signals. Groups of ``threadable``
+    operators that access at least ``threshold`` signal elements are
+    distributed over ``n_workers`` tasks of roughly equal cost, which are
+    run on the thread pool. All other groups are run on the main thread,
+    while the tasks are running.
+
+    Parameters
+    ----------
+    operators : list of Operator
+        The operators to run, in a valid order.
+    steps : list of callable
+        The step function of each operator.
+    dg : dict
+        The dependency graph of ``operators``.
+    n_workers : int
+        The number of threads in the thread pool.
+    threshold : int
+        The minimum number of signal elements a group of operators has to
+        access to be run on the thread pool.
+    """
+
+    def __init__(self, operators, steps, dg, n_workers, threshold):
+        self.n_workers = n_workers
+        self.threshold = threshold
+
+        step_fns = dict(zip(operators, steps))
+        levels = dependency_levels(dg)
+        by_level = collections.defaultdict(list)
+        for op in operators:
+            by_level[levels[op]].append(op)
+
+        self.levels = []
+        for level in sorted(by_level):
+            main, tasks = self.partition(by_level[level])
+            self.levels.append((
+                [step_fns[op] for op in main],
+                [[step_fns[op] for op in task] for task in tasks]))
+
+        self.pool = ThreadPool(n_workers, initializer=functools.partial(
+            np.seterr, invalid='raise', divide='ignore'))
+
+    def partition(self, ops):
+        """Split ``ops`` into operators for the main thread and tasks."""
+        main, heavy = [], []
+        for group in write_groups(ops):
+            size = sum(op_size(op) for op in group)
+            if (size >= self.threshold
+                    and all(isinstance(op, threadable) for op in group)):
+                heavy.append((size, group))
+            else:
+                main.extend(group)
+
+        if len(heavy) == 1 and len(main) == 0:
+            # -- nothing to run at the same time
+            return heavy[0][1], []
+
+        # -- assign the largest groups first, each to the smallest task
+        tasks = [[0, []] for _ in range(min(self.n_workers, len(heavy)))]
+        for size, group in sorted(heavy, key=lambda x: -x[0]):
+            task = min(tasks, key=lambda x: x[0])
+            task[0] += size
+            task[1].extend(group)
+        return main, [group for _, group in tasks]
+
+    def __call__(self):
+        for main, tasks in self.levels:
+            results = [self.pool.apply_async(run_steps, (task,))
+                       for task in tasks]
+            run_steps(main)
+            for result in results:
+                result.get()
+
+    def close(self):
+        """Stop the threads of the thread pool."""
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,353 @@
+"""Saving built models to disk and loading them without rebuilding.
+
+A built ``Model`` refers to the objects of the network it was built from
+(e.g., ``model.params`` is keyed by ensembles and connections, and
+``SimNeurons`` operators refer to the neuron types of ensembles). These
+objects are not stored in the file. Instead, the objects of a network are
+put in a canonical order by ``network_objects``, and the file refers to them
+by their position in this order. When loading a model, the same network has
+to be passed in, so that these references can be resolved. A fingerprint of
+the network is stored in the file to make sure that this is the case.
+
+The file format is similar to the Nengo cache object (NCO) format:
+
+* A header consisting of:
+    * 3 bytes with the magic string 'NMF'
+    * 1 unsigned byte indicating the protocol version
+    * unsigned long long ints denoting the start and end of the metadata,
+      the start and end of the model data, and the start of the array data
+* The metadata (Nengo version, network fingerprint, and a table of the
+  arrays in the array data), pickled using the highest protocol.
+* The model data, pickled using the highest protocol.
+* The array data. Each large array is stored as raw C-contiguous data,
+  aligned to ``ALIGNMENT`` bytes, so that it can be memory-mapped.
+
+Large arrays are memory-mapped when loading a model, so that several
+processes loading the same model share the memory holding them. Arrays of
+signals that no operator writes to are mapped read-only; other arrays are
+mapped copy-on-write.
+"""
+
+import hashlib
+from io import BytesIO
+import struct
+import types
+
+import numpy as np
+
+from nengo.base import NengoObject
+from nengo.connection import Connection
+from nengo.ensemble import Ensemble
+from nengo.network import Network
+from nengo.params import is_param
+from nengo.utils.cache import byte_align
+from nengo.utils.compat import ensure_bytes, is_number, is_string, pickle
+from nengo.version import version
+
+MAGIC_STRING = ensure_bytes('NMF')
+SUPPORTED_PROTOCOLS = [0]
+HEADER_FORMAT = '<{0}sBQQQQQ'.format(len(MAGIC_STRING))
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ALIGNMENT = 64
+
+# Arrays with fewer bytes than this are stored with the pickled model data
+MMAP_THRESHOLD = 1024
+
+
+def is_primitive(obj):
+    return (obj is None or isinstance(obj, (bool, slice)) or is_number(obj)
+            or is_string(obj) or isinstance(obj, bytes))
+
+
+def network_objects(network):  # noqa: C901
+    """Returns the objects of ``network`` that a built model refers to.
+
+    These are the network and all of its objects, as well as the values of
+    their parameters (e.g., neuron types, synapses and functions), the
+    ``Neurons`` of ensembles, and the ``LearningRule`` objects of
+    connections. The order is the same every time a network is created.
+    """
+    objects = []
+    seen = set()
+
+    def add(obj):
+        if is_primitive(obj) or id(obj) in seen:
+            return
+        seen.add(id(obj))
+        objects.append(obj)
+        if isinstance(obj, (list, tuple)):
+            for x in obj:
+                add(x)
+        elif isinstance(obj, dict):
+            for key in sorted(obj, key=str):
+                add(obj[key])
+
+    def add_network(network):
+        add(network)
+        for obj_type in sorted(network.objects, key=lambda t: t.__name__):
+            for obj in network.objects[obj_type]:
+                if isinstance(obj, Network):
+                    add_network(obj)
+                    continue
+                add(obj)
+                for attr in sorted(obj.params):
+                    add(getattr(obj, attr))
+                if isinstance(obj, Ensemble):
+                    add(obj.neurons)
+                elif isinstance(obj, Connection):
+                    add(obj.learning_rule)
+
+    add_network(network)
+    return objects
+
+
+def network_fingerprint(network, objects=None):  # noqa: C901
+    """Returns a hash of the structure and parameters of ``network``.
+
+    Functions are hashed by their name and code, including the constants
+    and the names of the globals and attributes that the code uses.
+    Changing the values of variables that a function refers to does not
+    change the fingerprint.
+    """
+    if objects is None:
+        objects = network_objects(network)
+    refs = dict((id(obj), i) for i, obj in enumerate(objects))
+    h = hashlib.sha1()
+    visiting = set()
+
+    def update(obj, top=False):
+        if is_primitive(obj):
+            h.update(ensure_bytes(repr(obj)))
+        elif id(obj) in refs and not top:
+            h.update(ensure_bytes('ref %d' % refs[id(obj)]))
+        elif isinstance(obj, np.ndarray):
+            h.update(ensure_bytes('%s%s' % (obj.dtype.str, obj.shape)))
+            if obj.dtype.hasobject:
+                for x in obj.flat:
+                    update(x)
+            else:
+                h.update(np.ascontiguousarray(obj).data)
+        elif id(obj) in visiting:
+            h.update(ensure_bytes('cycle'))
+        else:
+            visiting.add(id(obj))
+            update_object(obj)
+            visiting.remove(id(obj))
+
+    def update_object(obj):
+        h.update(ensure_bytes(type(obj).__name__))
+        if isinstance(obj, (list, tuple)):
+            for x in obj:
+                update(x)
+        elif isinstance(obj, dict):
+            for key in sorted(obj, key=str):
+                update(key)
+                update(obj[key])
+        elif isinstance(obj, Network):
+            update(obj.label)
+            update(obj.seed)
+        elif isinstance(obj, NengoObject):
+            for attr in sorted(obj.params):
+                update(attr)
+                update(getattr(obj, attr))
+        elif isinstance(obj, (types.FunctionType, types.MethodType)):
+            update(getattr(obj, '__module__', None))
+            update(obj.__name__)
+            update(obj.__code__)
+        elif isinstance(obj, types.CodeType):
+            update(obj.co_code)
+            update(obj.co_consts)  # -- includes the code of nested functions
+            update(obj.co_names)
+        elif isinstance(obj, type) or callable(obj) and not hasattr(
+                obj, '__dict__'):
+            # -- classes and builtin functions
+            update(getattr(obj, '__module__', None))
+            update(getattr(obj, '__name__', None))
+        else:
+            cls = type(obj)
+            attrs = set(attr for attr in dir(cls)
+                        if is_param(getattr(cls, attr, None)))
+            attrs.update(getattr(obj, '__dict__', ()))
+            for attr in sorted(attrs):
+                update(attr)
+                update(getattr(obj, attr))
+
+    for obj in objects:
+        update(obj, top=True)
+    return h.hexdigest()
+
+
+def constant_arrays(model):
+    """Returns the ids of the signal arrays that no operator writes to."""
+    arrays = set(id(sig.base.value) for op in model.operators
+                 for sig in op.all_signals)
+    return arrays.difference(id(sig.base.value) for op in model.operators
+                             for sig in op.sets + op.incs + op.updates)
+
+
+def write_model(fileobj, model):  # noqa: C901
+    """Writes a built model to a file.
+
+    Parameters
+    ----------
+    fileobj : file-like object
+        File object to write the model to.
+    model : Model
+        The built model. Only the objects of the network that the model
+        was built from (``model.toplevel``) can be referred to by the model.
+    """
+    network = model.toplevel
+    if network is None:
+        raise ValueError("Only models built from a network can be saved")
+    objects = network_objects(network)
+    refs = dict((id(obj), i) for i, obj in enumerate(objects))
+    constant = constant_arrays(model)
+
+    arrays = []
+    blobs = {}
+
+    built = {}  # -- objects created by the builder (e.g., for probes)
+
+    def persistent_id(obj):
+        if id(obj) in refs:
+            return ('object', refs[id(obj)])
+        elif isinstance(obj, Network):
+            raise ValueError("%s is not part of the network %s" % (
+                obj, network))
+        elif isinstance(obj, NengoObject):
+            if id(obj) in built:
+                return ('built', built[id(obj)])
+            built[id(obj)] = len(built)
+            cls = type(obj)
+            params = dict((attr, getattr(cls, attr).data[obj])
+                          for attr in obj.params
+                          if obj in getattr(cls, attr).data)
+            return ('built', built[id(obj)], cls, params, obj.__dict__)
+        elif not isinstance(obj, np.ndarray) or obj.dtype.hasobject:
+            return None
+
+        readonly = not obj.flags.writeable
+        if obj.nbytes < MMAP_THRESHOLD:
+            return ('inline', obj.dtype.str, obj.shape, readonly,
+                    np.ascontiguousarray(obj).tobytes())
+        if id(obj) not in blobs:
+            blobs[id(obj)] = len(arrays)
+            arrays.append((obj, readonly or id(obj) in constant))
+        return ('array', blobs[id(obj)])
+
+    state = dict(model.__dict__)
+    del state['decoder_cache'], state['config']
+    # -- probe outputs are set up by the simulator
+    state['params'] = dict(model.params)
+    for probe in model.probes:
+        state['params'][probe] = []
+
+    model_data = pickle_dumps(state, persistent_id)
+
+    offset = 0
+    table = []
+    for array, readonly in arrays:
+        table.append((offset, array.dtype.str, array.shape, readonly))
+        offset = byte_align(offset + array.nbytes, ALIGNMENT)
+    metadata = pickle_dumps({'version': version,
+                             'fingerprint': network_fingerprint(
+                                 network, objects),
+                             'arrays': table})
+
+    meta_start = HEADER_SIZE
+    meta_end = meta_start + len(metadata)
+    model_end = meta_end + len(model_data)
+    data_start = byte_align(model_end, ALIGNMENT)
+    fileobj.write(struct.pack(HEADER_FORMAT, MAGIC_STRING, 0, meta_start,
+                              meta_end, meta_end, model_end, data_start))
+    fileobj.write(metadata)
+    fileobj.write(model_data)
+    for (array, _), (offset, _, _, _) in zip(arrays, table):
+        fileobj.write(b'\0' * (data_start + offset - fileobj.tell()))
+        fileobj.write(np.ascontiguousarray(array).data)
+
+
+def read_model(filename, network):  # noqa: C901
+    """Reads a model written by ``write_model``.
+
+    Parameters
+    ----------
+    filename : str
+        The file to read from.
+    network : Network
+        The network that the model was built from.
+
+    Returns
+    -------
+    dict
+        The attributes of the model, except for the decoder cache and the
+        config.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise IOError("Not a Nengo model file.")
+        (magic, protocol, meta_start, meta_end, model_start, model_end,
+         data_start) = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC_STRING:
+            raise IOError("Not a Nengo model file.")
+        if protocol not in SUPPORTED_PROTOCOLS:
+            raise IOError("Model file protocol version {0} is not "
+                          "supported.".format(protocol))
+
+        f.seek(meta_start)
+        metadata = pickle.loads(f.read(meta_end - meta_start))
+        if metadata['version'] != version:
+            raise ValueError(
+                "The model was saved by Nengo %s, but this is Nengo %s. "
+                "Please rebuild the model." % (metadata['version'], version))
+        objects = network_objects(network)
+        if metadata['fingerprint'] != network_fingerprint(network, objects):
+            raise ValueError("The network does not match the network that "
+                             "the model was built from.")
+
+        f.seek(model_start)
+        model_data = f.read(model_end - model_start)
+
+    built = []
+
+    def persistent_load(pid):
+        kind = pid[0]
+        if kind == 'object':
+            return objects[pid[1]]
+        elif kind == 'built':
+            if len(pid) > 2:
+                _, _, cls, params, attrs = pid
+                obj = cls.__new__(cls)
+                obj.__dict__.update(attrs)
+                for attr, value in params.items():
+                    getattr(cls, attr).data[obj] = value
+                built.append(obj)
+            return built[pid[1]]
+        elif kind == 'inline':
+            _, dtype, shape, readonly, data = pid
+            array = np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+        else:
+            offset, dtype, shape, readonly = metadata['arrays'][pid[1]]
+            array = np.memmap(filename, dtype=dtype, shape=shape,
+                              mode='r' if readonly else 'c',
+                              offset=data_start + offset).view(np.ndarray)
+        array.setflags(write=not readonly)
+        return array
+
+    return pickle_loads(model_data, persistent_load)
+
+
+def pickle_dumps(obj, persistent_id=None):
+    f = BytesIO()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    if persistent_id is not None:
+        pickler.persistent_id = persistent_id
+    pickler.dump(obj)
+    return f.getvalue()
+
+
+def pickle_loads(data, persistent_load):
+    unpickler = pickle.Unpickler(BytesIO(data))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
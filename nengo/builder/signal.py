@@ -32,6 +32,8 @@ THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import collections
+
 import numpy as np
 
 import nengo.utils.numpy as npext
@@ -357,8 +359,24 @@ class SignalDict(dict):
     these arrays never get copied, which wastes time and space.
 
     Use ``init`` to set the ndarray initially.
+
+    If ``dtype`` is given as a keyword argument, the arrays of all
+    floating-point signals are allocated with that dtype (e.g., float32),
+    and their initial values are cast to it.
     """
 
+    def __init__(self, *args, **kwargs):
+        dtype = kwargs.pop('dtype', None)
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        super(SignalDict, self).__init__(*args, **kwargs)
+
+    def value_dtype(self, signal):
+        """The dtype of the array allocated for ``signal``."""
+        dtype = signal.base.dtype
+        if self.dtype is not None and np.issubdtype(dtype, np.floating):
+            return self.dtype
+        return dtype
+
     def __getitem__(self, obj):
         """SignalDict overrides __getitem__ for two reasons.
 
@@ -371,16 +389,12 @@ class SignalDict(dict):
             # look up views as a fallback
             # --work around numpy's special case behaviour for scalars
             base_array = self[obj.base]
-            try:
-                # for some installations, this works
-                itemsize = int(obj.dtype.itemsize)
-            except TypeError:
-                # other installations, this...
-                itemsize = int(obj.dtype().itemsize)
+            # -- the array can have a different dtype than the signal
+            itemsize = int(base_array.itemsize)
             byteoffset = itemsize * obj.offset
             bytestrides = [itemsize * s for s in obj.elemstrides]
             view = np.ndarray(shape=obj.shape,
-                              dtype=obj.dtype,
+                              dtype=base_array.dtype,
                               buffer=base_array.data,
                               offset=byteoffset,
                               strides=bytestrides)
@@ -408,9 +422,44 @@ class SignalDict(dict):
 
     def init(self, signal):
         """Set up a permanent mapping from signal -> ndarray."""
-        # Make a copy of base.value to start
-        val = npext.array(signal.base.value, readonly=signal.readonly)
-        dict.__setitem__(self, signal.base, val)
+        base = signal.base
+        dtype = self.value_dtype(base)
+        if base.readonly and dtype == base.dtype:
+            # Read-only values cannot change, so they can be shared
+            val = base.value
+        else:
+            # Make a copy of base.value to start
+            val = npext.array(base.value, dtype=dtype, readonly=base.readonly)
+        dict.__setitem__(self, base, val)
+
+    def init_arena(self, signals):
+        """Set up mappings for many signals backed by shared buffers.
+
+        The base signals of ``signals`` are allocated one after another,
+        in the given order, in a single contiguous buffer for each dtype.
+        Read-only signals are kept in a separate buffer, so that adjacent
+        writeable signals can be operated on through a single view.
+        Signals that have already been initialized are skipped.
+        """
+        groups = collections.OrderedDict()
+        seen = set()
+        for sig in signals:
+            base = sig.base
+            if base in self or base in seen:
+                continue
+            seen.add(base)
+            groups.setdefault(
+                (self.value_dtype(base), base.readonly), []).append(base)
+
+        for (dtype, readonly), bases in groups.items():
+            buf = np.empty(sum(base.size for base in bases), dtype=dtype)
+            offset = 0
+            for base in bases:
+                val = buf[offset:offset + base.size].reshape(base.shape)
+                val[...] = base.value
+                val.setflags(write=not readonly)
+                dict.__setitem__(self, base, val)
+                offset += base.size
 
     def reset(self, signal):
         """Reset ndarray to the base value of the signal that maps to it"""
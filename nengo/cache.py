@@ -1,18 +1,29 @@
 """Caching capabilities for a faster build process."""
 
+import collections
+import contextlib
 import hashlib
 import inspect
 import logging
 import os
 import struct
+import tempfile
+import threading
+import time
 
 import numpy as np
 
+import nengo.utils.numpy as npext
 from nengo.rc import rc
 from nengo.utils.cache import byte_align, bytes2human, human2bytes
 from nengo.utils.compat import is_string, pickle, PY2
 from nengo.utils import nco
 
+try:
+    import fcntl
+except ImportError:  # no fcntl on Windows
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,6 +51,17 @@ def safe_remove(path):
         logger.warning("OSError during safe_remove: %s", err)
 
 
+def replace(src, dst):
+    """Renames ``src`` to ``dst``, replacing ``dst`` if it exists.
+
+    Unlike rewriting ``dst`` in place, this leaves the data seen by any
+    existing memory maps of ``dst`` untouched.
+    """
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)  # -- rename does not replace on Windows
+    os.rename(src, dst)
+
+
 class Fingerprint(object):
     """Fingerprint of an object instance.
 
@@ -68,6 +90,212 @@ class Fingerprint(object):
         return self.fingerprint.hexdigest()
 
 
+class LRUCache(object):
+    """In-memory cache that evicts the least recently used items.
+
+    Items are evicted when the total size of the cached items exceeds the
+    limit. Items larger than the limit are not cached. The cache can be
+    used from several threads at once.
+
+    Parameters
+    ----------
+    limit : int
+        Maximum total size of the cached items in bytes.
+
+    Attributes
+    ----------
+    hits : int
+        The number of calls to ``get`` that found the key.
+    misses : int
+        The number of calls to ``get`` that did not find the key.
+    size_in_bytes : int
+        The total size of the cached items.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.size_in_bytes = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Returns the item stored for ``key``, or None."""
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value, nbytes = self._items.pop(key)
+            self._items[key] = (value, nbytes)  # -- most recently used
+            return value
+
+    def put(self, key, value, nbytes):
+        """Stores ``value`` of size ``nbytes`` for ``key``."""
+        if nbytes > self.limit:
+            return
+        with self._lock:
+            if key in self._items:
+                self.size_in_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, nbytes)
+            self.size_in_bytes += nbytes
+            while self.size_in_bytes > self.limit:
+                _, (_, size) = self._items.popitem(last=False)
+                self.size_in_bytes -= size
+
+    def clear(self):
+        """Removes all items (but does not reset the counters)."""
+        with self._lock:
+            self._items.clear()
+            self.size_in_bytes = 0
+
+
+class CacheIndex(object):
+    """Persistent index of the sizes and access times of cached files.
+
+    The index is kept in a file, to which a line ``key size atime`` is
+    appended whenever a file is written or read, so that updating the index
+    takes constant time. The file is rewritten with only the current
+    entries by ``save`` (e.g., after files have been removed). If the
+    file is missing or cannot be parsed, the index is rebuilt from the
+    files found by ``scan``. Errors when writing the file are logged and
+    otherwise ignored, so that a read-only cache can still be used.
+
+    Since several processes may use the same cache, the index is read and
+    changed while holding a lock on a lock file next to it (see
+    ``locked``): appending takes a shared lock, and reading and rewriting
+    the index takes an exclusive lock, so that no lines appended by other
+    processes are lost when it is rewritten. File locks are not available
+    on Windows, where only threads of the same process are synchronized.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the index file.
+    scan : callable
+        Called without arguments to rebuild the index, returning an iterable
+        of ``(key, size, atime)`` tuples for all cached files.
+    """
+
+    _HEADER = 'nengo decoder cache index 0\n'
+
+    def __init__(self, filename, scan):
+        self.filename = filename
+        self.scan = scan
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def locked(self, exclusive=True):
+        """Context manager locking the index for this thread and process.
+
+        ``load`` and ``save`` have to be called with an exclusive lock.
+        """
+        with self._lock:
+            lockfile = None
+            if fcntl is not None:
+                try:
+                    lockfile = open(self.filename + '.lock', 'a')
+                    fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX
+                                if exclusive else fcntl.LOCK_SH)
+                except (IOError, OSError) as err:
+                    logger.warning("Could not lock cache index: %s", err)
+            try:
+                yield
+            finally:
+                if lockfile is not None:
+                    lockfile.close()  # -- releases the lock
+
+    def size_in_bytes(self):
+        with self.locked():
+            return sum(size for size, _ in self.load().values())
+
+    def update(self, key, size, atime=None):
+        """Records that the file for ``key`` was written or read."""
+        if atime is None:
+            atime = time.time()
+        line = "%s %d %r\n" % (key, size, atime)
+        if os.path.exists(self.filename):
+            with self.locked(exclusive=False):
+                self._append(line)
+        else:
+            with self.locked():
+                self.load()  # -- rebuild, so that the file gets a header
+                self._append(line)
+
+    def clear(self):
+        with self.locked():
+            self.save(collections.OrderedDict())
+
+    def load(self):
+        """Returns an OrderedDict mapping keys to ``(size, atime)``.
+
+        The least recently accessed files come first. Since other processes
+        may use the same cache, the entries are read from the file on every
+        call.
+        """
+        entries = collections.OrderedDict()
+        try:
+            with open(self.filename, 'r') as f:
+                if f.readline() != self._HEADER:
+                    raise ValueError("invalid header")
+                for line in f:
+                    key, size, atime = line.split()
+                    entries.pop(key, None)
+                    entries[key] = (int(size), float(atime))
+        except (IOError, OSError, ValueError) as err:
+            logger.info("Rebuilding cache index (%s)", err)
+            entries = collections.OrderedDict(
+                (key, (size, atime)) for key, size, atime in sorted(
+                    self.scan(), key=lambda entry: entry[2]))
+            self.save(entries)
+        return entries
+
+    def save(self, entries):
+        """Rewrites the index file with the given entries."""
+        tmp = "%s.%d.tmp" % (self.filename, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self._HEADER)
+                for key, (size, atime) in entries.items():
+                    f.write("%s %d %r\n" % (key, size, atime))
+            replace(tmp, self.filename)
+        except (IOError, OSError) as err:
+            logger.warning("Could not write cache index: %s", err)
+            safe_remove(tmp)
+
+    def _append(self, line):
+        try:
+            with open(self.filename, 'a') as f:
+                f.write(line)
+        except (IOError, OSError) as err:
+            logger.warning("Could not update cache index: %s", err)
+
+
+_memory_caches = {}
+_memory_caches_lock = threading.Lock()
+
+
+def get_memory_cache(cache_dir, limit):
+    """Returns the LRUCache shared by decoder caches of ``cache_dir``.
+
+    All ``DecoderCache`` instances in a process that use the same directory
+    and memory size share their results kept in memory, so that a new
+    simulator does not read the results of earlier ones from disk again.
+    """
+    key = (os.path.abspath(cache_dir), limit)
+    with _memory_caches_lock:
+        if key not in _memory_caches:
+            _memory_caches[key] = LRUCache(limit)
+        return _memory_caches[key]
+
+
 class DecoderCache(object):
     """Cache for decoders.
 
@@ -78,6 +306,22 @@ class DecoderCache(object):
     passed and attributes of the object instance. Otherwise the wrong solver
     results might get loaded from the cache.
 
+    Recently used results are also kept in memory (see :class:`LRUCache`),
+    so that repeated hits within one process do not read the file again.
+    The results in memory are shared by all decoder caches using the same
+    directory (see :func:`get_memory_cache`).
+
+    The sizes and access times of the cached files are kept in an index
+    file (see :class:`CacheIndex`), so that ``get_size_in_bytes`` and
+    ``shrink`` do not have to list and stat every file in the cache.
+
+    Decoders loaded from the cache are read-only, since they are shared with
+    the cache. By default, they are memory-mapped from the cache file, so
+    that their data are only read from disk when they are used, and no
+    copy is made of them if they are not changed. Decoders are stored in
+    Fortran order, so that their transpose, which is what the simulator
+    uses, is C-contiguous.
+
     Parameters
     ----------
     read_only : bool
@@ -87,21 +331,45 @@ class DecoderCache(object):
         Path to the directory in which the cache will be stored. It will be
         created if it does not exists. Will use the value returned by
         :func:`get_default_dir`, if `None`.
+    memory_size : int or str or None
+        Maximum size of the results kept in memory, in bytes or with a unit
+        (e.g., '64 MB'). Zero disables the memory cache. If `None`, the
+        ``memory_size`` setting of the ``decoder_cache`` RC section is used.
+    mmap : bool or None
+        Whether to memory-map decoders loaded from disk, instead of reading
+        them into memory. If `None`, the ``mmap`` setting of the
+        ``decoder_cache`` RC section is used.
+
+    Attributes
+    ----------
+    memory : LRUCache
+        The results kept in memory, with counters of hits and misses.
     """
 
     _CACHE_EXT = '.nco'
+    _INDEX = 'index'
     _LEGACY = 'legacy.txt'
     _LEGACY_VERSION = 0
 
-    def __init__(self, read_only=False, cache_dir=None):
+    def __init__(self, read_only=False, cache_dir=None, memory_size=None,
+                 mmap=None):
         self.read_only = read_only
+        self.mmap = (rc.getboolean('decoder_cache', 'mmap') if mmap is None
+                     else mmap)
         if cache_dir is None:
             cache_dir = self.get_default_dir()
         self.cache_dir = cache_dir
+        if memory_size is None:
+            memory_size = rc.get('decoder_cache', 'memory_size')
+        if is_string(memory_size):
+            memory_size = human2bytes(memory_size)
+        self.memory = get_memory_cache(cache_dir, memory_size)
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
         self._fragment_size = get_fragment_size(self.cache_dir)
         self._remove_legacy_files()
+        self._index = CacheIndex(
+            os.path.join(self.cache_dir, self._INDEX), self._scan_files)
 
     def get_files(self):
         """Returns all of the files in the cache.
@@ -124,9 +392,7 @@ class DecoderCache(object):
         -------
         int
         """
-        stats = (safe_stat(f) for f in self.get_files())
-        return sum(byte_align(st.st_size, self._fragment_size)
-                   for st in stats if st is not None)
+        return self._index.size_in_bytes()
 
     def get_size(self):
         """Returns the size of the cache with units as a string.
@@ -150,29 +416,25 @@ class DecoderCache(object):
         if is_string(limit):
             limit = human2bytes(limit)
 
-        fileinfo = []
-        excess = -limit
-        for path in self.get_files():
-            stat = safe_stat(path)
-            if stat is not None:
-                aligned_size = byte_align(stat.st_size, self._fragment_size)
-                excess += aligned_size
-                fileinfo.append((stat.st_atime, aligned_size, path))
-
-        # Remove the least recently accessed first
-        fileinfo.sort()
+        with self._index.locked():
+            entries = self._index.load()
+            excess = sum(size for size, _ in entries.values()) - limit
 
-        for _, size, path in fileinfo:
-            if excess <= 0:
-                break
+            # Remove the least recently accessed first
+            for key in list(entries):
+                if excess <= 0:
+                    break
 
-            excess -= size
-            safe_remove(path)
+                excess -= entries.pop(key)[0]
+                safe_remove(self._key2path(key, create=False))
+            self._index.save(entries)
 
     def invalidate(self):
         """Invalidates the cache (i.e. removes all cache files)."""
+        self.memory.clear()
         for path in self.get_files():
             safe_remove(path)
+        self._index.clear()
 
     def _check_legacy_file(self):
         """Checks if the legacy file is up to date."""
@@ -242,23 +504,127 @@ class DecoderCache(object):
                 E = defaults[args.index('E')]
 
             key = self._get_cache_key(solver, activities, targets, rng, E)
-            path = self._key2path(key)
-            try:
-                with open(path, 'rb') as f:
-                    solver_info, decoders = nco.read(f)
-            except:
-                logger.info("Cache miss [{0}].".format(key))
-                decoders, solver_info = solver(
-                    activities, targets, rng=rng, E=E)
-                if not self.read_only:
-                    with open(path, 'wb') as f:
-                        nco.write(f, solver_info, decoders)
-            else:
-                logger.info(
-                    "Cache hit [{0}]: Loaded stored decoders.".format(key))
-            return decoders, solver_info
+            return self.load_or_solve(
+                key, lambda: solver(activities, targets, rng=rng, E=E),
+                sparse=getattr(solver, 'sparse', False))
         return cached_solver
 
+    def load_or_solve(self, key, solve, sparse=False):
+        """Loads the results stored for a key, or solves and stores them.
+
+        Parameters
+        ----------
+        key : str
+            The cache key (e.g., as returned by ``get_build_key``).
+        solve : callable
+            Called without arguments on a cache miss, returning the decoders
+            and the solver info.
+        sparse : bool, optional
+            Whether the solver returns sparse decoders. These are stored as
+            dense arrays, and converted back when they are loaded.
+
+        Returns
+        -------
+        decoders : ndarray or scipy.sparse matrix
+            The decoders, which are read-only if they were loaded from the
+            cache (see :class:`DecoderCache`).
+        solver_info : dict
+        """
+        stored = self.memory.get(key)
+        if stored is not None:
+            logger.info("Cache hit [{0}]: Loaded stored decoders from "
+                        "memory.".format(key))
+        else:
+            stored = self._read_file(key)
+        if stored is None:
+            logger.info("Cache miss [{0}].".format(key))
+            decoders, solver_info = solve()
+            stored = (solver_info, npext.array(
+                decoders.toarray() if npext.is_spmatrix(decoders)
+                else decoders, order='F', readonly=True))
+            if not self.read_only:
+                self._write_file(key, stored)
+            self._remember(key, stored)
+            return decoders, solver_info
+
+        solver_info, decoders = dict(stored[0]), stored[1]
+        if sparse:
+            # -- sparse decoders are stored as dense arrays
+            import scipy.sparse
+            decoders = scipy.sparse.csr_matrix(decoders)
+        return decoders, solver_info
+
+    def get_build_key(self, solver, rng, arrays=(), objects=()):
+        """Returns a cache key for a solve determined by the given inputs.
+
+        Unlike the keys of ``wrap_solver``, which hash the activities and
+        targets passed to the solver, this key can be computed from the
+        (usually much smaller) inputs that determine them, such as the
+        gains, biases and encoders of the neurons, so that the activities
+        do not have to be computed on a cache hit. The caller has to make
+        sure that these inputs determine the results of the solve.
+
+        Parameters
+        ----------
+        solver : Solver
+            The solver.
+        rng : numpy.random.RandomState
+            The random number generator passed to the solver.
+        arrays : list of ndarray, optional
+            Arrays determining the results (hashed with shape and dtype).
+        objects : list, optional
+            Picklable objects determining the results (e.g., parameter
+            values), which are fingerprinted.
+        """
+        h = hashlib.sha1()
+        h.update(b'build')  # -- never equal to a key of ``wrap_solver``
+        for obj in [solver] + list(objects):
+            h.update(str(Fingerprint(obj)).encode('utf-8'))
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            h.update(str((array.dtype.str, array.shape)).encode('utf-8'))
+            h.update(array.data)
+        self._update_rng(h, rng)
+        return h.hexdigest()
+
+    def _read_file(self, key):
+        """Reads the results stored for ``key`` on disk, or returns None."""
+        try:
+            with open(self._key2path(key), 'rb') as f:
+                stored = nco.read(f, mmap=self.mmap)
+                size = os.fstat(f.fileno()).st_size
+        except:
+            return None
+        self._index.update(key, byte_align(size, self._fragment_size))
+        logger.info("Cache hit [{0}]: Loaded stored decoders.".format(key))
+        stored[1].setflags(write=False)
+        self._remember(key, stored)
+        return stored
+
+    def _write_file(self, key, stored):
+        """Stores the results for ``key`` on disk.
+
+        The file is written under a temporary name and then renamed, so that
+        decoders memory-mapped from a previous version remain valid.
+        """
+        path = self._key2path(key)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                nco.write(f, *stored)
+                size = f.tell()
+            replace(tmp, path)
+        except:
+            safe_remove(tmp)
+            raise
+        self._index.update(key, byte_align(size, self._fragment_size))
+
+    def _remember(self, key, stored):
+        solver_info, decoders = stored
+        nbytes = decoders.nbytes + sum(v.nbytes for v in solver_info.values()
+                                       if isinstance(v, np.ndarray))
+        self.memory.put(key, stored, nbytes)
+
     def _get_cache_key(self, solver, activities, targets, rng, E):
         h = hashlib.sha1()
 
@@ -270,6 +636,14 @@ class DecoderCache(object):
         h.update(np.ascontiguousarray(activities).data)
         h.update(np.ascontiguousarray(targets).data)
 
+        self._update_rng(h, rng)
+
+        if E is not None:
+            h.update(np.ascontiguousarray(E).data)
+        return h.hexdigest()
+
+    @staticmethod
+    def _update_rng(h, rng):
         # rng format doc:
         # noqa <http://docs.scipy.org/doc/numpy/reference/generated/numpy.random.RandomState.get_state.html#numpy.random.RandomState.get_state>
         state = rng.get_state()
@@ -279,18 +653,27 @@ class DecoderCache(object):
         h.update(struct.pack('q', state[3]))  # integer has_gauss
         h.update(struct.pack('d', state[4]))  # float cached_gaussian
 
-        if E is not None:
-            h.update(np.ascontiguousarray(E).data)
-        return h.hexdigest()
-
-    def _key2path(self, key):
+    def _key2path(self, key, create=True):
         prefix = key[:2]
         suffix = key[2:]
         directory = os.path.join(self.cache_dir, prefix)
-        if not os.path.exists(directory):
+        if create and not os.path.exists(directory):
             os.makedirs(directory)
         return os.path.join(directory, suffix + self._CACHE_EXT)
 
+    def _scan_files(self):
+        """Yields ``(key, size, atime)`` for all files in the cache."""
+        for path in self.get_files():
+            directory, filename = os.path.split(path)
+            if not filename.endswith(self._CACHE_EXT):
+                continue
+            stat = safe_stat(path)
+            if stat is not None:
+                key = (os.path.basename(directory) +
+                       filename[:-len(self._CACHE_EXT)])
+                yield (key, byte_align(stat.st_size, self._fragment_size),
+                       stat.st_atime)
+
 
 class NoDecoderCache(object):
     """Provides the same interface as :class:`DecoderCache` without caching."""
@@ -298,6 +681,12 @@ class NoDecoderCache(object):
     def wrap_solver(self, solver):
         return solver
 
+    def load_or_solve(self, key, solve, sparse=False):
+        return solve()
+
+    def get_build_key(self, solver, rng, arrays=(), objects=()):
+        return None
+
     def get_size_in_bytes(self):
         return 0
 
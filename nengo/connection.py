@@ -2,6 +2,7 @@ import logging
 
 import numpy as np
 
+import nengo.utils.numpy as npext
 from nengo.base import NengoObject, NengoObjectParam, ObjView
 from nengo.ensemble import Ensemble
 from nengo.learning_rules import LearningRuleType, LearningRuleTypeParam
@@ -100,6 +101,9 @@ class TransformParam(NdarrayParam):
         super(TransformParam, self).__init__(default, (), optional, readonly)
 
     def validate(self, conn, transform):
+        if npext.is_spmatrix(transform):
+            return self.validate_sparse(conn, transform)
+
         transform = np.asarray(transform, dtype=np.float64)
 
         if transform.ndim == 0:
@@ -116,18 +120,37 @@ class TransformParam(NdarrayParam):
         super(TransformParam, self).validate(conn, transform)
 
         if transform.ndim == 2:
-            # check for repeated dimensions in lists, as these don't work
-            # for two-dimensional transforms
-            repeated_inds = lambda x: (
-                not isinstance(x, slice) and np.unique(x).size != len(x))
-            if repeated_inds(conn.pre_slice):
-                raise ValueError("Input object selection has repeated indices")
-            if repeated_inds(conn.post_slice):
-                raise ValueError(
-                    "Output object selection has repeated indices")
+            self.check_slices(conn)
 
         return transform
 
+    def validate_sparse(self, conn, transform):
+        """Sparse transforms are stored as CSR matrices without duplicates.
+
+        They are always two-dimensional, i.e. (size_out, size_mid).
+        """
+        import scipy.sparse
+        transform = scipy.sparse.csr_matrix(
+            transform, dtype=np.float64, copy=True)
+        transform.sum_duplicates()
+
+        if transform.shape[0] != conn.size_out:
+            raise ValueError("shape[0] should be %d (got %d)"
+                             % (conn.size_out, transform.shape[0]))
+        self.check_slices(conn)
+        return transform
+
+    @staticmethod
+    def check_slices(conn):
+        # check for repeated dimensions in lists, as these don't work
+        # for two-dimensional transforms
+        repeated_inds = lambda x: (
+            not isinstance(x, slice) and np.unique(x).size != len(x))
+        if repeated_inds(conn.pre_slice):
+            raise ValueError("Input object selection has repeated indices")
+        if repeated_inds(conn.post_slice):
+            raise ValueError("Output object selection has repeated indices")
+
 
 class Connection(NengoObject):
     """Connects two objects together.
@@ -167,7 +190,9 @@ class Connection(NengoObject):
         Linear transform mapping the pre output to the post input.
         This transform is in terms of the sliced size; if either pre
         or post is a slice, the transform must be of shape
-        (len(pre_slice), len(post_slice)).
+        (len(pre_slice), len(post_slice)). A ``scipy.sparse`` matrix can
+        be given instead, in which case only its nonzero elements are
+        stored and used in the simulation.
     solver : Solver
         Instance of a Solver class to compute decoders or weights
         (see `nengo.solvers`). If solver.weights is True, a full
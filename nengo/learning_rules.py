@@ -1,7 +1,7 @@
 import warnings
 
 from nengo.base import NengoObjectParam
-from nengo.params import Parameter, NumberParam
+from nengo.params import IntParam, Parameter, NumberParam
 from nengo.utils.compat import is_iterable, itervalues
 
 
@@ -18,16 +18,25 @@ class LearningRuleType(object):
 
     To use a learning rule, pass it as a ``learning_rule`` keyword argument to
     the Connection on which you want to do learning.
+
+    The weight changes computed on each step can be accumulated, and applied
+    together every ``update_every`` steps. Since updating the decoders or
+    weights usually dominates the cost of learning, this makes learning
+    roughly ``update_every`` times faster, while the learning dynamics stay
+    approximately the same as long as the activities and errors change
+    slowly compared to ``update_every * dt``.
     """
 
     learning_rate = NumberParam(low=0, low_open=True)
+    update_every = IntParam(low=1)
     probeable = []
 
-    def __init__(self, learning_rate=1e-6):
+    def __init__(self, learning_rate=1e-6, update_every=1):
         if learning_rate >= 1.0:
             warnings.warn("This learning rate is very high, and can result "
                           "in floating point errors from too much current.")
         self.learning_rate = learning_rate
+        self.update_every = update_every
 
     def __repr__(self):
         return '<%s>' % self.__class__.__name__
@@ -47,11 +56,16 @@ class PES(LearningRuleType):
     learning_rate : float, optional
         A scalar indicating the rate at which decoders will be adjusted.
         Defaults to 1e-5.
+    update_every : int, optional
+        The number of steps over which weight changes are accumulated
+        before they are applied. Defaults to 1 (apply them every step).
 
     Attributes
     ----------
     learning_rate : float
         The given learning rate.
+    update_every : int
+        The number of steps between updates of the decoders.
     error_connection : Connection
         The modulatory connection created to project the error signal.
     """
@@ -60,9 +74,9 @@ class PES(LearningRuleType):
     modifies = ['Ensemble', 'Neurons']
     probeable = ['scaled_error', 'activities']
 
-    def __init__(self, error_connection, learning_rate=1e-6):
+    def __init__(self, error_connection, learning_rate=1e-6, update_every=1):
         self.error_connection = error_connection
-        super(PES, self).__init__(learning_rate)
+        super(PES, self).__init__(learning_rate, update_every)
 
 
 class BCM(LearningRuleType):
@@ -81,11 +95,16 @@ class BCM(LearningRuleType):
         Filter constant on activities of neurons in pre population.
     post_tau : float, optional
         Filter constant on activities of neurons in post population.
+    update_every : int, optional
+        The number of steps over which weight changes are accumulated
+        before they are applied. Defaults to 1 (apply them every step).
 
     Attributes
     ----------
     learning_rate : float
         The given learning rate.
+    update_every : int
+        The number of steps between updates of the weights.
     theta_tau : float
         A scalar indicating the time constant for theta integration.
     pre_tau : float
@@ -101,11 +120,11 @@ class BCM(LearningRuleType):
     probeable = ['theta', 'pre_filtered', 'post_filtered']
 
     def __init__(self, pre_tau=0.005, post_tau=None, theta_tau=1.0,
-                 learning_rate=1e-9):
+                 learning_rate=1e-9, update_every=1):
         self.theta_tau = theta_tau
         self.pre_tau = pre_tau
         self.post_tau = post_tau if post_tau is not None else pre_tau
-        super(BCM, self).__init__(learning_rate)
+        super(BCM, self).__init__(learning_rate, update_every)
 
 
 class Oja(LearningRuleType):
@@ -124,11 +143,16 @@ class Oja(LearningRuleType):
         Filter constant on activities of neurons in pre population.
     post_tau : float, optional
         Filter constant on activities of neurons in post population.
+    update_every : int, optional
+        The number of steps over which weight changes are accumulated
+        before they are applied. Defaults to 1 (apply them every step).
 
     Attributes
     ----------
     learning_rate : float
         The given learning rate.
+    update_every : int
+        The number of steps between updates of the weights.
     beta : float
         A scalar governing the amount of forgetting. Larger => more forgetting.
     pre_tau : float
@@ -144,11 +168,11 @@ class Oja(LearningRuleType):
     probeable = ['pre_filtered', 'post_filtered']
 
     def __init__(self, pre_tau=0.005, post_tau=None, beta=1.0,
-                 learning_rate=1e-6):
+                 learning_rate=1e-6, update_every=1):
         self.pre_tau = pre_tau
         self.post_tau = post_tau if post_tau is not None else pre_tau
         self.beta = beta
-        super(Oja, self).__init__(learning_rate)
+        super(Oja, self).__init__(learning_rate, update_every)
 
 
 class LearningRuleTypeParam(Parameter):
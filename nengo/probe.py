@@ -27,6 +27,16 @@ class AttributeParam(StringParam):
                              % (attr, probe.obj))
 
 
+class ProbeStorageParam(StringParam):
+    storage_types = ('memory', 'disk')
+
+    def validate(self, probe, storage):
+        super(ProbeStorageParam, self).validate(probe, storage)
+        if storage is not None and storage not in self.storage_types:
+            raise ValueError("Storage type '%s' is not one of %s"
+                             % (storage, self.storage_types))
+
+
 class ProbeSolverParam(SolverParam):
     def __set__(self, instance, value):
         if value is ConnectionDefault:
@@ -77,6 +87,11 @@ class Probe(NengoObject):
         The seed used for random number generation in the Connection.
     label : str, optional
         A name for the probe. Used for debugging and visualization.
+    storage : {'memory', 'disk'}, optional
+        Where the simulator stores the probed data. With ``'disk'``, the
+        data are written to a memory-mapped ``.npy`` file, which allows
+        recording more data than fits in memory. Defaults to the
+        ``storage`` setting in the ``[probes]`` section of the RC file.
     """
 
     target = TargetParam(nonzero_size_out=True)
@@ -86,9 +101,11 @@ class Probe(NengoObject):
     solver = ProbeSolverParam(default=ConnectionDefault)
     seed = IntParam(default=None, optional=True)
     label = StringParam(default=None, optional=True)
+    storage = ProbeStorageParam(default=None, optional=True)
 
     def __init__(self, target, attr=None, sample_every=Default,
-                 synapse=Default, solver=Default, seed=Default, label=Default):
+                 synapse=Default, solver=Default, seed=Default, label=Default,
+                 storage=Default):
         self.target = target
         self.attr = attr if attr is not None else self.obj.probeable[0]
         self.sample_every = sample_every
@@ -96,6 +113,7 @@ class Probe(NengoObject):
         self.solver = solver
         self.seed = seed
         self.label = label
+        self.storage = storage
 
     @property
     def obj(self):
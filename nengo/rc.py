@@ -37,7 +37,13 @@ RC_DEFAULTS = {
         'enabled': True,
         'readonly': False,
         'size': '512 MB',
+        'memory_size': '64 MB',
+        'mmap': True,
         'path': nengo.utils.paths.decoder_cache_dir
+    },
+    'probes': {
+        'storage': 'memory',
+        'path': '',
     }
 }
 
@@ -8,28 +8,186 @@ from __future__ import print_function
 
 from collections import Mapping
 import logging
+import os
+import shutil
+import struct
+import tempfile
 
 import numpy as np
 
 import nengo.utils.numpy as npext
 from nengo.builder import Model
+from nengo.builder.batch import (
+    BatchSignalDict, make_batch_step, make_trial_step)
+from nengo.builder.neurons import SimNeurons
+from nengo.builder.node import SimPyFunc
+from nengo.builder.optimizer import fuse_operators, signal_layout
+from nengo.builder.plan import compile_plan
+from nengo.builder.scheduler import LevelScheduler
+from nengo.builder.synapses import SimSynapse
 from nengo.builder.signal import SignalDict
 from nengo.cache import get_default_decoder_cache
-from nengo.utils.compat import range
+from nengo.rc import rc
+from nengo.snapshot import SimulatorState, Snapshot
+from nengo.utils.compat import (
+    ensure_bytes, is_integer, is_string, iteritems, range)
 from nengo.utils.graphs import toposort
+from nengo.utils.profiling import OperatorProfiler
 from nengo.utils.progress import ProgressTracker
 from nengo.utils.simulator import operator_depencency_graph
 
 logger = logging.getLogger(__name__)
 
 
+class ProbeBuffer(object):
+    """Growable array holding the samples recorded by a probe.
+
+    Samples are written into a preallocated array, which grows to hold
+    more samples as needed. ``reserve`` can be used to allocate space for
+    a known number of samples up front, so that the array does not have
+    to grow during a simulation.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of each sample.
+    dtype : np.dtype, optional
+        The data type of the samples.
+    """
+
+    def __init__(self, shape, dtype=np.float64):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.n_samples = 0
+        self._array = self._allocate(0)
+
+    def __len__(self):
+        return self.n_samples
+
+    @property
+    def capacity(self):
+        return len(self._array)
+
+    @property
+    def data(self):
+        """A read-only view of the recorded samples."""
+        view = self._array[:self.n_samples]
+        view.flags.writeable = False
+        return view
+
+    def _allocate(self, capacity):
+        return np.empty((capacity,) + self.shape, dtype=self.dtype)
+
+    def append(self, sample):
+        """Record a sample, growing the buffer if it is full."""
+        if self.n_samples == self.capacity:
+            self.reserve(1)
+        self._array[self.n_samples] = sample
+        self.n_samples += 1
+
+    def clear(self):
+        """Discard all samples, keeping the allocated memory."""
+        self.n_samples = 0
+
+    def extend(self, samples):
+        """Record several samples at once."""
+        self.reserve(len(samples))
+        self._array[self.n_samples:self.n_samples + len(samples)] = samples
+        self.n_samples += len(samples)
+
+    def truncate(self, n_samples):
+        """Discard all but the first ``n_samples`` samples."""
+        self.n_samples = min(self.n_samples, n_samples)
+
+    def flush(self):
+        """Write the samples to permanent storage, if any."""
+        pass
+
+    def reserve(self, n_samples):
+        """Make sure there is room for ``n_samples`` more samples.
+
+        To keep the number of reallocations low, the buffer at least
+        doubles in size whenever it has to grow.
+        """
+        required = self.n_samples + n_samples
+        if required > self.capacity:
+            array = self._allocate(max(required, 2 * self.capacity))
+            array[:self.n_samples] = self._array[:self.n_samples]
+            self._array = array
+
+
+class MemmapProbeBuffer(ProbeBuffer):
+    """Probe buffer storing the samples in a memory-mapped ``.npy`` file.
+
+    The file is written with a fixed-size header, which is rewritten by
+    ``flush`` to contain the number of recorded samples. After a flush,
+    the file can be loaded with ``np.load``, even if the simulation is
+    interrupted later on. Space for samples beyond those recorded may be
+    allocated at the end of the file; it is ignored when loading.
+
+    Parameters
+    ----------
+    filename : str
+        The ``.npy`` file in which to store the samples.
+    shape : tuple
+        The shape of each sample.
+    dtype : np.dtype, optional
+        The data type of the samples.
+    """
+
+    header_size = 128  # bytes, including magic string and header length
+
+    def __init__(self, filename, shape, dtype=np.float64):
+        self.filename = filename
+        super(MemmapProbeBuffer, self).__init__(shape, dtype)
+
+    def _allocate(self, capacity):
+        if capacity == 0:
+            with open(self.filename, 'wb') as f:
+                self._write_header(f)
+            return np.empty((0,) + self.shape, dtype=self.dtype)
+
+        size = capacity * int(np.prod(self.shape)) * self.dtype.itemsize
+        with open(self.filename, 'r+b') as f:
+            f.truncate(self.header_size + size)
+        return np.memmap(self.filename, dtype=self.dtype, mode='r+',
+                         offset=self.header_size,
+                         shape=(capacity,) + self.shape)
+
+    def reserve(self, n_samples):
+        # -- the data up to the old capacity are already in the file
+        if self.n_samples + n_samples > self.capacity:
+            self.flush()
+            self._array = self._allocate(
+                max(self.n_samples + n_samples, 2 * self.capacity))
+
+    def _write_header(self, f):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(self.dtype),
+            (self.n_samples,) + self.shape)
+        magic = np.lib.format.magic(1, 0)
+        header_len = self.header_size - len(magic) - 2
+        if len(header) >= header_len:
+            raise ValueError("Header for %s is too long" % self.filename)
+        f.write(magic)
+        f.write(struct.pack('<H', header_len))
+        f.write(ensure_bytes(header.ljust(header_len - 1) + '\n'))
+
+    def flush(self):
+        """Write the recorded samples and the header to disk."""
+        if isinstance(self._array, np.memmap):
+            self._array.flush()
+        with open(self.filename, 'r+b') as f:
+            self._write_header(f)
+
+
 class ProbeDict(Mapping):
     """Map from Probe -> ndarray
 
     This is more like a view on the dict that the simulator manipulates.
-    However, for speed reasons, the simulator uses Python lists,
-    and we want to return NumPy arrays. Additionally, this mapping
-    is readonly, which is more appropriate for its purpose.
+    The simulator records samples in ``ProbeBuffer`` objects, and we
+    return read-only views of the recorded samples, which avoids copying.
+    Python lists are also accepted, and converted to arrays.
     """
 
     def __init__(self, raw):
@@ -37,7 +195,9 @@ class ProbeDict(Mapping):
 
     def __getitem__(self, key):
         rval = self.raw[key]
-        if isinstance(rval, list):
+        if isinstance(rval, ProbeBuffer):
+            rval = rval.data
+        elif isinstance(rval, list):
             rval = np.asarray(rval)
             rval.flags.writeable = False
         return rval
@@ -55,10 +215,36 @@ class ProbeDict(Mapping):
         return len(self.raw)
 
 
+class BatchProbeDict(ProbeDict):
+    """Map from Probe -> ndarray with a leading trial axis
+
+    The simulator records one ``(n_trials, ...)`` array per sample, so the
+    first two axes are swapped to give ``(n_trials, n_samples, ...)``.
+    This is a view, so the data are still not copied.
+    """
+
+    def __init__(self, raw, n_trials):
+        super(BatchProbeDict, self).__init__(raw)
+        self.n_trials = n_trials
+
+    def __getitem__(self, key):
+        rval = self.raw[key]
+        if isinstance(rval, ProbeBuffer):
+            rval = rval.data.swapaxes(0, 1)
+        elif isinstance(rval, list):
+            rval = (np.asarray(rval).swapaxes(0, 1) if len(rval) > 0 else
+                    np.zeros((self.n_trials, 0)))
+            rval.flags.writeable = False
+        return rval
+
+
 class Simulator(object):
     """Reference simulator for Nengo models."""
 
-    def __init__(self, network, dt=0.001, seed=None, model=None):
+    def __init__(self, network, dt=0.001, seed=None, model=None,
+                 optimize=False, arena=False, n_workers=1,
+                 parallel_threshold=10000, profile=False, compiled=False,
+                 dtype=None, build_workers=1):
         """Initialize the simulator with a network and (optionally) a model.
 
         Most of the time, you will pass in a network and sometimes a dt::
@@ -96,15 +282,75 @@ class Simulator(object):
             if you want to build the network manually, or to inject some
             build artifacts in the Model before building the network,
             then you can pass in a ``nengo.builder.Model`` instance.
+        optimize : bool
+            If True, operators of the same type that do not depend on each
+            other (e.g., the ``SimNeurons`` operators of all ensembles with
+            the same neuron type) are merged into single operators before
+            the simulation starts, reducing the overhead of each timestep.
+            The signals of merged ``SimNeurons`` and ``SimSynapse``
+            operators are allocated next to each other, so that each group
+            of neurons and each group of synapses with the same filter is
+            simulated with a single call (even if ``arena`` is False).
+            Setting this to False (the default) simulates every operator
+            on its own, which can be used to verify the merged results.
+        arena : bool
+            If True, all signals of the same dtype are allocated in one
+            contiguous buffer, with signals that are used together placed
+            next to each other. Combined with ``optimize=True``, this allows
+            merged operators to work on a single view of all their signals.
+            If False (the default), each signal gets its own array.
+        n_workers : int
+            The number of threads used to run independent operators in
+            parallel. If 1 (the default), all operators run in order on the
+            calling thread. Call ``close`` to stop the threads once the
+            simulator is no longer needed.
+        parallel_threshold : int
+            If ``n_workers > 1``, the minimum number of signal elements that
+            an operator (or group of operators writing to the same signals)
+            must access to be run in a separate thread. Smaller operators
+            are run on the calling thread, since the overhead of sending
+            them to another thread outweighs the gains.
+        profile : bool
+            If True, the time spent in the step function of each operator
+            is recorded in ``sim.profiler``, a
+            ``nengo.utils.profiling.OperatorProfiler``. This slows down the
+            simulation slightly. If False (the default), ``sim.profiler``
+            is None, and the simulation is not slowed down.
+        compiled : bool
+            If True, ``run`` and ``run_steps`` use a function generated
+            for this simulator that runs many timesteps per call, with the
+            computations of simple operators written out in it (see
+            ``nengo.builder.plan``). This reduces the overhead of each
+            timestep, which matters most for models with many small
+            operators. ``step`` is not affected. Default: False.
+        dtype : np.dtype
+            The dtype of the floating-point signals (e.g., ``np.float32``,
+            which halves the memory used by signals and the memory traffic
+            of each timestep, at the cost of precision). Decoders are still
+            solved for in float64, and cast to ``dtype`` afterwards. If
+            None (the default), the dtype of ``model`` is used, which is
+            float64 unless the model was created with another dtype.
+        build_workers : int
+            The number of threads used to solve for decoders when building
+            ``network``. If greater than 1, the decoders of the connections
+            in the model are solved for in parallel before the
+            connections are built in order, which gives the same model as
+            a serial build. Default: 1. Ignored if ``model`` is given (set
+            ``model.build_workers`` instead).
         """
         dt = float(dt)  # make sure it's a float (for division purposes)
 
         if model is None:
             self.model = Model(dt=dt,
                                label="%s, dt=%f" % (network, dt),
-                               decoder_cache=get_default_decoder_cache())
+                               decoder_cache=get_default_decoder_cache(),
+                               dtype=np.float64 if dtype is None else dtype,
+                               build_workers=build_workers)
         else:
             self.model = model
+            if dtype is not None and np.dtype(dtype) != model.dtype:
+                raise ValueError("dtype '%s' does not match the dtype of the "
+                                 "model ('%s')" % (dtype, model.dtype))
 
         if network is not None:
             # Build the network into the model
@@ -115,24 +361,63 @@ class Simulator(object):
         self.seed = np.random.randint(npext.maxint) if seed is None else seed
         self.rng = np.random.RandomState(self.seed)
 
+        operators = self.model.operators
+        self.dg = operator_depencency_graph(operators)
+        if optimize:
+            operators = fuse_operators(operators, self.dg)
+            self.dg = operator_depencency_graph(operators)
+
         # -- map from Signal.base -> ndarray
-        self.signals = SignalDict(__time__=np.asarray(0.0, dtype=np.float64))
+        self.signals = SignalDict(__time__=np.asarray(0.0, dtype=np.float64),
+                                  dtype=self.model.dtype)
+        if arena:
+            self.signals.init_arena(signal_layout(operators))
+        elif optimize:
+            # -- concatenate the signals of merged neurons and synapses, so
+            #    that each merged group is simulated with a single call
+            self.signals.init_arena(signal_layout(
+                operators, merged_types=(SimNeurons, SimSynapse)))
         for op in self.model.operators:
             op.init_signals(self.signals)
-
-        self.dg = operator_depencency_graph(self.model.operators)
         self._step_order = [node for node in toposort(self.dg)
                             if hasattr(node, 'make_step')]
         self._steps = [node.make_step(self.signals, dt, self.rng)
                        for node in self._step_order]
+        self._profile(profile)
+        self._scheduler = None
+        if n_workers > 1:
+            self._scheduler = LevelScheduler(
+                self._step_order, self._steps, self.dg,
+                n_workers=n_workers, threshold=parallel_threshold)
 
         # Add built states to the probe dictionary
         self._probe_outputs = self.model.params
 
         # Provide a nicer interface to probe outputs
         self.data = ProbeDict(self._probe_outputs)
+        self.probe_dir = None  # -- created when first needed
+        self._probe_files = {}  # -- reused by each reset
+        self._state = None  # -- state objects for snapshots
 
         self.reset()
+        self._compile(compiled, inline=self.profiler is None)
+
+    def _profile(self, profile):
+        """Wrap the step functions with timers if ``profile`` is True."""
+        self.profiler = None
+        if profile:
+            self.profiler = OperatorProfiler(self.model.origins)
+            self._steps = [self.profiler.wrap(op, step_fn) for op, step_fn
+                           in zip(self._step_order, self._steps)]
+
+    def _compile(self, compiled, inline):
+        """Generate the function used by ``run_steps`` if ``compiled``."""
+        self._plan = None
+        if compiled:
+            self._plan = compile_plan(
+                self._step_order, self._steps, self.signals, self.dt,
+                [period for _, _, period in self._probes],
+                scheduler=self._scheduler, inline=inline)
 
     @property
     def dt(self):
@@ -168,12 +453,9 @@ class Simulator(object):
 
     def _probe(self):
         """Copy all probed signals to buffers"""
-        for probe in self.model.probes:
-            period = (1 if probe.sample_every is None else
-                      probe.sample_every / self.dt)
-            if self.n_steps % period < 1:
-                tmp = self.signals[self.model.sig[probe]['in']].copy()
-                self._probe_outputs[probe].append(tmp)
+        for buf, sig, period in self._probes:
+            if period is None or self.n_steps % period < 1:
+                buf.append(sig)
 
     def step(self):
         """Advance the simulator by `self.dt` seconds.
@@ -183,8 +465,11 @@ class Simulator(object):
 
         old_err = np.seterr(invalid='raise', divide='ignore')
         try:
-            for step_fn in self._steps:
-                step_fn()
+            if self._scheduler is not None:
+                self._scheduler()
+            else:
+                for step_fn in self._steps:
+                    step_fn()
         finally:
             np.seterr(**old_err)
 
@@ -235,10 +520,119 @@ class Simulator(object):
             :class:`nengo.utils.progress.ProgressBar`,
             or :class:`nengo.utils.progress.ProgressUpdater` instance.
         """
-        with ProgressTracker(steps, progress_bar) as progress:
-            for i in range(steps):
-                self.step()
-                progress.step()
+        for buf, _, period in self._probes:
+            buf.reserve(steps if period is None else
+                        int(np.ceil(steps / period)) + 1)
+
+        try:
+            with ProgressTracker(steps, progress_bar) as progress:
+                if self._plan is not None:
+                    self._run_plan(steps, progress)
+                else:
+                    for i in range(steps):
+                        self.step()
+                        progress.step()
+        finally:
+            for buf, _, _ in self._probes:
+                buf.flush()
+
+    def _run_plan(self, steps, progress):
+        """Run ``steps`` timesteps in blocks, using the compiled plan."""
+        block_size = max(steps // 100, 1)  # -- to update the progress bar
+        old_err = np.seterr(invalid='raise', divide='ignore')
+        try:
+            for start in range(0, steps, block_size):
+                n_steps = min(block_size, steps - start)
+                self._plan(self, n_steps)
+                progress.step(n_steps)
+        finally:
+            np.seterr(**old_err)
+
+    def snapshot(self, include_probes=False):
+        """Capture the current state of the simulation.
+
+        The snapshot contains the values of all signals, the number of
+        steps taken, the states of the random number generators, and
+        the state kept by operators outside of signals (e.g., the history
+        of synapses). The simulation can be returned to this state with
+        ``restore``, any number of times.
+
+        Parameters
+        ----------
+        include_probes : bool, optional
+            Whether to copy the data recorded by probes into the snapshot.
+            Without the data, the snapshot can only be restored while the
+            simulator still holds the data (i.e., not after a ``reset``,
+            and not into a different simulator). Default: False.
+
+        Returns
+        -------
+        nengo.snapshot.Snapshot
+            The snapshot. Use ``Snapshot.save`` to save it to disk.
+        """
+        return Snapshot.take(self._get_state(), include_probes)
+
+    def restore(self, snapshot):
+        """Return to the state captured by ``snapshot``.
+
+        Parameters
+        ----------
+        snapshot : nengo.snapshot.Snapshot or str
+            A snapshot from ``snapshot``, or the name of a file to which
+            a snapshot has been saved. The snapshot can be from a different
+            simulator, as long as it simulates the same model.
+        """
+        if is_string(snapshot):
+            snapshot = Snapshot.load(snapshot)
+        snapshot.restore(self._get_state())
+
+    def _get_state(self):
+        if self._state is None:
+            self._state = SimulatorState(self)
+        return self._state
+
+    def close(self):
+        """Stop the threads used to run operators in parallel, if any.
+
+        Also deletes the files of probes storing their data on disk, so
+        their data cannot be accessed after closing the simulator.
+        """
+        if self._scheduler is not None:
+            self._scheduler.close()
+        if self.probe_dir is not None:
+            for probe in self._probe_files:
+                self._probe_outputs.pop(probe, None)  # -- release the maps
+            shutil.rmtree(self.probe_dir, ignore_errors=True)
+            self.probe_dir = None
+            self._probe_files = {}
+
+    def _get_probe_dir(self):
+        """The directory for probe data stored on disk, created on demand."""
+        if self.probe_dir is None:
+            path = rc.get('probes', 'path')
+            self.probe_dir = tempfile.mkdtemp(
+                prefix='nengo-probes-', dir=path if path else None)
+        return self.probe_dir
+
+    def _new_probe_file(self, probe, i):
+        """Returns the name of an empty file for the data of ``probe``.
+
+        The data recorded before a reset may still be memory-mapped (e.g.,
+        through ``sim.data``), so the old file is removed rather than
+        truncated; its data stay valid until they are no longer mapped.
+        """
+        filename = self._probe_files.get(probe)
+        if filename is not None:
+            try:
+                os.remove(filename)
+                return filename
+            except OSError:  # -- e.g., still mapped on Windows
+                pass
+        fd, filename = tempfile.mkstemp(
+            suffix='.npy', prefix='probe%d-' % i, dir=self._get_probe_dir())
+        os.close(fd)
+        self._probe_files[probe] = filename
+        return filename
 
     def reset(self):
         """Reset the simulator state."""
@@ -249,5 +643,184 @@ class Simulator(object):
             if key != '__time__':
                 self.signals.reset(key)
 
-        for probe in self.model.probes:
-            self._probe_outputs[probe] = []
+        # -- the buffer, the probed signal, and the sampling period in steps
+        #    of each probe, precomputed so that probing each step is cheap
+        self._probes = []
+        for i, probe in enumerate(self.model.probes):
+            sig = self.signals[self.model.sig[probe]['in']]
+            storage = (rc.get('probes', 'storage') if probe.storage is None
+                       else probe.storage)
+            if storage == 'disk':
+                self._probe_outputs[probe] = MemmapProbeBuffer(
+                    self._new_probe_file(probe, i), sig.shape, sig.dtype)
+            else:
+                self._probe_outputs[probe] = ProbeBuffer(sig.shape, sig.dtype)
+            period = (None if probe.sample_every is None else
+                      probe.sample_every / self.dt)
+            self._probes.append((self._probe_outputs[probe], sig, period))
+
+
+class BatchSimulator(Simulator):
+    """Reference simulator running several trials of a model at once.
+
+    All trials share the same built model, but each trial has its own copy
+    of every signal that can change during the simulation, its own random
+    number generator, and optionally its own inputs. Every signal has an
+    additional leading axis indexing the trial, and probe data has shape
+    ``(n_trials, n_samples, ...)``.
+
+    Operators that can be applied to all trials at once (e.g., ``DotInc``
+    and ``SimNeurons``) are simulated as batched operations, which avoids
+    paying the Python overhead of each timestep once per trial.
+    """
+
+    def __init__(self, network, n_trials, dt=0.001, seed=None, model=None,
+                 node_inputs=None, profile=False, compiled=False,
+                 dtype=None, build_workers=1):
+        """Initialize the simulator with a network and a number of trials.
+
+        Parameters
+        ----------
+        network : nengo.Network instance or None
+            A network object to be built and then simulated. If None,
+            then a built model must be passed in instead.
+        n_trials : int
+            The number of trials to simulate.
+        dt : float, optional
+            The length of a simulator timestep, in seconds.
+        seed : int or array_like, optional
+            Seeds for the random number generators of the trials. If an
+            integer, trial ``i`` uses ``seed + i``. Otherwise, this must be
+            a sequence of ``n_trials`` seeds. Trial ``i`` then generates the
+            same random numbers as a ``Simulator`` with seed ``seeds[i]``.
+        model : nengo.builder.Model instance or None, optional
+            A model object that contains build artifacts to be simulated.
+        node_inputs : dict, optional
+            Maps Nodes to a sequence of ``n_trials`` outputs, which replace
+            the output of the node in each trial. If the node output is a
+            function, each trial output may be a function or a constant
+            vector; otherwise, each trial output must be a constant vector.
+        profile : bool, optional
+            If True, the time spent in each operator is recorded in
+            ``sim.profiler`` (see ``Simulator``).
+        compiled : bool, optional
+            If True, ``run`` and ``run_steps`` use a generated function
+            that runs many timesteps per call (see ``Simulator``).
+        dtype : np.dtype, optional
+            The dtype of the floating-point signals (see ``Simulator``).
+        build_workers : int, optional
+            The number of threads used to solve for decoders when building
+            ``network`` (see ``Simulator``).
+        """
+        dt = float(dt)  # make sure it's a float (for division purposes)
+
+        if model is None:
+            self.model = Model(dt=dt,
+                               label="%s, dt=%f" % (network, dt),
+                               decoder_cache=get_default_decoder_cache(),
+                               dtype=np.float64 if dtype is None else dtype,
+                               build_workers=build_workers)
+        else:
+            self.model = model
+            if dtype is not None and np.dtype(dtype) != model.dtype:
+                raise ValueError("dtype '%s' does not match the dtype of the "
+                                 "model ('%s')" % (dtype, model.dtype))
+
+        if network is not None:
+            # Build the network into the model
+            self.model.build(network)
+
+        self.model.decoder_cache.shrink()
+
+        self.n_trials = n_trials
+        if seed is None:
+            seed = np.random.randint(npext.maxint - n_trials)
+        if is_integer(seed):
+            seed = seed + np.arange(n_trials)
+        self.seeds = np.array(seed)
+        if self.seeds.shape != (n_trials,):
+            raise ValueError("Must provide one seed per trial (got %d)"
+                             % self.seeds.size)
+        self.seed = self.seeds[0]
+        self.rngs = [np.random.RandomState(s) for s in self.seeds]
+        self.rng = self.rngs[0]
+
+        # -- map from Signal.base -> ndarray with a leading trial axis
+        self.signals = BatchSignalDict(
+            n_trials, __time__=np.asarray(0.0, dtype=np.float64),
+            dtype=self.model.dtype)
+        for op in self.model.operators:
+            op.init_signals(self.signals)
+
+        trial_ops = self._node_inputs(
+            {} if node_inputs is None else node_inputs)
+
+        self.dg = operator_depencency_graph(self.model.operators)
+        self._step_order = [node for node in toposort(self.dg)
+                            if hasattr(node, 'make_step')]
+        self._scheduler = None
+        self._steps = [
+            make_trial_step(trial_ops[op], self.signals, dt, self.rngs)
+            if op in trial_ops else
+            make_batch_step(op, self.signals, dt, self.rngs)
+            for op in self._step_order]
+        self._profile(profile)
+
+        # Add built states to the probe dictionary
+        self._probe_outputs = self.model.params
+
+        # Provide a nicer interface to probe outputs
+        self.data = BatchProbeDict(self._probe_outputs, n_trials)
+        self.probe_dir = None  # -- created when first needed
+        self._probe_files = {}  # -- reused by each reset
+        self._state = None  # -- state objects for snapshots
+
+        self.reset()
+        self._compile(compiled, inline=False)
+
+    def _node_inputs(self, node_inputs):
+        """Set up the per-trial outputs of nodes.
+
+        Constant outputs are written to the output signals of the nodes
+        directly. For nodes whose output is a function, returns a dict
+        mapping the ``SimPyFunc`` operator of the node to a list of copies
+        of that operator, one for each trial.
+        """
+        def constant_output(value):
+            return lambda t, *args: value
+
+        pyfuncs = dict((op.output, op) for op in self.model.operators
+                       if isinstance(op, SimPyFunc) and op.output is not None)
+
+        trial_ops = {}
+        for node, outputs in iteritems(node_inputs):
+            if len(outputs) != self.n_trials:
+                raise ValueError("Must provide one output per trial for %s "
+                                 "(got %d)" % (node, len(outputs)))
+            if node.output is None:
+                raise ValueError("Cannot provide outputs for passthrough "
+                                 "node %s" % node)
+            for output in outputs:
+                if not callable(output) and (
+                        np.asarray(output).size != node.size_out):
+                    raise ValueError(
+                        "Output for %s must have size %d (got %d)" % (
+                            node, node.size_out, np.asarray(output).size))
+
+            sig_out = self.model.sig[node]['out']
+            if not callable(node.output):
+                if any(callable(output) for output in outputs):
+                    raise ValueError("Node %s has a constant output, so its "
+                                     "trial outputs must be constant" % node)
+                self.signals.init_trials(
+                    sig_out, [np.ravel(output) for output in outputs])
+                continue
+
+            op = pyfuncs[sig_out]
+            trial_ops[op] = [
+                SimPyFunc(op.output,
+                          output if callable(output) else
+                          constant_output(np.ravel(output)),
+                          op.t_in, op.x)
+                for output in outputs]
+        return trial_ops
@@ -0,0 +1,344 @@
+"""Saving and restoring the state of a running simulation.
+
+The state of a simulation consists of the values of all signals that can
+change, the number of steps taken, the state of the random number
+generators, and the data recorded by probes. Some operators also keep
+state outside of the signals, in the step functions they return (e.g.,
+the state of a higher-order ``LinearFilter`` is kept in an array, and
+``WhiteNoise`` keeps the index of its next sample in an array).
+This hidden state is found by walking through the closures and partial
+function applications making up the step functions.
+
+For snapshots to be restored into a different simulator (e.g., after
+saving them to disk), the signals, operators and probes are identified
+by the order in which they appear in the built model, which is the same
+every time a network is built.
+"""
+
+import bisect
+import collections
+import copy
+import functools
+import types
+
+import numpy as np
+
+from nengo.utils.compat import is_string
+
+
+def rng_state_arrays(state):
+    """Convert a ``RandomState`` state tuple to a pair of arrays."""
+    name, keys, pos, has_gauss, cached_gaussian = state
+    assert name == 'MT19937'
+    return keys, np.array([pos, has_gauss, cached_gaussian])
+
+
+def rng_state_tuple(keys, params):
+    """Convert the arrays from ``rng_state_arrays`` to a state tuple."""
+    pos, has_gauss, cached_gaussian = params
+    return ('MT19937', np.asarray(keys, dtype=np.uint32), int(pos),
+            int(has_gauss), float(cached_gaussian))
+
+
+class MemoryRanges(object):
+    """Tests whether arrays lie within a set of arrays in memory."""
+
+    def __init__(self, arrays):
+        ranges = sorted((a.__array_interface__['data'][0], a.nbytes)
+                        for a in arrays)
+        self.starts = [start for start, _ in ranges]
+        # -- the largest end address of all ranges starting before each range
+        self.ends = []
+        for start, nbytes in ranges:
+            self.ends.append(max(self.ends[-1:] + [start + nbytes]))
+
+    def __contains__(self, array):
+        address = array.__array_interface__['data'][0]
+        i = bisect.bisect_right(self.starts, address) - 1
+        return i >= 0 and address < self.ends[i]
+
+
+def find_state(step_fn, exclude, seen):  # noqa: C901
+    """Find the objects holding the hidden state of a step function.
+
+    Walks through closures, default arguments, and ``functools.partial``
+    objects, as well as any lists, tuples and dicts that these contain.
+    Functions from outside of Nengo (e.g., Node functions) are not
+    searched. The state consists of writeable arrays, deques, and
+    ``RandomState`` instances.
+
+    Parameters
+    ----------
+    step_fn : callable
+        The step function to search.
+    exclude : MemoryRanges
+        Arrays within these ranges are not part of the hidden state
+        (e.g., because they are views of signals).
+    seen : set
+        The ids of objects that have been searched already. This is
+        updated with the objects searched by this function.
+    """
+    state = []
+
+    def walk(obj):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+
+        if isinstance(obj, np.ndarray):
+            if obj.flags.writeable and obj.size > 0 and obj not in exclude:
+                state.append(obj)
+        elif isinstance(obj, (collections.deque, np.random.RandomState)):
+            state.append(obj)
+        elif isinstance(obj, functools.partial):
+            walk(obj.func)
+            walk_all(obj.args)
+            walk_all(v for _, v in sorted((obj.keywords or {}).items()))
+        elif isinstance(obj, types.FunctionType):
+            if obj.__module__ is None or not obj.__module__.startswith(
+                    'nengo'):
+                return
+            walk_all(obj.__defaults__ or ())
+            walk_all(cell.cell_contents for cell in obj.__closure__ or ())
+        elif isinstance(obj, (list, tuple)):
+            walk_all(obj)
+        elif isinstance(obj, dict):
+            walk_all(v for _, v in sorted(obj.items(),
+                                          key=lambda item: str(item[0])))
+
+    def walk_all(objs):
+        # -- temporary containers are not added to ``seen``, since their
+        #    ids can be reused once they have been garbage collected
+        for obj in objs:
+            walk(obj)
+
+    walk(step_fn)
+    return state
+
+
+def copy_state(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    elif isinstance(obj, collections.deque):
+        return [copy.deepcopy(x) for x in obj]
+    elif isinstance(obj, np.random.RandomState):
+        return rng_state_arrays(obj.get_state())
+    raise TypeError("Unsupported state object '%s'" % type(obj).__name__)
+
+
+def set_state(obj, value):
+    if isinstance(obj, np.ndarray):
+        if obj.shape != value.shape:
+            raise ValueError("Cannot restore state of shape %s into array of "
+                             "shape %s" % (value.shape, obj.shape))
+        obj[...] = value
+    elif isinstance(obj, collections.deque):
+        obj.clear()
+        obj.extend(copy.deepcopy(x) for x in value)
+    elif isinstance(obj, np.random.RandomState):
+        obj.set_state(rng_state_tuple(*value))
+    else:
+        raise TypeError(
+            "Unsupported state object '%s'" % type(obj).__name__)
+
+
+def state_kind(obj):
+    return ('array' if isinstance(obj, np.ndarray) else
+            'deque' if isinstance(obj, collections.deque) else 'rng')
+
+
+class SimulatorState(object):
+    """The objects making up the state of a simulator, in canonical order.
+
+    Parameters
+    ----------
+    sim : Simulator
+        The simulator (or ``BatchSimulator``).
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+
+        # -- signals in order of first appearance in the model
+        self.signals = []
+        bases = set()
+        for op in sim.model.operators:
+            for sig in op.all_signals:
+                if sig.base not in bases:
+                    bases.add(sig.base)
+                    if sim.signals[sig.base].flags.writeable:
+                        self.signals.append(sig.base)
+
+        self.rngs = list(getattr(sim, 'rngs', [sim.rng]))
+
+        # -- operators in order of their (first) appearance in the model
+        order = dict((op, i) for i, op in enumerate(sim.model.operators))
+
+        def index(op):
+            return min(order[o] for o in getattr(op, 'ops', [op]))
+
+        steps = sorted(zip(sim._step_order, sim._steps),
+                       key=lambda item: index(item[0]))
+
+        exclude = MemoryRanges([sim.signals[key] for key in sim.signals])
+        seen = set(id(rng) for rng in self.rngs)
+        self.hidden = []
+        for _, step_fn in steps:
+            self.hidden.extend(find_state(step_fn, exclude, seen))
+
+    @property
+    def probe_buffers(self):
+        return [self.sim._probe_outputs[p] for p in self.sim.model.probes]
+
+
+class Snapshot(object):
+    """The state of a simulator at one point in time.
+
+    Snapshots are created with ``Simulator.snapshot`` and restored with
+    ``Simulator.restore``. They can be saved to a compressed ``.npz``
+    file with ``save``, and loaded with ``Snapshot.load``.
+
+    Attributes
+    ----------
+    n_steps : int
+        The number of steps the simulator had taken.
+    signals : list of ndarray
+        The values of all writeable signals.
+    rngs : list of tuple
+        The states of the random number generators of the simulator.
+    hidden : list of tuple
+        The kind (``'array'``, ``'deque'`` or ``'rng'``) and value of each
+        state object in the step functions of the operators.
+    probe_counts : list of int
+        The number of samples recorded by each probe.
+    probe_data : list of ndarray or None
+        The data recorded by each probe, if included in the snapshot.
+    """
+
+    def __init__(self, n_steps, signals, rngs, hidden, probe_counts,
+                 probe_data=None):
+        self.n_steps = n_steps
+        self.signals = signals
+        self.rngs = rngs
+        self.hidden = hidden
+        self.probe_counts = probe_counts
+        self.probe_data = probe_data
+
+    @classmethod
+    def take(cls, state, include_probes=False):
+        """Take a snapshot of the state of a simulator.
+
+        Parameters
+        ----------
+        state : SimulatorState
+            The state objects of the simulator.
+        include_probes : bool, optional
+            Whether to copy the data recorded by the probes.
+        """
+        sim = state.sim
+        buffers = state.probe_buffers
+        return cls(
+            n_steps=sim.n_steps,
+            signals=[sim.signals[sig].copy() for sig in state.signals],
+            rngs=[rng_state_arrays(rng.get_state()) for rng in state.rngs],
+            hidden=[(state_kind(obj), copy_state(obj))
+                    for obj in state.hidden],
+            probe_counts=[len(buf) for buf in buffers],
+            probe_data=([np.array(buf.data) for buf in buffers]
+                        if include_probes else None))
+
+    def restore(self, state):
+        """Restore the snapshot into the simulator of ``state``."""
+        sim = state.sim
+        buffers = state.probe_buffers
+        if (len(self.signals) != len(state.signals)
+                or len(self.rngs) != len(state.rngs)
+                or len(self.hidden) != len(state.hidden)
+                or len(self.probe_counts) != len(buffers)
+                or any(kind != state_kind(obj) for (kind, _), obj in zip(
+                    self.hidden, state.hidden))):
+            raise ValueError("Snapshot does not match the simulator")
+        if self.probe_data is None and any(
+                len(buf) < n for buf, n in zip(buffers, self.probe_counts)):
+            raise ValueError("Snapshot does not include the probe data, and "
+                             "the data are no longer in the simulator. Use "
+                             "'include_probes=True' when taking snapshots "
+                             "to restore them later.")
+
+        for sig, value in zip(state.signals, self.signals):
+            set_state(sim.signals[sig], value)
+        for rng, value in zip(state.rngs, self.rngs):
+            rng.set_state(rng_state_tuple(*value))
+        for obj, (_, value) in zip(state.hidden, self.hidden):
+            set_state(obj, value)
+
+        for buf, n, data in zip(buffers, self.probe_counts,
+                                self.probe_data or [None] * len(buffers)):
+            if data is not None:
+                buf.clear()
+                buf.extend(data)
+            else:
+                buf.truncate(n)
+
+        sim.n_steps = self.n_steps
+        sim.signals['__time__'][...] = self.n_steps * sim.dt
+
+    def save(self, filename):
+        """Save the snapshot to a compressed ``.npz`` file."""
+        arrays = {'n_steps': np.array(self.n_steps),
+                  'probe_counts': np.array(self.probe_counts, dtype=int),
+                  'hidden_kinds': np.array([k for k, _ in self.hidden],
+                                           dtype='S5')}
+        for i, value in enumerate(self.signals):
+            arrays['signal%d' % i] = value
+        for i, (keys, params) in enumerate(self.rngs):
+            arrays['rng%d_keys' % i] = keys
+            arrays['rng%d_params' % i] = params
+        for i, (kind, value) in enumerate(self.hidden):
+            if kind == 'array':
+                arrays['hidden%d' % i] = value
+            elif kind == 'deque':
+                arrays['hidden%d_len' % i] = np.array(len(value))
+                for j, x in enumerate(value):
+                    arrays['hidden%d_%d' % (i, j)] = x
+            else:
+                arrays['hidden%d_keys' % i] = value[0]
+                arrays['hidden%d_params' % i] = value[1]
+        if self.probe_data is not None:
+            for i, data in enumerate(self.probe_data):
+                arrays['probe%d' % i] = data
+        np.savez_compressed(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a snapshot saved with ``save``."""
+        with np.load(filename) as f:
+            probe_counts = [int(n) for n in f['probe_counts']]
+            hidden = []
+            for i, kind in enumerate(f['hidden_kinds']):
+                kind = kind if is_string(kind) else kind.decode('ascii')
+                if kind == 'array':
+                    value = f['hidden%d' % i]
+                elif kind == 'deque':
+                    value = [f['hidden%d_%d' % (i, j)]
+                             for j in range(int(f['hidden%d_len' % i]))]
+                else:
+                    value = (f['hidden%d_keys' % i], f['hidden%d_params' % i])
+                hidden.append((kind, value))
+
+            def count(prefix, suffix=''):
+                n = 0
+                while '%s%d%s' % (prefix, n, suffix) in f.files:
+                    n += 1
+                return n
+
+            return cls(
+                n_steps=int(f['n_steps']),
+                signals=[f['signal%d' % i] for i in range(count('signal'))],
+                rngs=[(f['rng%d_keys' % i], f['rng%d_params' % i])
+                      for i in range(count('rng', '_keys'))],
+                hidden=hidden,
+                probe_counts=probe_counts,
+                probe_data=([f['probe%d' % i]
+                             for i in range(len(probe_counts))]
+                            if 'probe0' in f.files else None))
@@ -429,7 +429,8 @@ class LstsqDrop(Solver):
     """
 
     def __init__(self, weights=False, drop=0.25,
-                 solver1=LstsqL2nz(reg=0.1), solver2=LstsqL2nz(reg=0.01)):
+                 solver1=LstsqL2nz(reg=0.1), solver2=LstsqL2nz(reg=0.01),
+                 sparse=False):
         """
         weights : boolean, optional
             If false solve for decoders (default), otherwise solve for weights.
@@ -439,11 +440,16 @@ class LstsqDrop(Solver):
             Solver for finding the initial decoders.
         solver2 : Solver, optional
             Used for re-solving for the decoders after dropout.
+        sparse : boolean, optional
+            If true, return the decoders or weights as a
+            ``scipy.sparse.csr_matrix``, so that only the nonzero values
+            are stored and used in the simulation.
         """
         self.weights = weights
         self.drop = drop
         self.solver1 = solver1
         self.solver2 = solver2
+        self.sparse = sparse
 
     def __call__(self, A, Y, rng=None, E=None):
         Y, m, n, d, matrix_in = _format_system(A, Y)
@@ -467,6 +473,9 @@ class LstsqDrop(Solver):
 
         info = {'rmses': npext.rms(Y - np.dot(A, X), axis=0),
                 'info0': info0, 'info1': info1}
+        if self.sparse:
+            import scipy.sparse
+            return scipy.sparse.csr_matrix(X), info
         return X if matrix_in else X.flatten(), info
 
 
@@ -1,11 +1,10 @@
-import collections
 import functools
 
 import numpy as np
 
 from nengo.params import Parameter
 from nengo.utils.compat import is_number
-from nengo.utils.filter_design import cont2discrete
+from nengo.utils.filter_design import cont2discrete, tf2ss
 
 
 class Synapse(object):
@@ -51,25 +50,29 @@ class LinearFilter(Synapse):
         output += b * signal
 
     @staticmethod
-    def general_step(signal, output, x, y, num, den):
-        """Filter an LTI system with the given transfer function.
+    def general_step(signal, output, A, B, C, D, X, AX, BU, U, Y):
+        """Filter an LTI system in state-space form.
 
-        Implements a discrete-time LTI system using the difference equation
-        [1]_ for the given transfer function (num, den).
+        Implements a discrete-time LTI system with the state-space
+        equations [1]_ ``y[k] = C x[k] + D u[k]`` and
+        ``x[k+1] = A x[k] + B u[k]``, where ``X`` holds the state ``x``
+        for all elements of ``output`` (one row per state variable).
+        ``AX``, ``BU``, ``U`` and ``Y`` are preallocated workspace arrays,
+        so no memory is allocated on each step.
 
         References
         ----------
-        .. [1] http://en.wikipedia.org/wiki/Digital_filter#Difference_equation
+        .. [1] http://en.wikipedia.org/wiki/State-space_representation
         """
+        U.reshape(signal.shape)[...] = signal
+        np.dot(C, X, out=Y)
+        np.multiply(D, U, out=BU[:1])
+        Y += BU[:1]
+        output[...] = Y.reshape(output.shape)
 
-        output[...] = 0
-
-        x.appendleft(np.array(signal))
-        for k, xk in enumerate(x):
-            output += num[k] * xk
-        for k, yk in enumerate(y):
-            output -= den[k] * yk
-        y.appendleft(np.array(output))
+        np.dot(A, X, out=AX)
+        np.multiply(B, U, out=BU)
+        np.add(AX, BU, out=X)
 
     def make_step(self, dt, output, method='zoh'):
         num, den, _ = cont2discrete((self.num, self.den), dt, method=method)
@@ -84,10 +87,25 @@ class LinearFilter(Synapse):
             return functools.partial(
                 LinearFilter.simple_step, output=output, a=den[0], b=num[0])
         else:
-            x = collections.deque(maxlen=len(num))
-            y = collections.deque(maxlen=len(den))
-            return functools.partial(LinearFilter.general_step,
-                                     output=output, x=x, y=y, num=num, den=den)
+            # -- the difference equation above (with the leading zero of num
+            #    dropped) as a state-space system, with num and den in
+            #    increasing powers of z^-1 padded to the same length
+            order = max(len(num) - 1, len(den))
+            num = np.append(num, np.zeros(order + 1 - len(num)))
+            den = np.append([1.], np.append(den, np.zeros(order - len(den))))
+            A, B, C, D = (np.array(M, dtype=output.dtype)
+                          for M in tf2ss(num, den))
+            for M in (A, B, C, D):
+                M.setflags(write=False)
+
+            m = output.size
+            X = np.zeros((order, m), dtype=output.dtype)
+            return functools.partial(
+                LinearFilter.general_step, output=output,
+                A=A, B=B, C=C, D=D.reshape(1, 1), X=X,
+                AX=np.empty_like(X), BU=np.empty_like(X),
+                U=np.empty((1, m), dtype=output.dtype),
+                Y=np.empty((1, m), dtype=output.dtype))
 
 
 class Lowpass(LinearFilter):
@@ -1,13 +1,20 @@
 from __future__ import print_function
 
+import os
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 import pytest
 
 import nengo
+import nengo.utils.numpy as npext
 from nengo.builder import Model
+from nengo.builder.connection import solve_decoders
 from nengo.builder.ensemble import BuiltEnsemble
-from nengo.builder.operator import DotInc, PreserveValue
+from nengo.builder.operator import DotInc, PreserveValue, outer_inc
+from nengo.builder.serialize import network_fingerprint
 from nengo.builder.signal import Signal, SignalDict
+from nengo.cache import DecoderCache, NoDecoderCache
 from nengo.utils.compat import itervalues
 
 
@@ -213,6 +220,46 @@ def test_signaldict_reset():
     assert np.allclose(signaldict[two_d], np.array([[1], [1]]))
 
 
+def test_signaldict_arena():
+    """Tests that SignalDict.init_arena places signals next to each other."""
+    signaldict = SignalDict()
+    a = Signal([1, 2])
+    b = Signal([[3, 4], [5, 6]])
+    c = Signal(np.zeros(3))
+    readonly = Signal(npext.array([7., 8.], readonly=True))
+    signaldict.init(c)
+    c_array = signaldict[c]
+
+    signaldict.init_arena([b[0, :], readonly, c, a, b])
+    assert np.all(signaldict[a] == [1, 2])
+    assert np.all(signaldict[b] == [[3, 4], [5, 6]])
+    assert np.all(signaldict[readonly] == [7, 8])
+    assert signaldict[c] is c_array
+
+    span = npext.contiguous_span([signaldict[b], signaldict[a]])
+    assert np.all(span == [3, 4, 5, 6, 1, 2])
+    with pytest.raises((ValueError, RuntimeError)):
+        signaldict[readonly] = np.array([0, 0])
+
+    # signals are views into the arena, so setting them keeps them in place
+    signaldict[a] = [-1, -2]
+    assert np.all(span == [3, 4, 5, 6, -1, -2])
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_outer_inc(dtype, rng):
+    """outer_inc updates C-contiguous matrices and views in place."""
+    X = rng.normal(size=5).astype(dtype)
+    Y = rng.normal(size=4).astype(dtype)
+    for A in (rng.normal(size=(5, 4)).astype(dtype),
+              rng.normal(size=(4, 5)).astype(dtype).T):
+        expected = A + 0.5 * np.outer(X, Y)
+        view = A[...]
+        outer_inc(A)(0.5, X, Y)
+        assert np.allclose(A, expected, atol=1e-5)
+        assert np.allclose(view, expected, atol=1e-5)
+
+
 def test_signal_reshape():
     """Tests Signal.reshape"""
     three_d = Signal(np.ones((2, 2, 2)))
@@ -236,3 +283,145 @@ def test_commonsig_readonly(RefSimulator):
             sim.signals[sig] = np.array([-1])
         with pytest.raises((ValueError, RuntimeError)):
             sim.signals[sig][...] = np.array([-1])
+
+
+def test_model_save_load(RefSimulator, seed, tmpdir):
+    def make_network():
+        with nengo.Network(seed=seed) as net:
+            stim = nengo.Node(lambda t: np.sin(8 * t))
+            a = nengo.Ensemble(100, 2)
+            b = nengo.Ensemble(50, 1)
+            nengo.Connection(stim, a[0])
+            error = nengo.Connection(b, b, modulatory=True)
+            conn = nengo.Connection(a, b, function=lambda x: x[0] * x[1],
+                                    learning_rule_type=nengo.PES(error))
+            probes = [nengo.Probe(b, synapse=0.01),
+                      nengo.Probe(conn, 'decoders')]
+        return net, probes
+
+    filename = str(tmpdir.join('model.nmf'))
+    net, probes = make_network()
+    sim = RefSimulator(net)
+    sim.model.save(filename)
+    sim.run(0.1)
+
+    net2, probes2 = make_network()
+    model = Model.load(filename, net2)
+    assert model.toplevel is net2
+    sim2 = RefSimulator(None, model=model)
+    sim2.run(0.1)
+    for p, p2 in zip(probes, probes2):
+        assert np.array_equal(sim.data[p], sim2.data[p2])
+
+    # -- decoders of the learned connection are not shared
+    conn2 = net2.connections[-1]
+    assert model.sig[conn2]['decoders'].value.flags.writeable
+    assert not np.array_equal(model.sig[conn2]['decoders'].value,
+                              sim2.signals[model.sig[conn2]['decoders']])
+
+    # -- the network has to be the same one
+    net3, _ = make_network()
+    net3.ensembles[0].radius = 2
+    with pytest.raises(ValueError):
+        Model.load(filename, net3)
+
+
+def test_network_fingerprint_functions():
+    def fingerprint(function):
+        with nengo.Network() as net:
+            nengo.Node(function)
+        return network_fingerprint(net)
+
+    assert fingerprint(lambda t: t * 2) == fingerprint(lambda t: t * 2)
+    assert fingerprint(lambda t: t * 2) != fingerprint(lambda t: t * 3)
+    assert fingerprint(lambda t: np.sin(t)) != fingerprint(lambda t: np.cos(t))
+
+
+def test_parallel_build(seed, tmpdir, monkeypatch):
+    with nengo.Network(seed=seed) as net:
+        a = nengo.Ensemble(100, 2)
+        b = nengo.Ensemble(50, 1)
+        with nengo.Network():
+            c = [nengo.Ensemble(30, 1) for _ in range(3)]
+            for pre, post in zip(c[:-1], c[1:]):
+                nengo.Connection(pre, post, function=np.square)
+        nengo.Connection(a, b, function=lambda x: x[0] * x[1])
+        nengo.Connection(a, c[0], eval_points=np.linspace(
+            -1, 1, 40).reshape(20, 2), function=np.sum)
+        nengo.Connection(a, b, solver=nengo.solvers.LstsqL2(weights=True),
+                         transform=[[1, -2]])
+        nengo.Connection(b, a.neurons, transform=np.ones((100, 1)))
+        nengo.Connection(c[2], b)
+
+    def build(build_workers, cache_dir):
+        model = Model(decoder_cache=DecoderCache(cache_dir=cache_dir),
+                      build_workers=build_workers)
+        model.build(net)
+        return model
+
+    def describe(model):
+        return [(type(op), [sig.name for sig in op.all_signals])
+                for op in model.operators]
+
+    def cached_keys(model):
+        return sorted(os.path.basename(path)
+                      for path in model.decoder_cache.get_files())
+
+    serial_dir = str(tmpdir.mkdir('serial'))
+    parallel_dir = str(tmpdir.mkdir('parallel'))
+    serial = build(1, serial_dir)
+
+    # -- one pool solves for the connections of all networks
+    pools = []
+
+    def thread_pool(processes):
+        pools.append(processes)
+        return ThreadPool(processes)
+    monkeypatch.setattr(nengo.builder.network, 'ThreadPool', thread_pool)
+    parallel = build(4, parallel_dir)
+    assert pools == [4]
+    assert describe(serial) == describe(parallel)
+    for conn in net.all_connections:
+        assert np.array_equal(serial.params[conn].decoders,
+                              parallel.params[conn].decoders)
+        assert np.array_equal(serial.params[conn].eval_points,
+                              parallel.params[conn].eval_points)
+
+    # -- the decoder cache is used in the same way
+    assert len(cached_keys(serial)) == 7
+    assert cached_keys(serial) == cached_keys(parallel)
+    cached = build(4, parallel_dir)
+    for conn in net.all_connections:
+        assert np.array_equal(serial.params[conn].decoders,
+                              cached.params[conn].decoders)
+
+
+def test_shared_decoder_solve(seed, tmpdir):
+    with nengo.Network(seed=seed) as net:
+        a = nengo.Ensemble(100, 2)
+        b = nengo.Ensemble(50, 1)
+        out = nengo.Node(size_in=2)
+        # -- the decoders of these connections are solved for together
+        nengo.Connection(a, b, function=lambda x: x[0] * x[1])
+        nengo.Connection(a[1], b)
+        nengo.Connection(a, out, function=lambda x: x ** 2)
+        # -- while these use different solvers
+        nengo.Connection(a[0], b, solver=nengo.solvers.LstsqL2(reg=0.01))
+        nengo.Connection(a, b, solver=nengo.solvers.LstsqL2(weights=True),
+                         transform=[[1, 1]])
+
+    model = Model(decoder_cache=DecoderCache(cache_dir=str(tmpdir)))
+    model.build(net)
+
+    # -- the shared connections are stored as one system in the cache
+    assert len(model.decoder_cache.get_files()) == 3
+
+    # -- the decoders are the same as when solving for them one by one
+    model.decoder_cache = NoDecoderCache()
+    for conn in net.connections:
+        rng = np.random.RandomState(model.seeds[conn])
+        _, decoders, info = solve_decoders(model, conn, rng)
+        built = model.params[conn]
+        assert built.decoders.shape == decoders.T.shape
+        assert np.allclose(built.decoders, decoders.T, atol=1e-8)
+        assert np.allclose(built.solver_info['rmses'], info['rmses'])
@@ -1,5 +1,6 @@
 import errno
 import os
+import threading
 
 import numpy as np
 from numpy.testing import assert_equal
@@ -7,7 +8,8 @@ import pytest
 
 import nengo
 from nengo.cache import (
-    DecoderCache, Fingerprint, get_fragment_size, NoDecoderCache)
+    DecoderCache, Fingerprint, get_fragment_size, LRUCache, NoDecoderCache)
+from nengo.utils.cache import byte_align
 from nengo.utils.compat import int_types
 from nengo.utils.testing import Timer
 
@@ -28,6 +30,16 @@ class SolverMock(object):
             return np.random.rand(A.shape[1], E.shape[1]), {'info': 'v'}
 
 
+class ScaledRectifiedLinear(nengo.RectifiedLinear):
+    """Neuron type whose rates depend on an attribute that is not a Param."""
+
+    def __init__(self, scale):
+        self.scale = scale
+
+    def step_math(self, dt, J, output):
+        output[...] = self.scale * np.maximum(0., J)
+
+
 def get_solver_test_args():
     M = 100
     N = 10
@@ -82,7 +94,8 @@ def test_decoder_cache(tmpdir):
 def test_corrupted_decoder_cache(tmpdir):
     cache_dir = str(tmpdir)
 
-    cache = DecoderCache(cache_dir=cache_dir)
+    # -- results kept in memory would not be read from disk again
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
     solver_mock = SolverMock()
     cache.wrap_solver(solver_mock)(**get_solver_test_args())
     assert SolverMock.n_calls[solver_mock] == 1
@@ -109,6 +122,140 @@ def test_decoder_cache_invalidation(tmpdir):
     assert SolverMock.n_calls[solver_mock] == 2
 
 
+def test_decoder_cache_memory(tmpdir):
+    cache_dir = str(tmpdir)
+    solver_mock = SolverMock()
+
+    cache = DecoderCache(cache_dir=cache_dir, memory_size='1 MB')
+    decoders1, solver_info1 = cache.wrap_solver(solver_mock)(
+        **get_solver_test_args())
+    assert cache.memory.misses == 1 and cache.memory.hits == 0
+
+    # -- hits in the same process do not read the file
+    for path in cache.get_files():
+        os.remove(path)
+    decoders2, solver_info2 = cache.wrap_solver(solver_mock)(
+        **get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 1
+    assert cache.memory.misses == 1 and cache.memory.hits == 1
+    assert_equal(decoders1, decoders2)
+    assert solver_info1 == solver_info2
+
+    # -- the returned decoders are shared with the cache, so they are
+    #    read-only
+    assert not decoders2.flags.writeable
+
+    # -- the results in memory are shared with other caches of the same
+    #    directory (e.g., of later simulators)
+    cache2 = DecoderCache(cache_dir=cache_dir, memory_size='1 MB')
+    assert cache2.memory is cache.memory
+    cache2.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 1
+    assert cache2.memory.hits == 2
+
+    # -- results read from disk are kept in memory as well
+    cache.memory.clear()
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 2
+    cache.memory.clear()
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())  # -- from disk
+    for path in cache.get_files():
+        os.remove(path)
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 2
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_decoder_cache_mmap(tmpdir, mmap):
+    cache_dir = str(tmpdir)
+    solver_mock = SolverMock()
+
+    cache = DecoderCache(cache_dir=cache_dir)
+    decoders1, _ = cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert decoders1.flags.writeable  # -- not from the cache
+
+    cache = DecoderCache(cache_dir=cache_dir, mmap=mmap, memory_size=0)
+    decoders2, _ = cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 1
+    assert isinstance(decoders2, np.memmap) == mmap
+    assert not decoders2.flags.writeable
+    assert decoders2.T.flags.c_contiguous
+    assert_equal(decoders1, decoders2)
+
+
+def test_decoder_cache_write_keeps_mapped_files(monkeypatch, tmpdir):
+    cache_dir = str(tmpdir)
+    solver_mock = SolverMock()
+
+    cache = DecoderCache(cache_dir=cache_dir)
+    decoders1, _ = cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    cache = DecoderCache(cache_dir=cache_dir, mmap=True, memory_size=0)
+    decoders2, _ = cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert isinstance(decoders2, np.memmap)
+
+    # -- a cache miss rewrites the file the decoders are mapped from
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
+    monkeypatch.setattr(cache, '_read_file', lambda key: None)
+    decoders3, _ = cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 2
+    assert not np.array_equal(decoders1, decoders3)
+
+    assert_equal(decoders1, decoders2)
+    files = cache.get_files()
+    assert len(files) == 1 and files[0].endswith('.nco')
+
+
+
+def test_learning_copies_cached_decoders(tmpdir, RefSimulator, seed):
+    def make_network():
+        with nengo.Network(seed=seed) as net:
+            a = nengo.Ensemble(50, 1)
+            b = nengo.Ensemble(50, 1)
+            error = nengo.Connection(b, b, modulatory=True)
+            nengo.Connection(nengo.Node(0.5), a)
+            conn = nengo.Connection(a, b, learning_rule_type=nengo.PES(
+                error, learning_rate=1e-4))
+            probe = nengo.Probe(conn, 'decoders')
+        return net, conn, probe
+
+    def simulate():
+        net, conn, probe = make_network()
+        sim = RefSimulator(net, model=nengo.builder.Model(
+            decoder_cache=DecoderCache(cache_dir=str(tmpdir))))
+        sim.run(0.05)
+        return sim, conn, probe
+
+    sim1, _, probe1 = simulate()
+    sim2, conn2, probe2 = simulate()  # -- loads the decoders from the cache
+    assert sim2.model.sig[conn2]['decoders'].value.flags.writeable
+    assert_equal(sim1.data[probe1], sim2.data[probe2])
+
+    # -- learning did not change the cached decoders
+    sim3, _, probe3 = simulate()
+    assert_equal(sim1.data[probe1], sim3.data[probe3])
+
+
+def test_lru_cache():
+    cache = LRUCache(limit=100)
+    cache.put('a', 1, 40)
+    cache.put('b', 2, 40)
+    assert cache.get('a') == 1  # -- 'b' is now the least recently used
+    cache.put('c', 3, 40)
+    assert 'b' not in cache and len(cache) == 2
+    assert cache.size_in_bytes == 80
+    assert cache.get('b') is None
+    assert cache.hits == 1 and cache.misses == 1
+
+    cache.put('d', 4, 101)  # -- too large to be cached
+    assert 'd' not in cache
+    cache.put('a', 5, 100)
+    assert cache.get('a') == 5 and len(cache) == 1
+    assert cache.size_in_bytes == 100
+
+    cache.clear()
+    assert len(cache) == 0 and cache.size_in_bytes == 0
+
+
 def test_decoder_cache_size_includes_overhead(tmpdir):
     cache_dir = str(tmpdir)
     solver_mock = SolverMock()
@@ -130,7 +277,7 @@ def test_decoder_cache_shrinking(tmpdir):
     solver_mock = SolverMock()
     another_solver = SolverMock('another_solver')
 
-    cache = DecoderCache(cache_dir=cache_dir)
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
     cache.wrap_solver(solver_mock)(**get_solver_test_args())
 
     # Ensure differing time stamps (depending on the file system the timestamp
@@ -161,7 +308,7 @@ def test_decoder_cache_shrink_threadsafe(monkeypatch, tmpdir):
     solver_mock = SolverMock()
     another_solver = SolverMock('another_solver')
 
-    cache = DecoderCache(cache_dir=cache_dir)
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
     cache.wrap_solver(solver_mock)(**get_solver_test_args())
     limit = cache.get_size()
 
@@ -189,6 +336,68 @@ def test_decoder_cache_shrink_threadsafe(monkeypatch, tmpdir):
     cache.shrink(limit)
 
 
+def test_decoder_cache_index(monkeypatch, tmpdir):
+    cache_dir = str(tmpdir)
+    solver_mock = SolverMock()
+    another_solver = SolverMock('another_solver')
+
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    cache.wrap_solver(another_solver)(**get_solver_test_args())
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())  # -- disk hit
+    size = sum(byte_align(os.stat(path).st_size, get_fragment_size(cache_dir))
+               for path in cache.get_files())
+    index_file = os.path.join(cache_dir, cache._INDEX)
+
+    # -- the index is used without listing the files ...
+    def fail():
+        raise AssertionError("cache directory scanned")
+    monkeypatch.setattr(cache, 'get_files', fail)
+    assert cache.get_size_in_bytes() == size
+    cache.shrink(size - 1)  # -- removes the least recently used file
+    monkeypatch.undo()
+    assert cache.get_size_in_bytes() < size
+    assert len(cache.get_files()) == 1
+    cache.wrap_solver(solver_mock)(**get_solver_test_args())
+    cache.wrap_solver(another_solver)(**get_solver_test_args())
+    assert SolverMock.n_calls[solver_mock] == 1
+    assert SolverMock.n_calls[another_solver] == 2
+
+    # -- ... and rebuilt if it is missing or corrupt
+    os.remove(index_file)
+    assert cache.get_size_in_bytes() == size
+    with open(index_file, 'w') as f:
+        f.write("garbage\n")
+    assert cache.get_size_in_bytes() == size
+    with open(index_file, 'a') as f:
+        f.write("truncated line")
+    assert cache.get_size_in_bytes() == size
+
+    cache.invalidate()
+    assert cache.get_size_in_bytes() == 0
+
+
+@pytest.mark.skipif(nengo.cache.fcntl is None, reason="no file locks")
+def test_decoder_cache_index_locking(tmpdir):
+    import fcntl
+    cache_dir = str(tmpdir)
+    cache = DecoderCache(cache_dir=cache_dir, memory_size=0)
+    cache.wrap_solver(SolverMock())(**get_solver_test_args())
+
+    # -- another process appending to the index blocks shrinking it
+    lockfile = open(os.path.join(cache_dir, cache._INDEX + '.lock'), 'a')
+    fcntl.flock(lockfile.fileno(), fcntl.LOCK_SH)
+    thread = threading.Thread(target=cache.shrink, args=(0,))
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert len(cache.get_files()) == 1
+
+    lockfile.close()
+    thread.join()
+    assert len(cache.get_files()) == 0
+
+
 def test_decoder_cache_with_E_argument_to_solver(tmpdir):
     cache_dir = str(tmpdir)
     solver_mock = SolverMock()
@@ -257,7 +466,60 @@ def test_cache_works(tmpdir, Simulator, seed):
     assert len(os.listdir(cache_dir)) == 0
     Simulator(model, model=nengo.builder.Model(
         dt=0.001, decoder_cache=DecoderCache(cache_dir=cache_dir)))
-    assert len(os.listdir(cache_dir)) == 2  # legacy.txt and *.nco
+    # -- legacy.txt, index and *.nco (and index.lock, where supported)
+    assert len(set(os.listdir(cache_dir)) - set(['index.lock'])) == 3
+
+
+def test_cache_hit_skips_activities(tmpdir, monkeypatch, seed):
+    cache_dir = str(tmpdir)
+
+    def make_network(tau_rc=0.02):
+        with nengo.Network(seed=seed) as net:
+            a = nengo.Ensemble(50, 2, neuron_type=nengo.LIF(tau_rc=tau_rc))
+            b = nengo.Ensemble(30, 1)
+            nengo.Connection(a, b, function=lambda x: x[0] * x[1])
+            nengo.Connection(a, b, transform=[[1, 0]],
+                             solver=nengo.solvers.LstsqL2(weights=True))
+        return net
+
+    def build(net):
+        model = nengo.builder.Model(decoder_cache=DecoderCache(
+            cache_dir=cache_dir, memory_size=0))
+        model.build(net)
+        return model
+
+    model1 = build(make_network())
+    assert len(model1.decoder_cache.get_files()) == 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError("activities were computed")
+    monkeypatch.setattr(nengo.builder.connection, 'build_activities', fail)
+    model2 = build(make_network())
+    monkeypatch.undo()
+    for conn1, conn2 in zip(model1.toplevel.connections,
+                            model2.toplevel.connections):
+        assert_equal(model1.params[conn1].decoders,
+                     model2.params[conn2].decoders)
+
+    # -- other neuron parameters give other activities, and other keys
+    build(make_network(tau_rc=0.03))
+    assert len(model1.decoder_cache.get_files()) == 4
+
+
+def test_cache_key_includes_neuron_attributes(tmpdir, seed):
+    def build(scale):
+        with nengo.Network(seed=seed) as net:
+            a = nengo.Ensemble(
+                50, 1, neuron_type=ScaledRectifiedLinear(scale))
+            conn = nengo.Connection(a, nengo.Ensemble(30, 1))
+        model = nengo.builder.Model(decoder_cache=DecoderCache(
+            cache_dir=str(tmpdir), memory_size=0))
+        model.build(net)
+        return model.params[conn].decoders
+
+    decoders1 = build(1.)
+    decoders2 = build(2.)
+    assert np.allclose(decoders1, 2 * decoders2)
 
 
 def calc_relative_timer_diff(t1, t2):
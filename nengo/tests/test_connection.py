@@ -720,3 +720,74 @@ def test_transform_probe(Simulator):
         nengo.Probe(c_ens, "transform")
         nengo.Probe(c_ens_neurons, "transform")
     assert Simulator(net)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'arena': True, 'optimize': True}])
+def test_sparse_transform(Simulator, seed, rng, kwargs):
+    """Sparse transforms give the same results as the dense ones."""
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    w = rng.rand(20, 30) * (rng.rand(20, 30) < 0.2) * 0.01
+
+    def run(sparse):
+        def matrix(dense):
+            return scipy_sparse.csr_matrix(dense) if sparse else dense
+
+        with nengo.Network(seed=seed) as net:
+            u = nengo.Node(lambda t: [np.sin(6 * t), np.cos(6 * t)])
+            a = nengo.Ensemble(30, 2)
+            b = nengo.Ensemble(20, 3)
+            nengo.Connection(u, a[::-1], transform=matrix([[0, 1], [1, 0]]))
+            nengo.Connection(a[0], b[1:], transform=matrix([[0.5], [0]]))
+            c = nengo.Connection(a.neurons, b.neurons, transform=matrix(w))
+            nengo.Connection(a, b[2], function=lambda x: x[0] * x[1],
+                             solver=nengo.solvers.LstsqDrop(sparse=sparse))
+            p = nengo.Probe(b, synapse=0.01)
+        sim = Simulator(net, **kwargs)
+        sim.run(0.2)
+        return sim, c, p
+
+    dense_sim, _, dense_p = run(False)
+    sparse_sim, c, sparse_p = run(True)
+    assert npext.is_spmatrix(sparse_sim.data[c].transform)
+    assert any(type(op).__name__ == 'SparseDotInc'
+               for op in sparse_sim.model.operators)
+    assert np.allclose(dense_sim.data[dense_p], sparse_sim.data[sparse_p])
+
+
+def test_sparse_transform_shape(nl):
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    with nengo.Network():
+        a = nengo.Ensemble(10, 2, neuron_type=nl())
+        b = nengo.Ensemble(10, 3, neuron_type=nl())
+        with pytest.raises(ValueError):
+            nengo.Connection(a, b, transform=scipy_sparse.eye(2))
+        c = nengo.Connection(a, b[:2], transform=scipy_sparse.eye(2))
+        assert c.transform.format == 'csr'
+
+
+def test_indexed_transform(Simulator):
+    """Sliced connections with elementwise transforms use indexing."""
+    with nengo.Network() as net:
+        u = nengo.Node(output=np.arange(1, 9))
+        a = nengo.Node(size_in=8)
+        b = nengo.Node(size_in=3)
+        nengo.Connection(u[::2], a[4:], synapse=None)
+        c = nengo.Connection(u[[1, 3]], a[[0, -1]], transform=[2, 3],
+                             synapse=None)
+        d = nengo.Connection(u[:3], b[::-1], transform=np.diag([1, -1, 2]),
+                             synapse=None)
+        nengo.Connection(u[[5, 6]], b[[0, 0]], synapse=None)
+        pa = nengo.Probe(a)
+        pb = nengo.Probe(b)
+
+    sim = Simulator(net)
+    sim.run(0.005)
+    assert np.allclose(sim.data[pa][-1], [4, 0, 0, 0, 1, 3, 5, 19])
+    assert np.allclose(sim.data[pb][-1], [19, -2, 1])
+    assert sum(type(op).__name__ == 'IndexedInc'
+               for op in sim.model.operators) == 6
+
+    # -- the built connections only hold the scales
+    assert np.array_equal(sim.data[c].transform, [2, 3])
+    assert np.array_equal(sim.data[d].transform, [1, -1, 2])
+    assert sim.data[d].transform.shape == sim.model.sig[d]['transform'].shape
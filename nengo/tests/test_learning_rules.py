@@ -194,7 +194,7 @@ def test_unsupervised(Simulator, learning_rule_type, seed, rng, plt):
     assert not np.all(sim.data[trans_p][0] == sim.data[trans_p][-1])
 
 
-def learning_net(learning_rule, net, rng):
+def learning_net(learning_rule, net, rng, **rule_args):
     with net:
         u = nengo.Node(output=1.0)
         pre = nengo.Ensemble(10, dimensions=1)
@@ -205,14 +205,16 @@ def learning_net(learning_rule, net, rng):
             nengo.Connection(u, err)
             err_conn = nengo.Connection(err, post, modulatory=True)
             conn = nengo.Connection(pre, post,
-                                    learning_rule_type=learning_rule(err_conn),
+                                    learning_rule_type=learning_rule(
+                                        err_conn, **rule_args),
                                     solver=LstsqL2nz(weights=True))
         else:
             initial_weights = rng.uniform(high=1e-3,
                                           size=(pre.n_neurons, post.n_neurons))
             conn = nengo.Connection(pre.neurons, post.neurons,
                                     transform=initial_weights,
-                                    learning_rule_type=learning_rule())
+                                    learning_rule_type=learning_rule(
+                                        **rule_args))
         activity_p = nengo.Probe(pre.neurons, synapse=0.01)
         trans_p = nengo.Probe(conn, 'transform', synapse=.01, sample_every=.01)
     return net, activity_p, trans_p
@@ -282,6 +284,35 @@ def test_reset(Simulator, learning_rule, plt, seed, rng):
     assert np.all(sim.data[trans_p] == first_trans_p)
 
 
+@pytest.mark.parametrize('learning_rule', [nengo.PES, nengo.BCM, nengo.Oja])
+def test_update_every(Simulator, learning_rule, seed, rng):
+    """Decimated updates change the weights only every few steps, and
+    approximately follow the updates made on every step."""
+    trans_data = []
+    for update_every in (1, 10):
+        m, _, trans_p = learning_net(
+            learning_rule, nengo.Network(seed=seed),
+            np.random.RandomState(seed), update_every=update_every)
+        with m:
+            raw_p = nengo.Probe(trans_p.target, 'transform')
+
+        sim = Simulator(m)
+        sim.run(0.1)
+        trans_data.append(sim.data[raw_p])
+
+    # -- updates are applied on steps 10, 20, ..., which are recorded at
+    #    indices 9, 19, ... of the probe data
+    every, decimated = trans_data
+    changed = np.any(np.diff(decimated, axis=0) != 0,
+                     axis=tuple(range(1, decimated.ndim)))
+    assert np.all(np.flatnonzero(changed) % 10 == 8)
+    assert changed.sum() > 0
+
+    # -- compare the weights right after each decimated update
+    scale = np.abs(every[-1] - every[0]).max()
+    assert np.allclose(every[9::10], decimated[9::10], atol=0.1 * scale)
+
+
 def test_learningruletypeparam():
     """LearningRuleTypeParam must be one or many learning rules."""
     class Test(object):
@@ -327,3 +358,33 @@ def test_learningrule_attr(seed):
         assert set(c3.learning_rule) == set(r3)  # assert same keys
         for key in r3:
             check_rule(c3.learning_rule[key], c3, r3[key])
+
+
+def test_pes_sparse_weights(Simulator, seed, rng):
+    """PES only changes the nonzero weights of sparse connections."""
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+
+    n = 30
+    weights = rng.uniform(-0.01, 0.01, size=(n, n)) * (rng.rand(n, n) < 0.2)
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(WhiteNoise(0.1, high=10).f(rng=rng))
+        a = nengo.Ensemble(n, 1)
+        b = nengo.Ensemble(n, 1)
+        nengo.Connection(u, a)
+        error = nengo.Connection(u, b, modulatory=True)
+        conn = nengo.Connection(
+            a.neurons, b.neurons, transform=scipy_sparse.csr_matrix(weights),
+            learning_rule_type=PES(error, learning_rate=1e-3))
+        p = nengo.Probe(conn, 'transform', synapse=None)
+
+    sim = Simulator(net)
+    sim.run(0.1)
+
+    transform = sim.data[conn].transform
+    assert sim.data[p].shape == (100, transform.nnz)
+    assert not np.allclose(sim.data[p][-1], transform.data)
+
+    learned = scipy_sparse.csr_matrix(
+        (sim.data[p][-1], transform.indices, transform.indptr),
+        shape=(n, n)).toarray()
+    assert np.all(learned[weights == 0] == 0)
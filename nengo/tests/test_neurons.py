@@ -2,6 +2,7 @@ import numpy as np
 import pytest
 
 import nengo
+from nengo.builder.neurons import neuron_kernels
 from nengo.neurons import NeuronTypeParam
 from nengo.processes import WhiteNoise
 from nengo.solvers import LstsqL2nz
@@ -36,6 +37,40 @@ def test_lif_builtin(rng):
     assert np.allclose(sim_rates, math_rates, atol=1, rtol=0.02)
 
 
+@pytest.mark.parametrize('neuron_type', [
+    nengo.LIF(), nengo.LIF(min_voltage=-1, tau_ref=0.001),
+    nengo.AdaptiveLIF(inc_n=0.1)])
+def test_neuron_kernels(neuron_type, rng):
+    """Test that the neuron kernels give the same results as step_math."""
+    dt = 1e-3
+    n_states = 3 if isinstance(neuron_type, nengo.AdaptiveLIF) else 2
+    J = np.zeros(20)
+    ref = [np.zeros(20) for _ in range(n_states + 1)]
+    fast = [np.zeros(20) for _ in range(n_states + 1)]
+    step = neuron_kernels[type(neuron_type)](neuron_type, dt, J, *fast)
+
+    for _ in range(200):
+        J[...] = rng.uniform(-5, 30, size=J.shape)
+        neuron_type.step_math(dt, J, *ref)
+        step()
+        for a, b in zip(ref, fast):
+            assert np.array_equal(a, b)
+    assert np.any(ref[0] > 0)
+
+
+def test_lif_kernel_simulation(Simulator, seed):
+    """Test that LIF ensembles using the step kernel can be simulated."""
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(0.5)
+        a = nengo.Ensemble(50, 1, neuron_type=nengo.LIF())
+        nengo.Connection(u, a)
+        p = nengo.Probe(a, synapse=0.03)
+
+    sim = Simulator(net)
+    sim.run(0.5)
+    assert np.allclose(sim.data[p][sim.trange() > 0.2], 0.5, atol=0.1)
+
+
 def test_lif(Simulator, plt, rng, logger):
     """Test that the dynamic model approximately matches the rates"""
     dt = 0.001
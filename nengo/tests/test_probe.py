@@ -1,4 +1,7 @@
+import os
+
 import numpy as np
+import pytest
 
 import nengo
 from nengo.utils.compat import range
@@ -197,3 +200,70 @@ def test_solver_defaults(Simulator):
     assert d.solver is solver2
     assert e.solver is solver1
     assert f.solver is solver3
+
+
+def test_disk_storage(RefSimulator, tmpdir):
+    with nengo.Network() as net:
+        u = nengo.Node(output=lambda t: [np.sin(t), t])
+        p_memory = nengo.Probe(u)
+        p_disk = nengo.Probe(u, storage='disk')
+        p_sampled = nengo.Probe(u, sample_every=0.003, storage='disk')
+
+    rc_path = nengo.rc.get('probes', 'path')
+    nengo.rc.set('probes', 'path', str(tmpdir))
+    try:
+        sim = RefSimulator(net)
+        sim.run(0.01)
+    finally:
+        nengo.rc.set('probes', 'path', rc_path)
+
+    assert isinstance(sim.data[p_disk], np.memmap)
+    assert not isinstance(sim.data[p_memory], np.memmap)
+    assert np.allclose(sim.data[p_disk], sim.data[p_memory])
+    assert np.allclose(sim.data[p_sampled], sim.data[p_memory][2::3])
+
+    # data are flushed at the end of each run, and can be loaded from disk
+    filename = sim._probe_outputs[p_disk].filename
+    assert filename.startswith(str(tmpdir))
+    sim.run(0.02)
+    assert np.allclose(np.load(filename), sim.data[p_memory])
+    assert np.load(filename, mmap_mode='r').shape == (30, 2)
+
+    # the files are reused by reset, and deleted by close; data returned
+    # before a reset stay valid, since the old file is not truncated
+    files = os.listdir(sim.probe_dir)
+    old_data = sim.data[p_disk]
+    expected = np.array(old_data)
+    sim.reset()
+    assert np.array_equal(old_data, expected)
+    sim.run(0.005)
+    assert os.listdir(sim.probe_dir) == files
+    assert sim._probe_outputs[p_disk].filename == filename
+    assert np.load(filename).shape == (5, 2)
+    sim.close()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_disk_storage_rc(RefSimulator, tmpdir):
+    with nengo.Network() as net:
+        u = nengo.Node(output=np.sin)
+        p_default = nengo.Probe(u)
+        p_memory = nengo.Probe(u, storage='memory')
+
+    rc_storage = nengo.rc.get('probes', 'storage')
+    rc_path = nengo.rc.get('probes', 'path')
+    nengo.rc.set('probes', 'storage', 'disk')
+    nengo.rc.set('probes', 'path', str(tmpdir))
+    try:
+        sim = RefSimulator(net)
+    finally:
+        nengo.rc.set('probes', 'storage', rc_storage)
+        nengo.rc.set('probes', 'path', rc_path)
+    sim.run(0.01)
+
+    assert isinstance(sim.data[p_default], np.memmap)
+    assert not isinstance(sim.data[p_memory], np.memmap)
+    assert np.allclose(sim.data[p_default], sim.data[p_memory])
+
+    with pytest.raises(ValueError):
+        nengo.Probe(u, storage='cloud', add_to_container=False)
@@ -1,10 +1,16 @@
+import json
+
 import numpy as np
+import pytest
 
 import nengo
 import nengo.simulator
 from nengo.builder import Model
 from nengo.builder.node import build_pyfunc
-from nengo.builder.operator import Copy, Reset, DotInc, SimNoise
+from nengo.builder.operator import (
+    Copy, DotInc, ElementwiseInc, Reset, SimNoise)
+from nengo.builder.optimizer import (
+    MergedOperator, MergedSimNeurons, MergedSimSynapse)
 from nengo.builder.signal import Signal
 from nengo.utils.compat import range
 
@@ -108,6 +114,46 @@ def test_probedict():
     assert np.all(probedict.get("list") == np.asarray(raw.get("list")))
 
 
+def test_probebuffer():
+    """Tests simulator.ProbeBuffer's growth and views."""
+    buf = nengo.simulator.ProbeBuffer((2,))
+    assert buf.data.shape == (0, 2)
+
+    buf.reserve(3)
+    assert buf.capacity == 3
+    for i in range(5):
+        buf.append([i, -i])
+    assert len(buf) == 5 and buf.capacity >= 5
+    assert np.all(buf.data == [[i, -i] for i in range(5)])
+    with pytest.raises((ValueError, RuntimeError)):
+        buf.data[0] = 1
+
+    capacity = buf.capacity
+    buf.clear()
+    assert buf.data.shape == (0, 2) and buf.capacity == capacity
+
+
+def test_probe_data_no_copy(RefSimulator):
+    with nengo.Network() as net:
+        u = nengo.Node(output=np.sin)
+        p = nengo.Probe(u)
+        p_sampled = nengo.Probe(u, sample_every=0.003)
+
+    sim = RefSimulator(net)
+    sim.run(0.01)
+    assert np.may_share_memory(sim.data[p], sim._probe_outputs[p]._array)
+    assert not sim.data[p].flags.writeable
+    assert np.allclose(sim.data[p][:, 0], np.sin(sim.trange()))
+    assert np.allclose(sim.data[p_sampled][:, 0],
+                       np.sin(sim.trange(0.003)))
+
+    # stepping past the reserved space grows the buffers
+    for _ in range(20):
+        sim.step()
+    assert len(sim.data[p]) == 30
+    assert np.allclose(sim.data[p][:, 0], np.sin(sim.trange()))
+
+
 def test_noise(RefSimulator, seed):
     """Make sure that we can generate noise properly."""
 
@@ -132,3 +178,333 @@ def test_noise(RefSimulator, seed):
     z = 1./np.sqrt(2 * np.pi * std**2) * np.exp(-0.5 * (x - mean)**2 / std**2)
     y = h / float(h.sum()) / dx
     assert np.allclose(y, z, atol=0.02)
+
+
+def test_optimize(RefSimulator, seed):
+    """Merging operators does not change the simulation results."""
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(output=np.sin)
+        ensembles = [nengo.Ensemble(20, 1) for _ in range(4)]
+        for pre, post in zip(ensembles[:-1], ensembles[1:]):
+            nengo.Connection(pre, post)
+        for ens in ensembles:
+            nengo.Connection(u, ens)
+        probes = [nengo.Probe(ens, synapse=0.01) for ens in ensembles]
+
+    sim = RefSimulator(net)
+    sim.run(0.1)
+    opt_sim = RefSimulator(net, optimize=True)
+    opt_sim.run(0.1)
+    arena_sim = RefSimulator(net, optimize=True, arena=True)
+    arena_sim.run(0.1)
+
+    assert len(opt_sim._step_order) < len(sim._step_order)
+    assert any(isinstance(op, MergedOperator) for op in opt_sim._step_order)
+    for p in probes:
+        assert np.array_equal(sim.data[p], opt_sim.data[p])
+        assert np.array_equal(sim.data[p], arena_sim.data[p])
+
+    # all merged neuron signals are adjacent in memory, even without arena
+    for s in (opt_sim, arena_sim):
+        neuron_ops = [op for op in s._step_order
+                      if isinstance(op, MergedSimNeurons)]
+        assert len(neuron_ops) == 1
+        assert neuron_ops[0].span(s.signals, 'J') is not None
+        assert neuron_ops[0].span(s.signals, 'output') is not None
+        assert neuron_ops[0].make_merged_step(s.signals, s.dt, s.rng)
+
+
+@pytest.mark.parametrize('synapse', [
+    nengo.Lowpass(0.005), nengo.Alpha(0.005)])
+def test_optimize_synapses(RefSimulator, seed, synapse):
+    """Synapses with the same filter are run as one operator."""
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(output=lambda t: [np.sin(8 * t), np.cos(8 * t)])
+        nodes = [nengo.Node(size_in=2) for _ in range(4)]
+        for node in nodes:
+            nengo.Connection(u, node, synapse=synapse)
+        probes = [nengo.Probe(node) for node in nodes]
+
+    sim = RefSimulator(net)
+    sim.run(0.05)
+    opt_sim = RefSimulator(net, optimize=True)
+    opt_sim.run(0.05)
+
+    for p in probes:
+        assert np.allclose(sim.data[p], opt_sim.data[p])
+
+    synapse_ops = [op for op in opt_sim._step_order
+                   if isinstance(op, MergedSimSynapse)]
+    assert len(synapse_ops) == 1
+    assert len(synapse_ops[0].ops) == len(nodes)
+    assert synapse_ops[0].make_merged_step(
+        opt_sim.signals, opt_sim.dt, opt_sim.rng) is not None
+
+
+def test_optimize_contiguous(RefSimulator):
+    """Operators on adjacent views of one signal are run as one."""
+    x = Signal(np.arange(6.), name="x")
+    y = Signal(np.zeros(6), name="y")
+    xs = [x[i:i+2] for i in (0, 2, 4)]
+    ys = [y[i:i+2] for i in (0, 2, 4)]
+
+    m = Model(dt=0.001)
+    m.operators += [Reset(yi) for yi in ys]
+    m.operators += [ElementwiseInc(Signal(2.0), xi, yi)
+                    for xi, yi in zip(xs, ys)]
+
+    sim = RefSimulator(None, model=m, optimize=True)
+    assert len(sim._step_order) == 2
+    sim.step()
+    assert np.all(sim.signals[y] == 2 * np.arange(6))
+    sim.step()
+    assert np.all(sim.signals[y] == 2 * np.arange(6))
+
+
+def test_batch_simulator(RefSimulator, seed):
+    """Each trial of a batch matches an independent simulation."""
+    inputs = [np.sin]
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(output=lambda t: inputs[0](t))
+        c = nengo.Node(output=[0.3])
+        a = nengo.Ensemble(30, 1, noise=nengo.processes.StochasticProcess(
+            nengo.dists.Gaussian(0, 0.5)))
+        b = nengo.Ensemble(30, 2, neuron_type=nengo.LIFRate())
+        nengo.Connection(u, a)
+        nengo.Connection(a, b[0])
+        nengo.Connection(c, b[1])
+        probes = [nengo.Probe(a, synapse=0.01),
+                  nengo.Probe(b, synapse=0.01),
+                  nengo.Probe(a.neurons)]
+
+    trial_inputs = [lambda t: np.sin(8 * t), lambda t: -np.sin(8 * t), 0.5]
+    constants = [0.3, -0.2, 0.1]
+    batch_sim = nengo.simulator.BatchSimulator(
+        net, n_trials=3, seed=seed,
+        node_inputs={u: trial_inputs, c: constants})
+    batch_sim.run(0.1)
+    for p in probes:
+        assert batch_sim.data[p].shape[:2] == (3, 100)
+
+    trial_inputs[2] = lambda t: 0.5
+    for i in range(3):
+        inputs[0] = trial_inputs[i]
+        c.output = [constants[i]]
+        sim = RefSimulator(net, seed=seed + i)
+        sim.run(0.1)
+        for p in probes:
+            assert np.allclose(sim.data[p], batch_sim.data[p][i])
+
+
+def test_batch_simulator_errors(seed):
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(output=np.sin)
+        c = nengo.Node(output=[0.3])
+        passthrough = nengo.Node(size_in=1)
+        nengo.Connection(u, passthrough)
+
+    BatchSimulator = nengo.simulator.BatchSimulator
+    with pytest.raises(ValueError):
+        BatchSimulator(net, n_trials=2, seed=[1, 2, 3])
+    with pytest.raises(ValueError):
+        BatchSimulator(net, n_trials=2, node_inputs={u: [np.sin]})
+    with pytest.raises(ValueError):
+        BatchSimulator(net, n_trials=2, node_inputs={u: [0.1, [0.2, 0.3]]})
+    with pytest.raises(ValueError):
+        BatchSimulator(net, n_trials=2, node_inputs={c: [0.1, np.sin]})
+    with pytest.raises(ValueError):
+        BatchSimulator(net, n_trials=2, node_inputs={passthrough: [0, 1]})
+
+
+def test_parallel(RefSimulator, seed):
+    """Running operators on a thread pool gives the same results."""
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(output=np.sin)
+        ensembles = [nengo.Ensemble(50, 1) for _ in range(4)]
+        for ens in ensembles:
+            nengo.Connection(u, ens)
+        for pre, post in zip(ensembles[:-1], ensembles[1:]):
+            nengo.Connection(pre.neurons, post.neurons, transform=np.full(
+                (post.n_neurons, pre.n_neurons), 1e-3))
+        nengo.Connection(ensembles[0], ensembles[-1], synapse=0.01)
+        probes = [nengo.Probe(ens, synapse=0.01) for ens in ensembles]
+
+    sim = RefSimulator(net)
+    sim.run(0.1)
+    for optimize in (False, True):
+        par_sim = RefSimulator(
+            net, optimize=optimize, n_workers=3, parallel_threshold=100)
+        try:
+            par_sim.run(0.1)
+        finally:
+            par_sim.close()
+
+        assert any(len(tasks) > 1 for _, tasks in par_sim._scheduler.levels)
+        for p in probes:
+            assert np.allclose(sim.data[p], par_sim.data[p])
+
+
+def test_snapshot(RefSimulator, seed, tmpdir):
+    with nengo.Network(seed=seed) as net:
+        u = nengo.Node(nengo.processes.WhiteNoise(1.0, high=10).f())
+        a = nengo.Ensemble(30, 1, noise=nengo.processes.StochasticProcess(
+            nengo.dists.Gaussian(0, 0.1)))
+        b = nengo.Ensemble(30, 1)
+        nengo.Connection(u, a, synapse=nengo.Alpha(0.01))
+        nengo.Connection(a, b, synapse=nengo.LinearFilter(
+            [1], [0.001, 0.05, 1]))
+        p = nengo.Probe(b, synapse=0.02)
+
+    sim = RefSimulator(net, seed=seed)
+    sim.run(0.05)
+    snapshot = sim.snapshot()
+    sim.run(0.05)
+    data = np.array(sim.data[p])
+
+    # restoring in memory, and branching off repeatedly
+    for _ in range(2):
+        sim.restore(snapshot)
+        assert sim.n_steps == 50 and len(sim.data[p]) == 50
+        assert np.allclose(sim.time, 0.05)
+        sim.run(0.05)
+        assert np.array_equal(sim.data[p], data)
+
+    # probe data has to be in the snapshot to restore in a new simulator
+    sim2 = RefSimulator(net, seed=seed + 1)
+    with pytest.raises(ValueError):
+        sim2.restore(snapshot)
+
+    sim.restore(snapshot)
+    filename = str(tmpdir.join("snapshot.npz"))
+    sim.snapshot(include_probes=True).save(filename)
+    sim2.restore(filename)
+    sim2.run(0.05)
+    assert np.array_equal(sim2.data[p], data)
+
+    # snapshots only fit simulators of the same model
+    with nengo.Network(seed=seed) as other:
+        nengo.Ensemble(30, 1)
+    with pytest.raises(ValueError):
+        RefSimulator(other).restore(filename)
+
+
+def test_snapshot_batch(seed):
+    with nengo.Network(seed=seed) as net:
+        a = nengo.Ensemble(30, 1, noise=nengo.processes.StochasticProcess(
+            nengo.dists.Gaussian(0, 0.1)))
+        p = nengo.Probe(a, synapse=nengo.Alpha(0.01))
+
+    sim = nengo.simulator.BatchSimulator(net, n_trials=3, seed=seed)
+    sim.run(0.02)
+    snapshot = sim.snapshot()
+    sim.run(0.02)
+    data = np.array(sim.data[p])
+    sim.restore(snapshot)
+    sim.run(0.02)
+    assert np.array_equal(sim.data[p], data)
+
+
+def test_profile(RefSimulator, seed, tmpdir):
+    with nengo.Network(seed=seed) as net:
+        stim = nengo.Node(np.sin, label='stim')
+        a = nengo.Ensemble(30, 1, label='a')
+        b = nengo.Ensemble(30, 1, label='b')
+        nengo.Connection(stim, a)
+        nengo.Connection(a, b)
+        p = nengo.Probe(b, synapse=0.01)
+
+    sim = RefSimulator(net)
+    assert sim.profiler is None
+
+    sim = RefSimulator(net, profile=True)
+    sim.run_steps(10)
+    profiler = sim.profiler
+    assert len(profiler.operators) == len(sim._step_order)
+    assert all(calls == 10 for calls in profiler.calls)
+
+    by_class = profiler.stats(by='class')
+    assert sum(n_ops for _, n_ops, _, _ in by_class) == len(sim._step_order)
+    assert np.allclose(sum(time for _, _, _, time in by_class),
+                       profiler.total_time)
+    assert [row[3] for row in by_class] == sorted(
+        [row[3] for row in by_class], reverse=True)
+    assert 'SimNeurons' in [name for name, _, _, _ in by_class]
+
+    objects = [name for name, _, _, _ in profiler.stats(by='object')]
+    assert str(a) in objects and str(stim) in objects
+    assert "(none)" not in objects
+    assert str(b) in profiler.table(by='object')
+    with pytest.raises(ValueError):
+        profiler.stats(by='color')
+
+    filename = str(tmpdir.join('profile.json'))
+    profiler.dump(filename)
+    with open(filename) as f:
+        records = json.load(f)
+    assert len(records) == len(sim._step_order)
+    assert set(records[0]) == set(
+        ['operator', 'class', 'tag', 'object', 'calls', 'time'])
+
+    profiler.reset()
+    assert profiler.total_time == 0
+
+    sim2 = RefSimulator(net)
+    sim2.run_steps(10)
+    assert np.array_equal(sim.data[p], sim2.data[p])
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'optimize': True, 'arena': True}, {'profile': True}])
+def test_compiled(RefSimulator, seed, kwargs):
+    with nengo.Network(seed=seed) as net:
+        stim = nengo.Node(np.sin)
+        a = nengo.Ensemble(30, 1)
+        b = nengo.Ensemble(30, 1, neuron_type=nengo.AdaptiveLIF())
+        nengo.Connection(stim, a)
+        nengo.Connection(a, b, function=np.square)
+        probes = [nengo.Probe(b, synapse=0.01),
+                  nengo.Probe(a.neurons, sample_every=0.003)]
+
+    sim = RefSimulator(net, **kwargs)
+    sim.run_steps(50)
+    compiled = RefSimulator(net, compiled=True, **kwargs)
+    assert 'def plan' in compiled._plan.source
+    compiled.run_steps(20)
+    compiled.run_steps(30)
+    assert compiled.n_steps == 50
+    assert np.allclose(compiled.time, sim.time)
+    for p in probes:
+        assert np.allclose(compiled.data[p], sim.data[p])
+
+    compiled.reset()
+    compiled.run_steps(50)
+    for p in probes:
+        assert np.allclose(compiled.data[p], sim.data[p])
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'optimize': True, 'arena': True}])
+def test_float32(RefSimulator, seed, kwargs):
+    with nengo.Network(seed=seed) as net:
+        stim = nengo.Node(lambda t: [np.sin(8 * t), np.cos(8 * t)])
+        a = nengo.Ensemble(50, 2)
+        b = nengo.Ensemble(50, 1)
+        nengo.Connection(stim, a)
+        conn = nengo.Connection(a, b, function=lambda x: x[0] * x[1])
+        probe = nengo.Probe(b, synapse=0.01)
+
+    sim64 = RefSimulator(net, **kwargs)
+    sim64.run(0.2)
+    sim32 = RefSimulator(net, dtype=np.float32, **kwargs)
+    sim32.run(0.2)
+
+    assert sim32.model.dtype == np.float32
+    assert sim32.data[probe].dtype == np.float32
+    assert sim32.data[conn].decoders.dtype == np.float64
+    assert all(sim32.signals[sig].dtype == np.float32
+               for sig in sim32.signals if sig != '__time__')
+    assert np.allclose(sim32.data[probe], sim64.data[probe], atol=1e-4)
+
+    with pytest.raises(ValueError):
+        RefSimulator(None, model=sim32.model, dtype=np.float64)
+    with pytest.raises(ValueError):
+        Model(dtype=np.int32)
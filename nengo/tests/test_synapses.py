@@ -5,6 +5,7 @@ import nengo
 from nengo.processes import WhiteNoise
 from nengo.synapses import (
     Alpha, filt, filtfilt, LinearFilter, Lowpass, SynapseParam)
+from nengo.utils.filter_design import cont2discrete
 from nengo.utils.testing import allclose
 
 
@@ -78,6 +79,31 @@ def test_general(Simulator, plt, seed):
     assert allclose(t[:-1], y[:-1], yhat[1:], plt=plt)
 
 
+@pytest.mark.parametrize('synapse', [
+    Alpha(0.01), LinearFilter([1234567.90123457], [
+        1.0, 87.104197658425107, 3793.5706248589954, 96782.441842694592,
+        1234567.9012345686])])
+def test_general_difference_equation(synapse, rng):
+    """The state-space filter matches the filter's difference equation."""
+    dt = 1e-3
+    num, den, _ = cont2discrete((synapse.num, synapse.den), dt)
+    num = num.flatten()
+    num = num[1:] if num[0] == 0 else num
+    den = den[1:]
+
+    u = rng.normal(size=(300, 3))
+    y = np.zeros_like(u)
+    for k in range(len(u)):
+        for i, b in enumerate(num):
+            if k - i >= 0:
+                y[k] += b * u[k - i]
+        for j, a in enumerate(den):
+            if k - 1 - j >= 0:
+                y[k] -= a * y[k - 1 - j]
+
+    assert np.allclose(filt(u, synapse, dt=dt), y)
+
+
 def test_filt(plt, rng):
     dt = 1e-3
     tend = 3.
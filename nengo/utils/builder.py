@@ -8,6 +8,7 @@ import collections
 import numpy as np
 
 import nengo
+from . import numpy as npext
 
 
 def full_transform(conn, slice_pre=True, slice_post=True, allow_scalars=True):
@@ -25,13 +26,21 @@ def full_transform(conn, slice_pre=True, slice_post=True, allow_scalars=True):
         If true (default), will not make scalars into full transforms when
         not using slicing, since these work fine in the reference builder.
         If false, these scalars will be turned into scaled identity matrices.
+
+    Returns
+    -------
+    ndarray or scipy.sparse.csr_matrix
+        The full transform. If the transform of the connection is sparse,
+        so is the full transform.
     """
     transform = conn.transform
     pre_slice = conn.pre_slice if slice_pre else slice(None)
     post_slice = conn.post_slice if slice_post else slice(None)
 
     if pre_slice == slice(None) and post_slice == slice(None):
-        if transform.ndim == 2:
+        if npext.is_spmatrix(transform):
+            return transform.copy()
+        elif transform.ndim == 2:
             # transform is already full, so return a copy
             return np.array(transform)
         elif transform.size == 1 and allow_scalars:
@@ -42,6 +51,18 @@ def full_transform(conn, slice_pre=True, slice_post=True, allow_scalars=True):
     size_in = (conn.pre_obj.size_out if func_size is None
                else func_size) if slice_pre else conn.size_mid
     size_out = conn.post_obj.size_in if slice_post else conn.size_out
+
+    if npext.is_spmatrix(transform):
+        import scipy.sparse
+        transform = transform.tocoo()
+        new_transform = scipy.sparse.csr_matrix(
+            (transform.data,
+             (np.arange(size_out)[post_slice][transform.row],
+              np.arange(size_in)[pre_slice][transform.col])),
+            shape=(size_out, size_in))
+        new_transform.sum_duplicates()
+        return new_transform
+
     new_transform = np.zeros((size_out, size_in))
 
     if transform.ndim < 2:
@@ -67,6 +88,37 @@ def full_transform(conn, slice_pre=True, slice_post=True, allow_scalars=True):
         raise ValueError("Transforms with > 2 dims not supported")
 
 
+def elementwise_transform(conn):
+    """Return the transform of a connection if it only scales each element.
+
+    This is the case for scalar and vector transforms, and for square
+    diagonal matrices (for which the diagonal is returned). Such transforms
+    can be applied together with the pre and post slices of the connection
+    by indexing, without computing the full transform.
+
+    Parameters
+    ----------
+    conn : Connection
+        The connection whose transform to check.
+
+    Returns
+    -------
+    ndarray or None
+        A scalar or vector of scales, or None if the transform mixes the
+        elements of its input.
+    """
+    transform = conn.transform
+    if npext.is_spmatrix(transform):
+        return None
+    elif transform.ndim < 2:
+        return np.array(transform)
+    elif (transform.shape[0] == transform.shape[1] and
+            np.count_nonzero(transform) == np.count_nonzero(
+                np.diag(transform))):
+        return np.diag(transform).copy()
+    return None
+
+
 def default_n_eval_points(n_neurons, dimensions):
     """A heuristic to determine an appropriate number of evaluation points.
 
@@ -120,7 +172,8 @@ def generate_graphviz(objs, connections):
 
     def label(transform):
         # determine the label for a connection based on its transform
-        transform = np.asarray(transform)
+        if not npext.is_spmatrix(transform):
+            transform = np.asarray(transform)
         if len(transform.shape) == 0:
             return ''
         return '%dx%d' % transform.shape
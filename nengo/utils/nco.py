@@ -21,7 +21,8 @@ The protocol version 0 is as follows:
 * The array data in NPY format.
 
 Files will be written with padding to have both the Python object data and the
-array data an alignment of 16 bytes.
+array data an alignment of 16 bytes. This allows reading the array data with
+a memory map, without copying them into memory (see ``read``).
 
 The Numpy NPY format is documented here:
 https://github.com/numpy/numpy/blob/master/doc/neps/npy-format.rst
@@ -121,13 +122,18 @@ def write(fileobj, metadata, array):
     fileobj.write(header)
 
 
-def read(fileobj):
+def read(fileobj, mmap=False):
     """Reads a Nengo cache object.
 
     Parameters
     ----------
     fileobj : file-like object
         The file object to read from.
+    mmap : bool, optional
+        If True, the array is returned as a read-only ``np.memmap`` of the
+        array data in the file, which are only read from disk when they are
+        accessed. This requires ``fileobj`` to be an actual file. The file
+        object can be closed while the memory map is in use.
 
     Returns
     -------
@@ -146,5 +152,23 @@ def read(fileobj):
             version))
 
     metadata = pickle.load(Subfile(fileobj, pickle_start, pickle_end))
-    array = np.load(Subfile(fileobj, array_start, array_end))
+    subfile = Subfile(fileobj, array_start, array_end)
+    array = memmap_npy(fileobj, subfile) if mmap else np.load(subfile)
     return metadata, array
+
+
+def memmap_npy(fileobj, subfile):
+    """Maps the NPY data in ``subfile``, a ``Subfile`` of ``fileobj``."""
+    npy_version = np.lib.format.read_magic(subfile)
+    if npy_version == (1, 0):
+        header = np.lib.format.read_array_header_1_0(subfile)
+    else:
+        header = np.lib.format.read_array_header_2_0(subfile)
+    shape, fortran_order, dtype = header
+    if dtype.hasobject:
+        raise IOError("Arrays of Python objects cannot be memory-mapped.")
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)  # -- cannot map zero bytes
+    return np.memmap(fileobj, dtype=dtype, mode='r', shape=shape,
+                     order='F' if fortran_order else 'C',
+                     offset=fileobj.tell())
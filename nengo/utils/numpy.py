@@ -3,6 +3,8 @@ Extra functions to extend the capabilities of Numpy.
 """
 from __future__ import absolute_import
 
+import sys
+
 import numpy as np
 
 maxint = np.iinfo(np.int32).max
@@ -12,6 +14,24 @@ def compare(a, b):
     return 0 if a == b else 1 if a > b else -1 if a < b else None
 
 
+def is_spmatrix(obj):
+    """Check whether ``obj`` is a ``scipy.sparse`` matrix.
+
+    SciPy is not imported by this function; if ``scipy.sparse`` has not been
+    imported yet, no sparse matrices can exist.
+    """
+    sparse = sys.modules.get('scipy.sparse', None)
+    return sparse is not None and sparse.issparse(obj)
+
+
+def csr_rows(indptr):
+    """The row index of each stored element of a CSR matrix.
+
+    ``indptr`` is the array of row pointers of the matrix.
+    """
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
 def broadcast_shape(shape, length):
     """Pad a shape with ones following standard Numpy broadcasting."""
     n = len(shape)
@@ -39,6 +59,35 @@ def array(x, dims=None, min_dims=0, readonly=False, **kwargs):
     return y
 
 
+def contiguous_span(arrays):
+    """Return a flat view spanning ``arrays`` if they are adjacent in memory.
+
+    The arrays must be C-contiguous, share the same dtype, and each array
+    must begin exactly where the previous one ends. If these conditions are
+    not met, ``None`` is returned.
+
+    Parameters
+    ----------
+    arrays : list of ndarrays
+        The arrays to span, in memory order.
+    """
+    if len(arrays) == 0:
+        return None
+
+    dtype = arrays[0].dtype
+    address = arrays[0].__array_interface__['data'][0]
+    for a in arrays:
+        if (a.dtype != dtype or not a.flags.c_contiguous
+                or a.__array_interface__['data'][0] != address):
+            return None
+        address += a.nbytes
+
+    size = sum(a.size for a in arrays)
+    first = arrays[0].reshape(-1)
+    return np.lib.stride_tricks.as_strided(
+        first, shape=(size,), strides=(dtype.itemsize,))
+
+
 def expm(A, n_factors=None, normalize=False):
     """Simple matrix exponential to replace Scipy's matrix exponential
 
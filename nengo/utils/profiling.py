@@ -0,0 +1,148 @@
+"""Measuring the time spent in each operator of a simulation."""
+
+from __future__ import absolute_import, division
+
+import collections
+import json
+from timeit import default_timer
+
+from .compat import is_string
+
+
+class OperatorProfiler(object):
+    """Accumulates the wall time and number of calls of operator steps.
+
+    Step functions are wrapped with ``wrap``, which adds a timer around
+    each call. Step functions that are not wrapped are not slowed down.
+
+    Parameters
+    ----------
+    origins : dict, optional
+        Maps operators to the Nengo object whose build function added them
+        (see ``Model.origins``).
+    """
+
+    # Functions returning the key used to aggregate operators in ``stats``
+    keys = {
+        'operator': str,
+        'class': lambda op: type(op).__name__,
+        'tag': lambda op: str(getattr(op, 'tag', None)),
+    }
+
+    def __init__(self, origins=None):
+        self.origins = {} if origins is None else origins
+        self.operators = []
+        self.times = []
+        self.calls = []
+
+    def wrap(self, op, step_fn):
+        """Returns a step function recording the time spent in ``step_fn``.
+        """
+        i = len(self.operators)
+        self.operators.append(op)
+        self.times.append(0.0)
+        self.calls.append(0)
+        times, calls, timer = self.times, self.calls, default_timer
+
+        def step():
+            t0 = timer()
+            step_fn()
+            times[i] += timer() - t0
+            calls[i] += 1
+        return step
+
+    def reset(self):
+        """Set all times and call counts to zero."""
+        self.times[:] = [0.0] * len(self.times)
+        self.calls[:] = [0] * len(self.calls)
+
+    @property
+    def total_time(self):
+        return sum(self.times)
+
+    def origin(self, op):
+        """The string identifying the object that ``op`` was built for."""
+        ops = getattr(op, 'ops', [op])  # -- merged operators
+        origins = set(self.origins.get(o, None) for o in ops)
+        if len(origins) > 1:
+            return "(%d objects)" % len(origins)
+        origin = origins.pop()
+        return "(none)" if origin is None else str(origin)
+
+    def key(self, op, by):
+        return self.origin(op) if by == 'object' else self.keys[by](op)
+
+    def stats(self, by='class', sort='time'):
+        """Aggregate the times and call counts of operators.
+
+        Parameters
+        ----------
+        by : str, optional
+            How to group operators: ``'operator'`` for each operator on
+            its own, ``'class'`` by operator class, ``'tag'`` by operator
+            tag, or ``'object'`` by the Nengo object (e.g., ensemble or
+            connection) that the operators were built for.
+        sort : str, optional
+            Sort by ``'time'`` (descending), ``'calls'`` (descending), or
+            ``'name'`` (ascending).
+
+        Returns
+        -------
+        list of tuple
+            One ``(name, n_operators, calls, time)`` tuple for each group.
+        """
+        if by not in self.keys and by != 'object':
+            raise ValueError("Cannot group operators by '%s'" % by)
+
+        groups = collections.OrderedDict()
+        for op, time, calls in zip(self.operators, self.times, self.calls):
+            name = self.key(op, by)
+            n_ops, total_calls, total_time = groups.get(name, (0, 0, 0.0))
+            groups[name] = (n_ops + 1, total_calls + calls, total_time + time)
+        rows = [(key,) + values for key, values in groups.items()]
+
+        if sort == 'time':
+            rows.sort(key=lambda row: -row[3])
+        elif sort == 'calls':
+            rows.sort(key=lambda row: -row[2])
+        elif sort == 'name':
+            rows.sort(key=lambda row: row[0])
+        else:
+            raise ValueError("Cannot sort by '%s'" % sort)
+        return rows
+
+    def table(self, by='class', sort='time', limit=None):
+        """Returns a table of the times spent in groups of operators.
+
+        Takes the same ``by`` and ``sort`` arguments as ``stats``. If
+        ``limit`` is given, only that many groups are listed.
+        """
+        rows = self.stats(by=by, sort=sort)[:limit]
+        total = self.total_time
+        width = max([len(by)] + [len(row[0]) for row in rows])
+        lines = ["%-*s %6s %10s %10s %13s %6s" % (
+            width, by, 'ops', 'calls', 'time (s)', 'per call (us)', '%')]
+        for name, n_ops, calls, time in rows:
+            lines.append("%-*s %6d %10d %10.4f %13.2f %6.1f" % (
+                width, name, n_ops, calls, time,
+                1e6 * time / calls if calls > 0 else 0.,
+                100. * time / total if total > 0 else 0.))
+        return "\n".join(lines)
+
+    def records(self):
+        """Returns the times and call counts of each operator as dicts."""
+        return [{'operator': str(op),
+                 'class': type(op).__name__,
+                 'tag': getattr(op, 'tag', None),
+                 'object': self.origin(op),
+                 'calls': calls,
+                 'time': time}
+                for op, time, calls in zip(
+                    self.operators, self.times, self.calls)]
+
+    def dump(self, fileobj):
+        """Write ``records`` in JSON format to a file or file name."""
+        if is_string(fileobj):
+            with open(fileobj, 'w') as f:
+                return self.dump(f)
+        json.dump(self.records(), fileobj, indent=1, sort_keys=True)
@@ -1,7 +1,7 @@
 import numpy as np
 
 import nengo
-from nengo.utils.builder import full_transform
+from nengo.utils.builder import elementwise_transform, full_transform
 
 
 def test_full_transform():
@@ -99,3 +99,24 @@ def test_full_transform():
         conn = nengo.Connection(ens3, ens2[[0, 1, 0]])
         assert np.all(full_transform(conn) == np.array([[1, 0, 1],
                                                        [0, 1, 0]]))
+
+
+def test_elementwise_transform():
+    with nengo.Network():
+        a = nengo.Node(output=[0, 0, 0])
+        b = nengo.Node(size_in=4)
+
+        conn = nengo.Connection(a, b[1:], transform=2)
+        assert np.all(elementwise_transform(conn) == np.array(2))
+
+        conn = nengo.Connection(a, b[[3, 0, 1]], transform=[1, 2, 3])
+        assert np.all(elementwise_transform(conn) == np.array([1, 2, 3]))
+
+        conn = nengo.Connection(a, b[:3], transform=np.diag([4, 0, 5]))
+        assert np.all(elementwise_transform(conn) == np.array([4, 0, 5]))
+
+        conn = nengo.Connection(a, b[:3], transform=np.ones((3, 3)))
+        assert elementwise_transform(conn) is None
+
+        conn = nengo.Connection(a, b[:2], transform=np.ones((2, 3)))
+        assert elementwise_transform(conn) is None
@@ -103,3 +103,21 @@ def test_nco_roundtrip(tmpdir):
 
     assert pickle_data == pickle_data2
     assert_equal(array, array2)
+
+
+@pytest.mark.parametrize('order', ['C', 'F'])
+def test_nco_mmap(tmpdir, order):
+    tmpfile = tmpdir.join('test.nco')
+    array = np.asarray(np.arange(12.).reshape(3, 4), order=order)
+
+    with tmpfile.open('wb') as f:
+        nco.write(f, 'info', array)
+
+    with tmpfile.open('rb') as f:
+        info, array2 = nco.read(f, mmap=True)
+
+    assert info == 'info'
+    assert isinstance(array2, np.memmap)
+    assert not array2.flags.writeable
+    assert array2.flags[order + '_CONTIGUOUS']
+    assert_equal(array, array2)
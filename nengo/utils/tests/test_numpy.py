@@ -2,7 +2,7 @@ from __future__ import absolute_import, print_function
 
 import numpy as np
 
-from nengo.utils.numpy import meshgrid_nd
+from nengo.utils.numpy import contiguous_span, meshgrid_nd
 
 
 def test_meshgrid_nd():
@@ -21,3 +21,16 @@ def test_meshgrid_nd():
                   [[23, 42], [23, 42], [23, 42]]])]
     actual = meshgrid_nd(a, b, c)
     assert np.allclose(expected, actual)
+
+
+def test_contiguous_span():
+    base = np.zeros(10)
+    span = contiguous_span([base[:3], base[3:4], base[4:].reshape(2, 3)])
+    assert span.shape == (10,)
+    span[...] = 1
+    assert np.all(base == 1)
+
+    assert contiguous_span([base[:3], base[4:]]) is None
+    assert contiguous_span([base[3:], base[:3]]) is None
+    assert contiguous_span([base[::2]]) is None
+    assert contiguous_span([]) is None